@@ -14,3 +14,19 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'aegis_support.settings')
 
 application = get_asgi_application()
+
+# Build the shared orchestrator, tools and redactor before the first request
+from apps.agents.registry import warm_up
+
+warm_up()
+
+# Resume asynchronous ingest jobs interrupted by the previous server run
+from apps.transactions.jobs import get_ingest_worker
+
+get_ingest_worker()
+
+# Start loading the filter of stored transaction ids in the background (a
+# rebuild from the database takes seconds per million rows)
+from apps.transactions.id_filter import get_known_ids
+
+get_known_ids()
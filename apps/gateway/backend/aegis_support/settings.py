@@ -82,6 +82,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'aegis_support.wsgi.application'
 
+# Triage endpoints are async views; serve with an ASGI server (uvicorn) so
+# they share the worker's event loop instead of one loop per request.
+ASGI_APPLICATION = 'aegis_support.asgi.application'
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -146,7 +150,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 50,
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'apps.core.renderers.FastJSONRenderer',
     ],
 }
 
@@ -216,13 +220,21 @@ LOGGING = {
         'simple': {
             'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         },
+        # 'simple' with PII_PATTERNS redacted from the line and any traceback.
+        # Phone numbers are left out: their 10-digit pattern also matches epoch
+        # timestamps and numeric ids.
+        'redacted': {
+            '()': 'apps.agents.redactor.PIIRedactingFormatter',
+            'fmt': '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            'types': ['pan', 'email', 'aadhar'],
+        },
     },
     'handlers': {
         'file': {
             'level': 'INFO',
             'class': 'logging.FileHandler',
             'filename': 'logs/aegis_support.log',
-            'formatter': 'simple',
+            'formatter': 'redacted',
         },
         'console': {
             'level': 'INFO',
@@ -243,11 +255,99 @@ API_KEY = 'aegis-api-key-2024'
 AGENT_TIMEOUT = 5  # seconds
 TOOL_TIMEOUT = 1   # seconds
 MAX_RETRIES = 2
+RETRY_BACKOFF_BASE = 0.1  # seconds; retries sleep uniform(0, base * 2**retry)
+TRIAGE_BATCH_MAX_ITEMS = 500
+AGENT_DB_POOL_SIZE = 8  # threads (and DB connections) for ORM calls from async tools
 CIRCUIT_BREAKER_THRESHOLD = 3
 CIRCUIT_BREAKER_TIMEOUT = 30  # seconds
 
-# PII Redaction
+# Triage results are memoized per customer, transaction, message and customer
+# data version (bumped by ingest and actions). 0 disables the cache.
+TRIAGE_RESULT_CACHE_TTL = 3600  # seconds
+
+# Agent persistence: executions and tool calls are buffered during a run and
+# written in one transaction. 'end_of_run' writes before the response returns;
+# 'background' hands the records to a flusher thread that batches across runs.
+AGENT_PERSISTENCE_MODE = 'end_of_run'
+AGENT_PERSISTENCE_FLUSH_INTERVAL = 1.0  # seconds
+AGENT_PERSISTENCE_BATCH_SIZE = 100
+AGENT_PERSISTENCE_DURABLE_FAILURES = True  # failed runs are always written before returning
+
+# Execution traces: None stores the full trace in the JSON column; 'zlib' stores
+# a step summary there and the full trace as a compressed blob.
+AGENT_TRACE_COMPRESSION = None
+
+# PII Redaction: default pattern set (type -> regex) and replacement texts.
+# Tenants extend or override them with a RedactionPolicy row (admin), picked
+# up by running workers within PII_POLICY_REFRESH_INTERVAL seconds.
 PII_PATTERNS = {
     'pan': r'\b\d{13,19}\b',
     'email': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
+    'phone': r'\b\d{10}\b',
+    'aadhar': r'\b\d{12}\b',
+}
+PII_REPLACEMENTS = {
+    'pan': '****REDACTED****',
+    'email': '***@***.***',
+    'phone': '***-***-****',
+    'aadhar': '****-****-****',
 }
+PII_POLICY_REFRESH_INTERVAL = 5  # seconds
+PII_POLICY_CACHE_SIZE = 1000  # tenants with a compiled redactor per worker
+
+# Structured payload inspection budget; larger or deeper payloads are denied
+PII_MAX_PAYLOAD_DEPTH = 64
+PII_MAX_PAYLOAD_SIZE = 10 * 1024 * 1024  # one per value plus string lengths
+
+# In-process LRU caches for repeated content (0 disables): scan spans per text,
+# and Decision skeletons per inspected text/payload
+PII_SCAN_CACHE_SIZE = 10000
+INSPECT_DECISION_CACHE_SIZE = 10000
+# Payloads larger than this as JSON (bytes) bypass the Decision cache: they
+# rarely repeat, and the key is a canonical serialization of the payload
+INSPECT_DECISION_CACHE_MAX_PAYLOAD = 64 * 1024
+
+# Server-built Decisions skip Pydantic and are emitted as plain dicts. Turn this
+# on in dev/CI to check every freshly built Decision against the Pydantic model
+# and packages/contracts-schema (needs jsonschema and the packages/ tree).
+DECISION_CONTRACT_VALIDATION = False
+
+# Batch inspection (/api/triage/inspect/batch). Items are scanned in chunks off
+# the event loop; with INSPECT_BATCH_WORKERS > 0, batches of at least
+# INSPECT_BATCH_POOL_MIN_ITEMS are spread over that many worker processes.
+INSPECT_BATCH_MAX_ITEMS = 100000
+INSPECT_BATCH_CHUNK_SIZE = 500
+INSPECT_BATCH_WORKERS = 0
+INSPECT_BATCH_POOL_MIN_ITEMS = 5000
+
+# Transaction ingest (/api/ingest/transactions, manage.py ingest_transactions).
+# Rows are written in batches resolved with one id__in query per entity type,
+# each committed on its own (so locks are held for one batch at most); the
+# response lists the reasons for up to INGEST_MAX_ERRORS invalid rows.
+INGEST_BATCH_SIZE = 2000
+INGEST_MAX_ERRORS = 100
+
+# Bloom filter of stored transaction ids: ids it has never seen skip the
+# existence query at ingest. Saved to INGEST_ID_FILTER_PATH and rebuilt from
+# the database when that copy is missing or was sized differently; about 1.2
+# bytes per id at a 1% false positive rate. A capacity of 0 disables it.
+INGEST_ID_FILTER_CAPACITY = 10_000_000
+INGEST_ID_FILTER_ERROR_RATE = 0.01
+INGEST_ID_FILTER_PATH = BASE_DIR / 'spool' / 'transaction_ids.bloom'
+INGEST_ID_FILTER_REFRESH_INTERVAL = 15  # seconds; picks up ids stored by other processes
+INGEST_ID_FILTER_SAVE_INTERVAL = 300  # seconds; also saved at exit
+# Catch-ups re-read ids stamped this long before the newest one seen, for rows
+# committed after ids stamped later; keep it above the longest batch
+INGEST_ID_FILTER_COMMIT_MARGIN = 60  # seconds
+
+# Asynchronous ingest (?async=1): uploads are spooled here and ingested by a
+# background thread in each server process. A RUNNING job without a heartbeat
+# for INGEST_JOB_STALE_AFTER seconds is taken over and resumed. A job
+# interrupted by an error is retried after INGEST_JOB_RETRY_BACKOFF seconds,
+# doubling each time, and fails after INGEST_JOB_MAX_ATTEMPTS runs in a row
+# that commit no batch.
+INGEST_SPOOL_DIR = BASE_DIR / 'spool' / 'ingest'
+INGEST_JOB_POLL_INTERVAL = 5  # seconds
+INGEST_JOB_STALE_AFTER = 120  # seconds
+INGEST_JOB_MAX_ATTEMPTS = 5
+INGEST_JOB_RETRY_BACKOFF = 30  # seconds
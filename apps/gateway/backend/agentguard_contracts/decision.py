@@ -14,6 +14,7 @@ class Redaction(BaseModel):
     replacement: str
     start: int = Field(ge=0)
     end: int = Field(ge=0)
+    path: Optional[str] = None
 
 class Decision(BaseModel):
     request_id: str
@@ -24,3 +25,37 @@ class Decision(BaseModel):
     allowed_tools: List[str] = Field(default_factory=list)
     requires_approval: bool = False
     audit_id: Optional[str] = None
+
+
+# Fast path for server-built decisions: plain dicts in the wire form of the
+# models above, with unset optional fields omitted (the TS contract marks them
+# optional, not nullable). Callers pass data they built themselves; anything
+# from a client goes through Decision.model_validate.
+def redaction_dict(type: str, replacement: str, start: int, end: int,
+                   original: Optional[str] = None, path: Optional[str] = None) -> dict:
+    redaction = {"type": type}
+    if original is not None:
+        redaction["original"] = original
+    redaction["replacement"] = replacement
+    redaction["start"] = start
+    redaction["end"] = end
+    if path is not None:
+        redaction["path"] = path
+    return redaction
+
+def decision_dict(request_id: str, tenant_id: str, action: DecisionAction,
+                  reasons: List[str] = None, redactions: List[dict] = None,
+                  allowed_tools: List[str] = None, requires_approval: bool = False,
+                  audit_id: Optional[str] = None) -> dict:
+    decision = {
+        "request_id": request_id,
+        "tenant_id": tenant_id,
+        "action": DecisionAction(action).value,
+        "reasons": reasons if reasons is not None else [],
+        "redactions": redactions if redactions is not None else [],
+        "allowed_tools": allowed_tools if allowed_tools is not None else [],
+        "requires_approval": requires_approval,
+    }
+    if audit_id is not None:
+        decision["audit_id"] = audit_id
+    return decision
@@ -0,0 +1,45 @@
+"""
+Contract drift checks for decisions built on the fast path.
+"""
+
+import json
+import os
+from functools import lru_cache
+
+from pydantic import ValidationError
+from .decision import Decision
+
+SCHEMA_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "../../../../packages/contracts-schema/schema")
+)
+
+
+class ContractViolation(ValueError):
+    """A server-built payload does not match the published contract."""
+
+
+@lru_cache(maxsize=None)
+def load_schema(name: str) -> dict:
+    with open(os.path.join(SCHEMA_DIR, f"{name}.schema.json"), "r") as f:
+        return json.load(f)
+
+
+def validate_decision(data: dict) -> None:
+    """
+    Check a decision dict against both the Pydantic model (it must round-trip
+    unchanged, so no coercion or unknown keys) and the generated JSON schema.
+    Needs jsonschema and the packages/ tree, so it is meant for dev and CI.
+    """
+    from jsonschema import ValidationError as SchemaValidationError, validate
+
+    try:
+        model = Decision.model_validate(data)
+    except ValidationError as e:
+        raise ContractViolation(f"Decision fails the Pydantic contract: {e}")
+    if model.model_dump(exclude_none=True) != data:
+        raise ContractViolation("Decision does not round-trip through the Pydantic contract")
+
+    try:
+        validate(instance=data, schema=load_schema("Decision"))
+    except SchemaValidationError as e:
+        raise ContractViolation(f"Decision fails Decision.schema.json: {e.message}")
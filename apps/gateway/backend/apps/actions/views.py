@@ -10,6 +10,7 @@ from .models import Action, Dispute
 from apps.customers.models import Card
 from apps.transactions.models import Transaction
 from apps.observability.models import AuditLog
+from apps.agents.result_cache import bump_data_version
 from apps.core.authentication import APIKeyAuthentication
 
 logger = logging.getLogger(__name__)
@@ -110,6 +111,7 @@ def freeze_card(request):
         
         # Update related transactions status
         Transaction.objects.filter(card=card, status='COMPLETED').update(status='FROZEN')
+        bump_data_version([card.customer_id])
         
         result = {
             'status': 'FROZEN',
@@ -193,6 +195,7 @@ def open_dispute(request):
         # Update transaction status
         transaction.status = 'DISPUTED'
         transaction.save()
+        bump_data_version([transaction.customer_id])
         
         # Create dispute
         case_id = f"case_{uuid.uuid4().hex[:8]}"
@@ -252,6 +255,7 @@ def contact_customer(request):
             created_by=getattr(request.user, 'role', 'agent'),
             completed_at=datetime.now()
         )
+        bump_data_version([customer_id])
         
         result = {
             'status': 'COMPLETED',
@@ -314,6 +318,7 @@ def unfreeze_card(request):
             created_by=getattr(request.user, 'role', 'agent'),
             completed_at=datetime.now()
         )
+        bump_data_version([card.customer_id])
         
         result = {
             'status': 'ACTIVE',
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import AgentExecution, ToolCall, AgentFallback
+from .models import AgentExecution, ToolCall, AgentFallback, RedactionPolicy
 
 @admin.register(AgentExecution)
 class AgentExecutionAdmin(admin.ModelAdmin):
@@ -21,3 +21,9 @@ class AgentFallbackAdmin(admin.ModelAdmin):
     list_filter = ['tool_name', 'created_at']
     search_fields = ['id', 'execution__id', 'tool_name']
     readonly_fields = ['id', 'created_at']
+
+@admin.register(RedactionPolicy)
+class RedactionPolicyAdmin(admin.ModelAdmin):
+    list_display = ['tenant_id', 'version', 'updated_at']
+    search_fields = ['tenant_id']
+    readonly_fields = ['version', 'updated_at']
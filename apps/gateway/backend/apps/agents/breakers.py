@@ -0,0 +1,122 @@
+"""
+Shared Circuit Breakers for Agent Tools
+"""
+
+import logging
+import time
+from typing import Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a tool whose breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker whose state lives in the Django cache (Redis), so every
+    worker sees the same failure count and open/closed state for a tool.
+
+    closed    -> calls go through; consecutive failures are counted
+    open      -> calls are rejected for ``CIRCUIT_BREAKER_TIMEOUT`` seconds
+    half-open -> after the timeout one worker wins the probe slot; success
+                 closes the breaker, failure re-opens it
+
+    The methods never raise: while the cache is unreachable the breaker counts
+    as closed. Coroutines use the ``a``-prefixed variants, which do the cache
+    round-trips on a worker thread instead of the event loop.
+    """
+
+    def __init__(self, tool_name: str):
+        self.tool_name = tool_name
+        self.failures_key = f"circuit_breaker:{tool_name}:failures"
+        self.opened_at_key = f"circuit_breaker:{tool_name}:opened_at"
+        self.probe_key = f"circuit_breaker:{tool_name}:probe"
+
+    def allow_request(self) -> Tuple[bool, bool]:
+        """
+        Check whether a call may proceed. Returns ``(allowed, recorded)``,
+        where ``recorded`` says whether failures or an open state are stored,
+        i.e. whether a success has anything to clear.
+        """
+        try:
+            state = cache.get_many([self.failures_key, self.opened_at_key])
+            opened_at = state.get(self.opened_at_key)
+            if opened_at is None:
+                return True, bool(state)
+
+            if time.time() - opened_at < settings.CIRCUIT_BREAKER_TIMEOUT:
+                return False, True
+
+            # Half-open: cache.add is atomic, so only one caller gets to probe
+            return cache.add(self.probe_key, 1, timeout=settings.AGENT_TIMEOUT), True
+        except Exception as e:
+            logger.warning(f"Circuit breaker state unavailable for {self.tool_name}, treating it as closed: {str(e)}")
+            return True, False
+
+    def record_success(self, recorded: bool = True):
+        """
+        Close the breaker; a no-op unless ``allow_request`` saw recorded state.
+        """
+        if not recorded:
+            return
+        try:
+            cache.delete_many([self.failures_key, self.opened_at_key, self.probe_key])
+        except Exception as e:
+            logger.warning(f"Cannot close circuit breaker for {self.tool_name}: {str(e)}")
+
+    def record_failure(self):
+        """
+        Count a failure and open the breaker at the threshold, or re-open it
+        straight away when the half-open probe failed.
+        """
+        try:
+            if cache.add(self.failures_key, 1, timeout=settings.CIRCUIT_BREAKER_TIMEOUT * 2):
+                failures = 1
+            else:
+                try:
+                    failures = cache.incr(self.failures_key)
+                except ValueError:
+                    # Key expired between add and incr
+                    cache.set(self.failures_key, 1, timeout=settings.CIRCUIT_BREAKER_TIMEOUT * 2)
+                    failures = 1
+
+            probing = cache.get(self.probe_key) is not None
+            if probing or failures >= settings.CIRCUIT_BREAKER_THRESHOLD:
+                logger.warning(f"Circuit breaker opened for {self.tool_name} after {failures} failures")
+                cache.set(self.opened_at_key, time.time(), timeout=settings.CIRCUIT_BREAKER_TIMEOUT * 2)
+                cache.delete(self.probe_key)
+        except Exception as e:
+            logger.warning(f"Cannot record failure for circuit breaker {self.tool_name}: {str(e)}")
+
+    # Not thread-sensitive: breaker calls from concurrent steps must not queue
+    # behind each other on the single sync_to_async thread
+    async def aallow_request(self) -> Tuple[bool, bool]:
+        return await sync_to_async(self.allow_request, thread_sensitive=False)()
+
+    async def arecord_success(self, recorded: bool = True):
+        if recorded:
+            await sync_to_async(self.record_success, thread_sensitive=False)(recorded)
+
+    async def arecord_failure(self):
+        await sync_to_async(self.record_failure, thread_sensitive=False)()
+
+
+class CircuitBreakerRegistry:
+    """
+    One breaker per tool name. The registry only caches the breaker objects;
+    their state is shared through the cache.
+    """
+
+    def __init__(self):
+        self.breakers = {}
+
+    def get(self, tool_name: str) -> CircuitBreaker:
+        breaker = self.breakers.get(tool_name)
+        if breaker is None:
+            breaker = self.breakers.setdefault(tool_name, CircuitBreaker(tool_name))
+        return breaker
@@ -0,0 +1,50 @@
+"""
+Database Executor for Agent Tools
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Process-wide pool for ORM work from coroutines, sized by
+    ``settings.AGENT_DB_POOL_SIZE``.
+
+    ``sync_to_async`` (and Django 4.2's ``aget``/``acount``, which wrap it) runs
+    everything on one thread-sensitive thread, so concurrent steps would still
+    queue for the database. Each pool thread holds its own Django connection,
+    which caps the connections this process opens at the pool size.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.AGENT_DB_POOL_SIZE,
+                    thread_name_prefix='agent-db'
+                )
+    return _executor
+
+
+def _call(func: Callable, args, kwargs) -> Any:
+    # Honour CONN_MAX_AGE and drop broken connections, as Django does per request
+    close_old_connections()
+    return func(*args, **kwargs)
+
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a synchronous ORM callable on the database pool and await its result.
+    Querysets must be evaluated inside ``func`` (e.g. ``run_db(list, qs)``).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(_call, func, args, kwargs))
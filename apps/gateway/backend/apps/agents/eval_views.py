@@ -6,7 +6,7 @@ import json
 import os
 import logging
 from pathlib import Path
-from .orchestrator import AgentOrchestrator
+from .registry import get_orchestrator
 from apps.core.authentication import APIKeyAuthentication
 
 logger = logging.getLogger(__name__)
@@ -37,7 +37,7 @@ def run_evals(request):
         
         # Run evaluations
         results = []
-        orchestrator = AgentOrchestrator()
+        orchestrator = get_orchestrator()
         
         for test_case in test_cases:
             try:
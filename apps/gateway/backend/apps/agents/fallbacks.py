@@ -23,7 +23,8 @@ class FallbackManager:
             'proposeAction': self._get_propose_action_fallback
         }
     
-    async def get_fallback(self, tool_name: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    async def get_fallback(self, tool_name: str, context: Dict[str, Any],
+                           error: str = None) -> Dict[str, Any]:
         """
         Get fallback response for a tool.
         """
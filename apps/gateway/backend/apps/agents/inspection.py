@@ -0,0 +1,297 @@
+"""
+Safety Inspection (AgentGuard Decision contract)
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Iterable, Callable, Tuple
+from django.conf import settings
+import orjson
+
+from agentguard_contracts.decision import DecisionAction, decision_dict, redaction_dict
+from agentguard_contracts.validation import validate_decision
+from .db import run_db
+from .lru import LRUCache, content_key
+from .redactor import PIIRedactor, PayloadBudgetExceeded
+
+logger = logging.getLogger(__name__)
+
+
+_decision_cache = None
+_decision_cache_lock = threading.Lock()
+
+
+def get_decision_cache() -> Optional[LRUCache]:
+    """
+    Shared cache of Decision skeletons (sized by INSPECT_DECISION_CACHE_SIZE;
+    None when 0), keyed by pattern-set version and content hash.
+    """
+    global _decision_cache
+    if not settings.INSPECT_DECISION_CACHE_SIZE:
+        return None
+    if _decision_cache is None:
+        with _decision_cache_lock:
+            if _decision_cache is None:
+                _decision_cache = LRUCache(settings.INSPECT_DECISION_CACHE_SIZE)
+    return _decision_cache
+
+
+_KEY_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+
+
+def _payload_key(payload: Any, limit: int) -> Optional[bytes]:
+    """
+    Canonical JSON of a payload for the decision cache, or None when it is
+    over ``limit`` bytes or cannot be serialized. orjson serializes about ten
+    times faster than ``json.dumps(sort_keys=True)``, a small fraction of
+    the inspection it saves.
+    """
+    try:
+        key = orjson.dumps(payload, default=str, option=_KEY_OPTIONS)
+    except (orjson.JSONEncodeError, TypeError):
+        return None
+    return key if len(key) <= limit else None
+
+
+def build_decision(redactor: PIIRedactor, request_id: str, tenant_id: str,
+                   text: Optional[str] = None, payload: Any = None,
+                   cache: Optional[LRUCache] = None) -> Dict[str, Any]:
+    """
+    Inspect text and/or a structured payload for PII and build the Decision
+    in its wire form. The result shares structure with cached entries, so
+    treat it as read-only.
+    
+    With a ``cache``, identical content is inspected once; later calls copy
+    the cached skeleton with their own request and tenant ids. Payloads over
+    INSPECT_DECISION_CACHE_MAX_PAYLOAD are always inspected afresh.
+    """
+    # The ids are the only client values copied into the Decision as-is
+    if not isinstance(request_id, str) or not isinstance(tenant_id, str):
+        raise ValueError("request_id and tenant_id must be strings")
+    payload_key = b''
+    if cache is not None and payload is not None:
+        payload_key = _payload_key(payload, settings.INSPECT_DECISION_CACHE_MAX_PAYLOAD)
+    if cache is None or payload_key is None:
+        return _inspect(redactor, request_id, tenant_id, text, payload)
+    
+    key = content_key(redactor.version, text or '', payload_key)
+    skeleton = cache.get(key)
+    if skeleton is None:
+        skeleton = _inspect(redactor, '', '', text, payload)
+        cache.put(key, skeleton)
+    return {**skeleton, 'request_id': request_id, 'tenant_id': tenant_id}
+
+
+def _inspect(redactor: PIIRedactor, request_id: str, tenant_id: str,
+             text: Optional[str], payload: Any) -> Dict[str, Any]:
+    findings = []
+    redactions = []
+    action = DecisionAction.ALLOW
+
+    if text:
+        # Detect PII: one scan feeds both the types and the spans
+        spans = redactor.scan(text)
+        detected_types = redactor.get_pii_types(text, spans)
+        if detected_types:
+            action = DecisionAction.REDACT
+            for span in spans:
+                redactions.append(
+                    redaction_dict(
+                        type=span.type,
+                        replacement=redactor.replacements[span.type],
+                        start=span.start,
+                        end=span.end
+                    )
+                )
+            findings.append(f"PII detected: {', '.join(detected_types)}")
+
+    if payload is not None:
+        try:
+            payload_findings = redactor.redact_structure(payload).findings
+        except PayloadBudgetExceeded as e:
+            # Content we cannot fully inspect is not let through
+            action = DecisionAction.DENY
+            findings.append(f"Payload not inspected: {str(e)}")
+            payload_findings = []
+
+        if payload_findings:
+            if action == DecisionAction.ALLOW:
+                action = DecisionAction.REDACT
+            for finding in payload_findings:
+                redactions.append(
+                    redaction_dict(
+                        type=finding.type,
+                        replacement=redactor.replacements[finding.type],
+                        start=finding.start,
+                        end=finding.end,
+                        path=finding.path
+                    )
+                )
+            payload_types = redactor.get_pii_types(None, payload_findings)
+            findings.append(f"PII detected in payload: {', '.join(payload_types)}")
+
+    # Build decision; every field above is server-generated, so the contract
+    # is only re-checked in validation mode
+    decision = decision_dict(
+        request_id=request_id,
+        tenant_id=tenant_id,
+        action=action,
+        reasons=findings,
+        redactions=redactions
+    )
+    if settings.DECISION_CONTRACT_VALIDATION:
+        validate_decision(decision)
+    return decision
+
+
+def inspect_items(redactor_for: Callable[[str], PIIRedactor], items: List[Any],
+                  cache: Optional[LRUCache] = None) -> List[Dict[str, Any]]:
+    """
+    Inspect a chunk of batch items, each with its tenant's redactor. Each
+    result is a Decision dict, or an error entry for an item that could not
+    be inspected.
+    """
+    results = []
+    for item in items:
+        if not isinstance(item, dict):
+            results.append({'request_id': None, 'error': 'item must be an object'})
+            continue
+        request_id = item.get('request_id', 'unknown')
+        tenant_id = item.get('tenant_id', 'default')
+        try:
+            decision = build_decision(
+                redactor_for(tenant_id),
+                request_id=request_id,
+                tenant_id=tenant_id,
+                text=item.get('text'),
+                payload=item.get('payload'),
+                cache=cache
+            )
+            results.append(decision)
+        except Exception as e:
+            results.append({'request_id': request_id, 'error': str(e)})
+    return results
+
+
+# Worker pool: regex scanning holds the GIL, so large batches are spread over
+# processes. Workers have no database access: each chunk carries the pattern
+# sets of its tenants, and workers compile each pattern-set version once.
+_worker_budget = {}
+_worker_redactors = LRUCache(64)
+
+
+def _init_worker(max_depth: int, max_size: int):
+    _worker_budget.update(max_depth=max_depth, max_size=max_size)
+
+
+def _inspect_in_worker(policies: Dict[Any, Tuple[str, Dict[str, str], Dict[str, str]]],
+                       items: List[Any]) -> List[Dict[str, Any]]:
+    redactors = {}
+    for tenant_id, (version, patterns, replacements) in policies.items():
+        redactor = _worker_redactors.get(version)
+        if redactor is None:
+            redactor = PIIRedactor(patterns=patterns, replacements=replacements, **_worker_budget)
+            _worker_redactors.put(version, redactor)
+        redactors[tenant_id] = redactor
+    return inspect_items(redactors.__getitem__, items)
+
+
+def _policies(redactors: Dict[str, PIIRedactor]) -> Dict[str, Tuple[str, Dict[str, str], Dict[str, str]]]:
+    """The pattern sets of resolved tenant redactors, to ship to a worker."""
+    return {
+        tenant_id: (
+            redactor.version,
+            {pii_type: pattern.pattern for pii_type, pattern in redactor.patterns.items()},
+            redactor.replacements
+        )
+        for tenant_id, redactor in redactors.items()
+    }
+
+
+def _resolve_redactors(redactor_for: Callable[[str], PIIRedactor], items: List[Any]) -> Dict[str, PIIRedactor]:
+    """Redactors of the tenants in a chunk; ids that are not strings are left to fail inspection."""
+    redactors = {}
+    for item in items:
+        if isinstance(item, dict):
+            tenant_id = item.get('tenant_id', 'default')
+            if isinstance(tenant_id, str) and tenant_id not in redactors:
+                redactors[tenant_id] = redactor_for(tenant_id)
+    return redactors
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_inspection_pool() -> Optional[ProcessPoolExecutor]:
+    """Process pool for batch inspection, or None when INSPECT_BATCH_WORKERS is 0."""
+    global _pool
+    if not settings.INSPECT_BATCH_WORKERS:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: forking a server process with live threads is unsafe
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.INSPECT_BATCH_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(settings.PII_MAX_PAYLOAD_DEPTH, settings.PII_MAX_PAYLOAD_SIZE)
+                )
+    return _pool
+
+
+async def inspect_batch(redactor_for: Callable[[str], PIIRedactor], items: Iterable[Any]):
+    """
+    Inspect items in chunks of ``INSPECT_BATCH_CHUNK_SIZE``, yielding results
+    in input order. ``redactor_for`` resolves a tenant's redactor and is
+    called on the ``run_db`` pool, once per tenant and chunk, so it may use
+    the database.
+
+    Chunks are scanned off the event loop: on the process pool once the batch
+    reaches ``INSPECT_BATCH_POOL_MIN_ITEMS`` (up to one chunk per worker in
+    flight), otherwise on a thread with the shared redactors.
+    """
+    loop = asyncio.get_running_loop()
+    chunk_size = settings.INSPECT_BATCH_CHUNK_SIZE
+    pool = get_inspection_pool()
+    cache = get_decision_cache()
+    pending = []
+    seen = 0
+    chunk = []
+
+    async def inspect_chunk(chunk, on_pool):
+        redactors = await run_db(_resolve_redactors, redactor_for, chunk)
+        if on_pool:
+            return await loop.run_in_executor(pool, _inspect_in_worker, _policies(redactors), chunk)
+        return await loop.run_in_executor(None, inspect_items, redactors.get, chunk, cache)
+
+    def submit(chunk):
+        on_pool = pool is not None and seen >= settings.INSPECT_BATCH_POOL_MIN_ITEMS
+        return asyncio.ensure_future(inspect_chunk(chunk, on_pool))
+
+    try:
+        for item in items:
+            chunk.append(item)
+            seen += 1
+            if len(chunk) < chunk_size:
+                continue
+            pending.append(submit(chunk))
+            chunk = []
+            # Bound the results held in memory to what the pool can work on
+            if len(pending) > max(1, settings.INSPECT_BATCH_WORKERS):
+                for result in await pending.pop(0):
+                    yield result
+
+        if chunk:
+            pending.append(submit(chunk))
+        while pending:
+            for result in await pending.pop(0):
+                yield result
+    finally:
+        # Client went away mid-stream: drop chunks that have not started
+        for future in pending:
+            future.cancel()
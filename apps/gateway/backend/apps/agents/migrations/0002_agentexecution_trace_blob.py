@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agentexecution',
+            name='trace_blob',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='agentexecution',
+            name='trace_encoding',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0002_agentexecution_trace_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RedactionPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tenant_id', models.CharField(max_length=100, unique=True)),
+                ('patterns', models.JSONField(blank=True, default=dict)),
+                ('replacements', models.JSONField(blank=True, default=dict)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'redaction_policies',
+            },
+        ),
+    ]
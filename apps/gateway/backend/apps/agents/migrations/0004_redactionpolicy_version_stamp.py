@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0003_redactionpolicy'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='redactionpolicy',
+            name='version',
+            field=models.CharField(editable=False, max_length=32),
+        ),
+    ]
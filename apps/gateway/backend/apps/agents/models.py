@@ -34,6 +34,8 @@ class AgentExecution(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     plan = models.JSONField(default=list, blank=True)  # Execution plan
     trace = models.JSONField(default=dict, blank=True)  # Execution trace
+    trace_blob = models.BinaryField(null=True, blank=True)  # Compressed full trace (see AGENT_TRACE_COMPRESSION)
+    trace_encoding = models.CharField(max_length=10, blank=True)  # '' when trace holds the full trace
     result = models.JSONField(default=dict, blank=True)  # Final result
     started_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
@@ -99,4 +101,42 @@ class AgentFallback(models.Model):
         ]
     
     def __str__(self):
-        return f"Fallback for {self.tool_name} - {self.fallback_reason}"
\ No newline at end of file
+        return f"Fallback for {self.tool_name} - {self.fallback_reason}"
+
+
+class RedactionPolicy(models.Model):
+    """
+    Per-tenant PII patterns and replacements, added to (or overriding) the
+    defaults in settings.PII_PATTERNS. Every save stamps a new random
+    ``version``, which workers poll to recompile the tenant's scanner; unlike
+    a counter it cannot repeat across concurrent saves or a recreated policy.
+    """
+    tenant_id = models.CharField(max_length=100, unique=True)
+    patterns = models.JSONField(default=dict, blank=True)  # type -> regex
+    replacements = models.JSONField(default=dict, blank=True)  # type -> replacement
+    version = models.CharField(max_length=32, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'redaction_policies'
+    
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        from .redactor import PIIRedactor
+        for field in ('patterns', 'replacements'):
+            value = getattr(self, field)
+            if not isinstance(value, dict) or not all(isinstance(v, str) for v in value.values()):
+                raise ValidationError({field: 'Must be an object mapping PII types to strings'})
+        try:
+            PIIRedactor(patterns=self.patterns, replacements=self.replacements)
+        except ValueError as e:
+            raise ValidationError(str(e))
+    
+    def save(self, *args, **kwargs):
+        self.version = uuid.uuid4().hex
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"Redaction policy for {self.tenant_id} ({self.version[:8]})"
\ No newline at end of file
@@ -5,20 +5,25 @@ Multi-Agent Orchestrator for Fraud Triage
 import asyncio
 import json
 import logging
+import random
 import time
 import uuid
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any
 from datetime import datetime
-from django.core.cache import cache
 from django.conf import settings
-from asgiref.sync import sync_to_async
 
-from .models import AgentExecution, ToolCall, AgentFallback
+from .models import AgentExecution
 from .tools import (
     GetProfileTool, GetRecentTransactionsTool, RiskSignalsTool,
     KBLookupTool, DecideTool, ProposeActionTool
 )
 from .fallbacks import FallbackManager
+from .breakers import CircuitBreakerRegistry, CircuitOpenError
+from .redactor import PIIRedactor
+from .persistence import ExecutionRecorder
+from .result_cache import TriageResultCache
+from .traces import compact_inputs, encode_trace
+from .planner import ExecutionPlan, TRIAGE_PLAN
 
 logger = logging.getLogger(__name__)
 
@@ -28,47 +33,55 @@ class AgentOrchestrator:
     Orchestrates multi-agent fraud triage workflow.
     """
     
-    def __init__(self):
+    def __init__(self, redactor: PIIRedactor = None):
+        redactor = redactor or PIIRedactor()
         self.tools = {
-            'getProfile': GetProfileTool(),
-            'getRecentTransactions': GetRecentTransactionsTool(),
-            'riskSignals': RiskSignalsTool(),
-            'kbLookup': KBLookupTool(),
-            'decide': DecideTool(),
-            'proposeAction': ProposeActionTool()
+            'getProfile': GetProfileTool(redactor),
+            'getRecentTransactions': GetRecentTransactionsTool(redactor),
+            'riskSignals': RiskSignalsTool(redactor),
+            'kbLookup': KBLookupTool(redactor),
+            'decide': DecideTool(redactor),
+            'proposeAction': ProposeActionTool(redactor)
         }
         self.fallback_manager = FallbackManager()
-        self.circuit_breakers = {}
+        self.circuit_breakers = CircuitBreakerRegistry()
+        self.result_cache = TriageResultCache()
     
     async def execute_triage(self, customer_id: str, suspect_txn_id: str, 
                            user_message: str = None) -> Dict[str, Any]:
         """
         Execute fraud triage workflow.
         """
-        execution_id = f"exec_{uuid.uuid4().hex[:8]}"
         start_time = time.time()
         
-        # Define execution plan
-        plan = [
-            "getProfile",
-            "getRecentTransactions", 
-            "riskSignals",
-            "kbLookup",
-            "decide",
-            "proposeAction"
-        ]
+        # Reuse the result of an identical triage on unchanged customer data
+        cache_key, cached = await self.result_cache.alookup(customer_id, suspect_txn_id, user_message)
+        if cached:
+            return {
+                'execution_id': cached['execution_id'],
+                'status': 'completed',
+                'cached': True,
+                'duration_ms': int((time.time() - start_time) * 1000),
+                'result': cached['result']
+            }
+        
+        execution_id = f"exec_{uuid.uuid4().hex[:8]}"
+        
+        # Execution plan: steps run as soon as the results they read are available
+        plan = TRIAGE_PLAN
         
-        # Create execution record
-        execution = await sync_to_async(AgentExecution.objects.create)(
+        # Execution record is buffered and written once the run finishes
+        execution = AgentExecution(
             id=execution_id,
             customer_id=customer_id,
             transaction_id=suspect_txn_id,
             execution_type='fraud_triage',
             status='RUNNING',
-            plan=plan,
+            plan=plan.order,
             trace={},
             result={}
         )
+        recorder = ExecutionRecorder(execution)
         
         try:
             # Execute plan
@@ -79,23 +92,24 @@ class AgentOrchestrator:
                 'execution_id': execution_id
             }
             
-            trace = await self._execute_plan(plan, context, execution)
+            trace = await self._execute_plan(plan, context, recorder)
             
             # Calculate duration
             duration_ms = int((time.time() - start_time) * 1000)
             
             # Update execution
-            await sync_to_async(execution.save)()
-            execution.trace = trace
+            self._store_trace(execution, trace)
             execution.status = 'COMPLETED'
             execution.completed_at = datetime.now()
             execution.duration_ms = duration_ms
             execution.result = trace.get('final_result', {})
-            await sync_to_async(execution.save)()
+            await recorder.flush()
+            await self.result_cache.aset(cache_key, execution_id, execution.result, trace)
             
             return {
                 'execution_id': execution_id,
                 'status': 'completed',
+                'cached': False,
                 'duration_ms': duration_ms,
                 'result': trace.get('final_result', {}),
                 'trace': trace
@@ -109,7 +123,7 @@ class AgentOrchestrator:
             execution.completed_at = datetime.now()
             execution.duration_ms = int((time.time() - start_time) * 1000)
             execution.result = {'error': str(e)}
-            await sync_to_async(execution.save)()
+            await recorder.flush(durable=settings.AGENT_PERSISTENCE_DURABLE_FAILURES)
             
             raise e
     
@@ -118,34 +132,34 @@ class AgentOrchestrator:
         """
         Execute fraud triage workflow with streaming progress updates.
         """
-        execution_id = f"exec_{uuid.uuid4().hex[:8]}"
         start_time = time.time()
         
-        # Define execution plan
-        plan = [
-            "getProfile",
-            "getRecentTransactions", 
-            "riskSignals",
-            "kbLookup",
-            "decide",
-            "proposeAction"
-        ]
+        cache_key, cached = await self.result_cache.alookup(customer_id, suspect_txn_id, user_message)
+        if cached:
+            yield f"data: {json.dumps({'event': 'decision_finalized', 'result': cached['result'], 'execution_id': cached['execution_id'], 'cached': True})}\n\n"
+            return
         
-        # Create execution record
-        execution = await sync_to_async(AgentExecution.objects.create)(
+        execution_id = f"exec_{uuid.uuid4().hex[:8]}"
+        
+        # Execution plan: steps run as soon as the results they read are available
+        plan = TRIAGE_PLAN
+        
+        # Execution record is buffered and written once the run finishes
+        execution = AgentExecution(
             id=execution_id,
             customer_id=customer_id,
             transaction_id=suspect_txn_id,
             execution_type='fraud_triage',
             status='RUNNING',
-            plan=plan,
+            plan=plan.order,
             trace={},
             result={}
         )
+        recorder = ExecutionRecorder(execution)
         
         try:
             # Send initial event
-            yield f"data: {json.dumps({'event': 'plan_built', 'plan': plan})}\n\n"
+            yield f"data: {json.dumps({'event': 'plan_built', 'plan': plan.order, 'dag': plan.to_dict()})}\n\n"
             
             # Execute plan and collect trace
             context = {
@@ -157,29 +171,29 @@ class AgentOrchestrator:
             
             trace = {}
             final_trace = None
-            async for event in self._execute_plan_with_progress(plan, context, execution, event_stream):
+            async for event in self._execute_plan_with_progress(plan, context, recorder, event_stream):
                 # Collect the final trace from the last yielded value
                 if isinstance(event, dict) and 'steps' in event:
                     final_trace = event
+                else:
+                    yield event
             
-            # Use the collected trace or get from execution record
+            # Use the collected trace
             if final_trace:
                 trace = final_trace
-            else:
-                await sync_to_async(execution.refresh_from_db)()
-                trace = execution.trace
             
             # Calculate duration and update execution
             duration_ms = int((time.time() - start_time) * 1000)
-            execution.trace = trace
+            self._store_trace(execution, trace)
             execution.status = 'COMPLETED'
             execution.completed_at = datetime.now()
             execution.duration_ms = duration_ms
             execution.result = trace.get('final_result', {})
-            await sync_to_async(execution.save)()
+            await recorder.flush()
+            await self.result_cache.aset(cache_key, execution_id, execution.result, trace)
             
             # Send final result
-            yield f"data: {json.dumps({'event': 'decision_finalized', 'result': execution.result})}\n\n"
+            yield f"data: {json.dumps({'event': 'decision_finalized', 'result': execution.result, 'execution_id': execution_id, 'cached': False})}\n\n"
             
         except Exception as e:
             logger.error(f"Error in execute_triage_with_progress: {str(e)}")
@@ -189,171 +203,331 @@ class AgentOrchestrator:
             execution.completed_at = datetime.now()
             execution.duration_ms = int((time.time() - start_time) * 1000)
             execution.result = {'error': str(e)}
-            await sync_to_async(execution.save)()
+            await recorder.flush(durable=settings.AGENT_PERSISTENCE_DURABLE_FAILURES)
             
             # Send error event
             yield f"data: {json.dumps({'event': 'error', 'error': str(e)})}\n\n"
     
-    async def _execute_plan(self, plan: List[str], context: Dict[str, Any], 
-                          execution: AgentExecution) -> Dict[str, Any]:
+    async def execute_batch_triage(self, items: List[Dict[str, Any]]):
         """
-        Execute the agent plan.
+        Score many suspect transactions, yielding one result per item as it
+        completes.
+        
+        Items are grouped by customer so the profile, recent history and all
+        of the customer's suspect transactions are loaded once per group;
+        riskSignals and decide then run per item. This is scoring only: no
+        action is proposed, no transaction status changes and no execution
+        record is written. A failing item or customer group only fails its
+        own results.
         """
-        trace = {
-            'steps': [],
-            'final_result': {}
+        groups = {}
+        for index, item in enumerate(items):
+            groups.setdefault(item['customer_id'], []).append(index)
+        
+        group_contexts = {
+            customer_id: asyncio.ensure_future(
+                self._load_batch_context(customer_id, [items[i]['suspect_txn_id'] for i in indexes])
+            )
+            for customer_id, indexes in groups.items()
         }
+        item_tasks = [
+            asyncio.ensure_future(self._score_batch_item(index, item, group_contexts[item['customer_id']]))
+            for index, item in enumerate(items)
+        ]
         
-        for step in plan:
-            try:
-                # Execute tool
-                tool = self.tools.get(step)
-                if not tool:
-                    raise ValueError(f"Unknown tool: {step}")
-                
-                # Record tool call
-                tool_call = await sync_to_async(ToolCall.objects.create)(
-                    execution=execution,
-                    tool_name=step,
-                    input_data=context,
-                    status='RUNNING'
+        try:
+            for next_result in asyncio.as_completed(item_tasks):
+                yield await next_result
+        finally:
+            for task in item_tasks + list(group_contexts.values()):
+                task.cancel()
+    
+    async def _load_batch_context(self, customer_id: str, txn_ids: List[str]) -> Dict[str, Any]:
+        """
+        Load the context shared by every item of one customer.
+        """
+        context = {'customer_id': customer_id, 'suspect_txn_id': None}
+        profile_result, recent_result, suspects = await asyncio.wait_for(
+            asyncio.gather(
+                self.tools['getProfile'].execute(context),
+                self.tools['getRecentTransactions'].execute(context),
+                self.tools['getRecentTransactions'].load_suspect_transactions(customer_id, txn_ids)
+            ),
+            timeout=settings.AGENT_TIMEOUT
+        )
+        
+        for result in (profile_result, recent_result):
+            if 'error' in result:
+                raise ValueError(result['error'])
+        
+        return {
+            'getProfile_result': profile_result,
+            'getRecentTransactions_result': recent_result,
+            'suspects': suspects
+        }
+    
+    async def _score_batch_item(self, index: int, item: Dict[str, Any], group_context) -> Dict[str, Any]:
+        """
+        Run riskSignals and decide for one item on top of its group's context.
+        """
+        response = {
+            'index': index,
+            'customerId': item['customer_id'],
+            'suspectTxnId': item['suspect_txn_id']
+        }
+        
+        try:
+            shared = await asyncio.shield(group_context)
+            suspect = shared['suspects'].get(item['suspect_txn_id'])
+            if suspect is None:
+                raise ValueError('Transaction not found')
+            
+            context = {
+                'customer_id': item['customer_id'],
+                'suspect_txn_id': item['suspect_txn_id'],
+                'user_message': item.get('user_message', ''),
+                'getProfile_result': shared['getProfile_result'],
+                'getRecentTransactions_result': dict(
+                    shared['getRecentTransactions_result'],
+                    suspect_transaction=suspect
                 )
-                
-                # Execute tool
-                result = await tool.execute(context)
-                
-                # Update tool call
-                tool_call.output_data = result
-                tool_call.status = 'COMPLETED'
-                await sync_to_async(tool_call.save)()
-                
-                # Add to trace
-                trace['steps'].append({
-                    'tool': step,
-                    'status': 'completed',
-                    'result': result
-                })
-                
-                # Update context with result
-                context[f'{step}_result'] = result
-                
-            except Exception as e:
-                logger.error(f"Error executing tool {step}: {str(e)}")
-                
-                # Record failed tool call
-                tool_call = await sync_to_async(ToolCall.objects.create)(
-                    execution=execution,
-                    tool_name=step,
-                    input_data=context,
-                    status='FAILED',
-                    error_message=str(e)
+            }
+            
+            for step in ('riskSignals', 'decide'):
+                result = await asyncio.wait_for(
+                    self.tools[step].execute(context),
+                    timeout=settings.TOOL_TIMEOUT
                 )
-                
-                # Try fallback
-                fallback_result = await self.fallback_manager.get_fallback(step, context, str(e))
-                
-                # Add to trace
-                trace['steps'].append({
-                    'tool': step,
-                    'status': 'failed',
-                    'error': str(e),
-                    'fallback_used': True,
-                    'fallback_result': fallback_result
-                })
-                
-                # Update context with fallback result
-                context[f'{step}_result'] = fallback_result
+                if 'error' in result:
+                    raise ValueError(result['error'])
+                context[f'{step}_result'] = result
+            
+            risk = context['riskSignals_result']
+            response.update({
+                'status': 'completed',
+                'risk_score': risk['risk_score'],
+                'risk_level': risk['risk_level'],
+                'risk_signals': risk['risk_signals'],
+                'decision': context['decide_result']['decision']
+            })
+            
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.error(f"Error scoring batch item {index}: {error}")
+            response.update({'status': 'failed', 'error': error})
         
-        # Set final result
-        trace['final_result'] = context.get('proposeAction_result', {})
+        return response
+    
+    async def _execute_plan(self, plan: ExecutionPlan, context: Dict[str, Any], 
+                          recorder: ExecutionRecorder) -> Dict[str, Any]:
+        """
+        Execute the agent plan.
+        """
+        trace = {}
+        async for _ in self._run_plan(plan, context, recorder, trace):
+            pass
         
         return trace
     
-    async def _execute_plan_with_progress(self, plan: List[str], context: Dict[str, Any], 
-                                        execution: AgentExecution, event_stream):
+    async def _execute_plan_with_progress(self, plan: ExecutionPlan, context: Dict[str, Any], 
+                                        recorder: ExecutionRecorder, event_stream):
         """
         Execute the agent plan with progress updates.
         """
-        trace = {
-            'steps': [],
-            'final_result': {}
-        }
+        trace = {}
+        async for event in self._run_plan(plan, context, recorder, trace):
+            yield f"data: {json.dumps(event)}\n\n"
         
-        for step in plan:
-            try:
-                # Send tool start event
-                yield f"data: {json.dumps({'event': 'tool_update', 'tool': step, 'status': 'started'})}\n\n"
-                
-                # Execute tool
-                tool = self.tools.get(step)
-                if not tool:
-                    raise ValueError(f"Unknown tool: {step}")
-                
-                # Record tool call
-                tool_call = await sync_to_async(ToolCall.objects.create)(
-                    execution=execution,
-                    tool_name=step,
-                    input_data=context,
-                    status='RUNNING'
-                )
-                
-                # Execute tool
-                result = await tool.execute(context)
-                
-                # Update tool call
-                tool_call.output_data = result
-                tool_call.status = 'COMPLETED'
-                await sync_to_async(tool_call.save)()
-                
-                # Send tool completion event
-                yield f"data: {json.dumps({'event': 'tool_update', 'tool': step, 'status': 'completed', 'result': result})}\n\n"
-                
-                # Add to trace
-                trace['steps'].append({
-                    'tool': step,
-                    'status': 'completed',
-                    'result': result
-                })
-                
-                # Update context with result
-                context[f'{step}_result'] = result
-                
-            except Exception as e:
-                logger.error(f"Error executing tool {step}: {str(e)}")
-                
-                # Record failed tool call
-                tool_call = await sync_to_async(ToolCall.objects.create)(
-                    execution=execution,
-                    tool_name=step,
-                    input_data=context,
-                    status='FAILED',
-                    error_message=str(e)
-                )
-                
-                # Try fallback
-                fallback_result = await self.fallback_manager.get_fallback(step, context, str(e))
-                
-                # Send fallback event
-                yield f"data: {json.dumps({'event': 'fallback_triggered', 'tool': step, 'fallback_result': fallback_result})}\n\n"
+        # Yield the final trace (this is an async generator)
+        yield trace
+    
+    async def _run_plan(self, plan: ExecutionPlan, context: Dict[str, Any],
+                        recorder: ExecutionRecorder, trace: Dict[str, Any]):
+        """
+        Schedule plan steps as soon as their inputs are available, running
+        independent steps concurrently. Yields progress events and fills
+        ``trace`` in place once every step has finished.
+        
+        The whole plan shares a budget of ``settings.AGENT_TIMEOUT`` seconds;
+        steps that cannot run within it fall through to their fallback.
+        """
+        plan_start = time.monotonic()
+        deadline = plan_start + settings.AGENT_TIMEOUT
+        entries = {}
+        running = {}
+        
+        try:
+            while len(entries) < len(plan.order):
+                scheduled = list(entries) + list(running.values())
+                for step in plan.ready_steps(entries, scheduled):
+                    yield {'event': 'tool_update', 'tool': step, 'status': 'started'}
+                    task = asyncio.ensure_future(
+                        self._run_step(plan, step, context, recorder, plan_start, deadline)
+                    )
+                    running[task] = step
                 
-                # Add to trace
-                trace['steps'].append({
-                    'tool': step,
-                    'status': 'failed',
-                    'error': str(e),
-                    'fallback_used': True,
-                    'fallback_result': fallback_result
-                })
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
                 
-                # Update context with fallback result
-                context[f'{step}_result'] = fallback_result
+                for task in done:
+                    step = running.pop(task)
+                    entry = task.result()
+                    entries[step] = entry
+                    
+                    # Update context with result
+                    if entry['status'] == 'completed':
+                        context[f'{step}_result'] = entry['result']
+                        yield {
+                            'event': 'tool_update',
+                            'tool': step,
+                            'status': 'completed',
+                            'result': entry['result']
+                        }
+                    else:
+                        context[f'{step}_result'] = entry['fallback_result']
+                        yield {
+                            'event': 'fallback_triggered',
+                            'tool': step,
+                            'fallback_result': entry['fallback_result']
+                        }
+        finally:
+            for task in running:
+                task.cancel()
         
-        # Set final result
+        trace['steps'] = [entries[step] for step in plan.order]
+        trace['dag'] = plan.to_dict()
+        trace['critical_path'] = plan.critical_path(entries)
+        trace['budget_exhausted'] = time.monotonic() >= deadline
         trace['final_result'] = context.get('proposeAction_result', {})
+    
+    async def _run_step(self, plan: ExecutionPlan, step: str, context: Dict[str, Any],
+                        recorder: ExecutionRecorder, plan_start: float,
+                        deadline: float) -> Dict[str, Any]:
+        """
+        Execute a single tool, falling back on failure. Never raises.
         
-        # Update execution trace
-        execution.trace = trace
-        await sync_to_async(execution.save)()
+        Each attempt is bounded by the lesser of ``settings.TOOL_TIMEOUT`` and
+        the time left before ``deadline`` and is cancelled when it runs out.
+        Failed attempts, including error results returned by the tool, are
+        retried up to ``settings.MAX_RETRIES``
+        times with jittered exponential backoff, but only while the backoff
+        still fits in the remaining budget. An open circuit breaker skips the tool entirely.
+        """
+        started_offset_ms = int((time.monotonic() - plan_start) * 1000)
         
-        # Yield the final trace (this is an async generator)
-        yield trace
+        # Record tool call with its declared inputs; upstream results are stored
+        # as references to the producing step rather than copied
+        tool_call = recorder.record_tool_call(
+            tool_name=step,
+            input_data=compact_inputs(plan, step, context),
+            status='RUNNING'
+        )
+        breaker = self.circuit_breakers.get(step)
+        attempted = False
+        breaker_recorded = False
+        
+        try:
+            # Execute tool
+            tool = self.tools.get(step)
+            if not tool:
+                raise ValueError(f"Unknown tool: {step}")
+            
+            # Short-circuit to the fallback while the tool is known to be failing
+            allowed, breaker_recorded = await breaker.aallow_request()
+            if not allowed:
+                raise CircuitOpenError(f"Circuit breaker open for {step}")
+            
+            # Execute tool within its deadline, retrying while budget remains
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"Triage budget exhausted before {step}")
+                
+                attempted = True
+                try:
+                    result = await asyncio.wait_for(
+                        tool.execute(context),
+                        timeout=min(settings.TOOL_TIMEOUT, remaining)
+                    )
+                    # Tools report their own failures as error results
+                    if 'error' in result:
+                        raise ValueError(result['error'])
+                    break
+                except Exception as e:
+                    backoff = random.uniform(0, settings.RETRY_BACKOFF_BASE * (2 ** tool_call.retry_count))
+                    if (tool_call.retry_count >= settings.MAX_RETRIES
+                            or time.monotonic() + backoff >= deadline):
+                        raise
+                    logger.warning(f"Retrying tool {step} after error: {str(e) or type(e).__name__}")
+                    tool_call.retry_count += 1
+                    await asyncio.sleep(backoff)
+            
+            await breaker.arecord_success(breaker_recorded)
+            ended_offset_ms = int((time.monotonic() - plan_start) * 1000)
+            
+            # Update tool call
+            tool_call.output_data = result
+            tool_call.status = 'COMPLETED'
+            tool_call.duration_ms = ended_offset_ms - started_offset_ms
+            
+            return {
+                'tool': step,
+                'status': 'completed',
+                'result': result,
+                'retries': tool_call.retry_count,
+                'started_offset_ms': started_offset_ms,
+                'ended_offset_ms': ended_offset_ms
+            }
+            
+        except Exception as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            error = str(e) or (f"Tool {step} timed out" if timed_out else type(e).__name__)
+            logger.error(f"Error executing tool {step}: {error}")
+            
+            # Only failures of the tool itself count towards opening the breaker
+            if attempted:
+                await breaker.arecord_failure()
+            
+            # Mark tool call as failed
+            tool_call.status = 'TIMEOUT' if timed_out else 'FAILED'
+            tool_call.error_message = error
+            
+            # Try fallback
+            fallback_result = await self.fallback_manager.get_fallback(step, context, error)
+            tool_call.output_data = fallback_result
+            
+            return {
+                'tool': step,
+                'status': 'failed',
+                'error': error,
+                'timed_out': timed_out,
+                'circuit_open': isinstance(e, CircuitOpenError),
+                'retries': tool_call.retry_count,
+                'fallback_used': True,
+                'fallback_result': fallback_result,
+                'started_offset_ms': started_offset_ms,
+                'ended_offset_ms': int((time.monotonic() - plan_start) * 1000)
+            }
+    
+    def _store_trace(self, execution: AgentExecution, trace: Dict[str, Any]):
+        """
+        Attach the trace to the execution, compressed when configured.
+        """
+        compression = settings.AGENT_TRACE_COMPRESSION
+        blob = encode_trace(trace, compression)
+        
+        if blob is None:
+            execution.trace = trace
+            return
+        
+        # Keep a result-free summary queryable in the JSON column
+        execution.trace = {
+            'steps': [
+                {key: value for key, value in step.items()
+                 if key not in ('result', 'fallback_result')}
+                for step in trace.get('steps', [])
+            ],
+            'dag': trace.get('dag', {}),
+            'critical_path': trace.get('critical_path', [])
+        }
+        execution.trace_blob = blob
+        execution.trace_encoding = compression
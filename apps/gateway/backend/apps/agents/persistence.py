@@ -0,0 +1,136 @@
+"""
+Write-behind persistence for agent executions and tool calls
+"""
+
+import atexit
+import logging
+import queue
+import threading
+from typing import List
+from django.conf import settings
+from django.db import transaction, close_old_connections
+
+from .db import run_db
+from .models import AgentExecution, ToolCall
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionRecorder:
+    """
+    Collects an execution and its tool calls in memory during a run.
+
+    Nothing touches the database until ``flush``; the records are then written
+    with one insert for the execution and one ``bulk_create`` for the tool
+    calls, either inline or via the background flusher depending on
+    ``settings.AGENT_PERSISTENCE_MODE``.
+    """
+
+    def __init__(self, execution: AgentExecution):
+        self.execution = execution
+        self.tool_calls = []
+
+    def record_tool_call(self, **fields) -> ToolCall:
+        """Create an unsaved ToolCall attached to this execution."""
+        tool_call = ToolCall(execution=self.execution, **fields)
+        self.tool_calls.append(tool_call)
+        return tool_call
+
+    async def flush(self, durable: bool = False):
+        """
+        Persist the collected records.
+
+        ``durable`` forces a synchronous write even in background mode; failed
+        runs use it (when ``AGENT_PERSISTENCE_DURABLE_FAILURES`` is on) so their
+        records survive a worker crash.
+        """
+        mode = getattr(settings, 'AGENT_PERSISTENCE_MODE', 'end_of_run')
+
+        if mode == 'background' and not durable:
+            get_flusher().enqueue(self)
+        else:
+            await run_db(write_records, [self])
+
+
+def write_records(recorders: List[ExecutionRecorder]):
+    """
+    Write a batch of recorders in a single transaction.
+    """
+    batch_size = getattr(settings, 'AGENT_PERSISTENCE_BATCH_SIZE', 100)
+
+    with transaction.atomic():
+        AgentExecution.objects.bulk_create(
+            [recorder.execution for recorder in recorders],
+            batch_size=batch_size
+        )
+        ToolCall.objects.bulk_create(
+            [tool_call for recorder in recorders for tool_call in recorder.tool_calls],
+            batch_size=batch_size
+        )
+
+
+class BackgroundFlusher:
+    """
+    Daemon thread that drains queued recorders and writes them in batches.
+    """
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='agent-persistence', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, recorder: ExecutionRecorder):
+        self.queue.put(recorder)
+
+    def _drain(self, block: bool) -> List[ExecutionRecorder]:
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=self.interval) if block else self.queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch: List[ExecutionRecorder]):
+        if not batch:
+            return
+        close_old_connections()
+        try:
+            write_records(batch)
+        except Exception as e:
+            logger.error(f"Error flushing {len(batch)} agent executions: {str(e)}")
+        finally:
+            close_old_connections()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._write(self._drain(block=True))
+
+    def stop(self):
+        """Stop the thread and write whatever is still queued."""
+        self._stopped.set()
+        self._thread.join(timeout=self.interval * 2)
+        while not self.queue.empty():
+            self._write(self._drain(block=False))
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def get_flusher() -> BackgroundFlusher:
+    """Return the process-wide background flusher, starting it on first use."""
+    global _flusher
+    if _flusher is None:
+        with _flusher_lock:
+            if _flusher is None:
+                _flusher = BackgroundFlusher(
+                    interval=getattr(settings, 'AGENT_PERSISTENCE_FLUSH_INTERVAL', 1.0),
+                    batch_size=getattr(settings, 'AGENT_PERSISTENCE_BATCH_SIZE', 100)
+                )
+                atexit.register(_flusher.stop)
+    return _flusher
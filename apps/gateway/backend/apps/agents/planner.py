@@ -0,0 +1,118 @@
+"""
+Execution Plan (DAG) for Fraud Triage
+"""
+
+from typing import Dict, List, Any, Iterable
+
+
+class PlanStep:
+    """
+    A single tool invocation in the plan, declared by the context keys it
+    reads and the context key it writes.
+    """
+
+    def __init__(self, tool_name: str, inputs: Iterable[str]):
+        self.tool_name = tool_name
+        self.inputs = tuple(inputs)
+        self.output = f'{tool_name}_result'
+
+    def __repr__(self):
+        return f"PlanStep({self.tool_name})"
+
+
+class ExecutionPlan:
+    """
+    Dependency graph of plan steps.
+
+    A step depends on every step that produces one of its inputs; inputs not
+    produced by any step must be supplied by the initial context.
+    """
+
+    def __init__(self, steps: List[PlanStep], initial_inputs: Iterable[str] = ()):
+        self.steps = {step.tool_name: step for step in steps}
+        if len(self.steps) != len(steps):
+            raise ValueError("Duplicate tool in plan")
+
+        self.producers = {step.output: step.tool_name for step in steps}
+        initial_inputs = set(initial_inputs)
+
+        self.dependencies = {}
+        for step in steps:
+            deps = []
+            for key in step.inputs:
+                if key in self.producers:
+                    deps.append(self.producers[key])
+                elif key not in initial_inputs:
+                    raise ValueError(f"Unresolved input '{key}' for tool {step.tool_name}")
+            self.dependencies[step.tool_name] = tuple(deps)
+
+        self.order = self._topological_order(steps)
+
+    def _topological_order(self, steps: List[PlanStep]) -> List[str]:
+        """Kahn's algorithm, ties broken by declaration order."""
+        remaining = {name: set(deps) for name, deps in self.dependencies.items()}
+        order = []
+
+        while remaining:
+            ready = [step.tool_name for step in steps
+                     if step.tool_name in remaining and not remaining[step.tool_name]]
+            if not ready:
+                raise ValueError(f"Cycle in plan between: {', '.join(sorted(remaining))}")
+            for name in ready:
+                del remaining[name]
+                order.append(name)
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+        return order
+
+    def ready_steps(self, completed: Iterable[str], scheduled: Iterable[str]) -> List[str]:
+        """
+        Steps whose dependencies have all completed and that are not yet scheduled.
+        """
+        completed = set(completed)
+        scheduled = set(scheduled)
+        return [
+            name for name in self.order
+            if name not in scheduled
+            and all(dep in completed for dep in self.dependencies[name])
+        ]
+
+    def critical_path(self, timings: Dict[str, Dict[str, Any]]) -> List[str]:
+        """
+        Walk back from the last step to finish, always following the dependency
+        that finished last, to find the chain that bounded total latency.
+        """
+        if not timings:
+            return []
+
+        current = max(timings, key=lambda name: timings[name]['ended_offset_ms'])
+        path = [current]
+        while True:
+            deps = [dep for dep in self.dependencies.get(current, ()) if dep in timings]
+            if not deps:
+                break
+            current = max(deps, key=lambda name: timings[name]['ended_offset_ms'])
+            path.append(current)
+
+        path.reverse()
+        return path
+
+    def to_dict(self) -> Dict[str, List[str]]:
+        """Dependency map suitable for storing alongside the trace."""
+        return {name: list(self.dependencies[name]) for name in self.order}
+
+
+# Initial context supplied by the orchestrator for every triage.
+TRIAGE_CONTEXT_KEYS = ('customer_id', 'suspect_txn_id', 'user_message', 'execution_id')
+
+TRIAGE_PLAN = ExecutionPlan([
+    PlanStep('getProfile', inputs=['customer_id']),
+    PlanStep('getRecentTransactions', inputs=['customer_id', 'suspect_txn_id']),
+    PlanStep('riskSignals', inputs=['getProfile_result', 'getRecentTransactions_result', 'user_message']),
+    PlanStep('kbLookup', inputs=['user_message']),
+    PlanStep('decide', inputs=['riskSignals_result', 'user_message']),
+    PlanStep('proposeAction', inputs=[
+        'decide_result', 'getProfile_result', 'getRecentTransactions_result', 'kbLookup_result'
+    ]),
+], initial_inputs=TRIAGE_CONTEXT_KEYS)
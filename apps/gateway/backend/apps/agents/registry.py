@@ -0,0 +1,126 @@
+"""
+Process-wide Agent Registry
+
+Orchestrator, tools, fallbacks and the PII redactor hold no per-request
+state, so each worker builds them once and every request reuses them. The
+ASGI entry point builds them at startup; elsewhere (management commands,
+tests) they are built on first use.
+
+Tenants with a RedactionPolicy get their own redactor, rebuilt when the
+policy's version changes.
+"""
+
+import logging
+import threading
+import time
+from typing import Optional, Tuple
+from django.conf import settings
+
+from .lru import LRUCache
+from .models import RedactionPolicy
+from .orchestrator import AgentOrchestrator
+from .redactor import PIIRedactor
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_redactor = None
+_orchestrator = None
+
+
+def _build():
+    global _redactor, _orchestrator
+    with _lock:
+        if _orchestrator is None:
+            _redactor = PIIRedactor(
+                patterns=settings.PII_PATTERNS,
+                replacements=settings.PII_REPLACEMENTS,
+                max_depth=settings.PII_MAX_PAYLOAD_DEPTH,
+                max_size=settings.PII_MAX_PAYLOAD_SIZE,
+                cache_size=settings.PII_SCAN_CACHE_SIZE
+            )
+            _orchestrator = AgentOrchestrator(redactor=_redactor)
+
+
+def get_orchestrator() -> AgentOrchestrator:
+    """Shared orchestrator (and its tools and fallback manager)."""
+    if _orchestrator is None:
+        _build()
+    return _orchestrator
+
+
+def get_redactor() -> PIIRedactor:
+    """Shared PII redactor with precompiled patterns."""
+    if _redactor is None:
+        _build()
+    return _redactor
+
+
+_tenant_redactors = None
+_tenant_lock = threading.Lock()
+
+
+def _tenant_cache() -> LRUCache:
+    global _tenant_redactors
+    if _tenant_redactors is None:
+        with _tenant_lock:
+            if _tenant_redactors is None:
+                _tenant_redactors = LRUCache(settings.PII_POLICY_CACHE_SIZE)
+    return _tenant_redactors
+
+
+def _build_tenant_redactor(tenant_id: str) -> Tuple[Optional[str], PIIRedactor]:
+    """The tenant's policy version and a redactor built from that same row."""
+    policy = RedactionPolicy.objects.filter(tenant_id=tenant_id).first()
+    if policy is None:
+        return None, get_redactor()
+    try:
+        return policy.version, PIIRedactor(
+            patterns={**settings.PII_PATTERNS, **policy.patterns},
+            replacements={**settings.PII_REPLACEMENTS, **policy.replacements},
+            max_depth=settings.PII_MAX_PAYLOAD_DEPTH,
+            max_size=settings.PII_MAX_PAYLOAD_SIZE,
+            cache_size=settings.PII_SCAN_CACHE_SIZE
+        )
+    except (ValueError, TypeError, AttributeError) as e:
+        # Policies are validated on save; a row edited behind the admin's back
+        # must not take inspection down for the tenant
+        logger.error(f"Invalid redaction policy for tenant {tenant_id}, using defaults: {e}")
+        return policy.version, get_redactor()
+
+
+def get_tenant_redactor(tenant_id: str) -> PIIRedactor:
+    """
+    Redactor for a tenant: the shared one, or one built from the tenant's
+    RedactionPolicy layered over the default patterns.
+
+    The policy version is re-read at most every PII_POLICY_REFRESH_INTERVAL
+    seconds, so edits reach every worker without a restart. Runs a query, so
+    call it from sync code (or a worker thread).
+    """
+    cache = _tenant_cache()
+    now = time.monotonic()
+    entry = cache.get(tenant_id)
+    if entry is not None and now - entry[1] < settings.PII_POLICY_REFRESH_INTERVAL:
+        return entry[2]
+
+    version = RedactionPolicy.objects.filter(tenant_id=tenant_id).values_list('version', flat=True).first()
+    if entry is not None and entry[0] == version:
+        redactor = entry[2]
+    elif version is None:
+        redactor = get_redactor()
+    else:
+        version, redactor = _build_tenant_redactor(tenant_id)
+    cache.put(tenant_id, (version, now, redactor))
+    return redactor
+
+
+def warm_up():
+    """
+    Build the shared instances and exercise the hot paths once so the first
+    request does not pay for lazy initialisation.
+    """
+    _build()
+    _redactor.redact_text('warm-up 4111111111111111 user@example.com 9876543210')
+    _redactor.get_pii_types('warm-up 123456789012')
+    logger.info("Agent registry ready")
@@ -0,0 +1,125 @@
+"""
+Memoized Triage Results
+"""
+
+import hashlib
+import logging
+import time
+from typing import Dict, Any, Optional, Iterable, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+def _data_version_key(customer_id: str) -> str:
+    return f"triage_data_version:{customer_id}"
+
+
+def get_data_version(customer_id: str) -> Optional[int]:
+    """
+    Current data version for a customer, or None when the cache is down.
+
+    A missing counter (never bumped, or evicted) is seeded from the clock so
+    it never collides with a version that results were cached under before.
+    """
+    key = _data_version_key(customer_id)
+    try:
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, time.time_ns(), timeout=None)
+            version = cache.get(key)
+        return version
+    except Exception as e:
+        logger.warning(f"Cannot read triage data version for {customer_id}: {str(e)}")
+        return None
+
+
+def bump_data_version(customer_ids: Iterable[str]):
+    """
+    Invalidate cached triage results for the given customers. Called whenever
+    their transactions, cards or actions change.
+
+    Never raises: the change is already stored, and while the cache is down
+    there are no cached results to serve either.
+    """
+    for customer_id in set(customer_ids):
+        key = _data_version_key(customer_id)
+        try:
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, time.time_ns(), timeout=None)
+        except Exception as e:
+            logger.warning(f"Cannot bump triage data version for {customer_id}: {str(e)}")
+
+
+def normalize_message(user_message: Optional[str]) -> str:
+    """Case- and whitespace-insensitive form of the agent's message."""
+    return ' '.join((user_message or '').lower().split())
+
+
+class TriageResultCache:
+    """
+    Triage results keyed by customer, suspect transaction, message and the
+    customer's data version.
+
+    The version is read before the run starts and the result is stored under
+    that version, so a run that overlaps an ingest or action is never served
+    afterwards.
+    """
+
+    def key_for(self, customer_id: str, suspect_txn_id: str, user_message: Optional[str]) -> Optional[str]:
+        """Cache key for a triage, or None when result caching is disabled or unavailable."""
+        if not settings.TRIAGE_RESULT_CACHE_TTL:
+            return None
+        version = get_data_version(customer_id)
+        if version is None:
+            return None
+        message_hash = hashlib.sha256(normalize_message(user_message).encode('utf-8')).hexdigest()[:16]
+        return f"triage_result:{customer_id}:{suspect_txn_id}:{message_hash}:{version}"
+
+    def get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        if key is None:
+            return None
+        try:
+            return cache.get(key)
+        except Exception as e:
+            logger.warning(f"Cannot read cached triage result: {str(e)}")
+            return None
+
+    def set(self, key: Optional[str], execution_id: str, result: Dict[str, Any], trace: Dict[str, Any]):
+        """
+        Store a completed run. Degraded runs (fallbacks or an exhausted budget)
+        are not cached so the next request gets a chance at a full result.
+        """
+        if key is None:
+            return
+        if trace.get('budget_exhausted') or any(step.get('fallback_used') for step in trace.get('steps', [])):
+            return
+        try:
+            cache.set(key, {
+                'execution_id': execution_id,
+                'result': result
+            }, timeout=settings.TRIAGE_RESULT_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Cannot cache triage result: {str(e)}")
+
+    def lookup(self, customer_id: str, suspect_txn_id: str,
+               user_message: Optional[str]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """The cache key for a triage and its cached result, if any."""
+        key = self.key_for(customer_id, suspect_txn_id, user_message)
+        return key, self.get(key)
+
+    # Cache round trips block, so async callers run them on a worker thread;
+    # not thread-sensitive, so concurrent triages do not queue behind each other
+    async def alookup(self, customer_id: str, suspect_txn_id: str,
+                      user_message: Optional[str]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        if not settings.TRIAGE_RESULT_CACHE_TTL:
+            return None, None
+        return await sync_to_async(self.lookup, thread_sensitive=False)(customer_id, suspect_txn_id, user_message)
+
+    async def aset(self, key: Optional[str], execution_id: str, result: Dict[str, Any], trace: Dict[str, Any]):
+        if key is not None:
+            await sync_to_async(self.set, thread_sensitive=False)(key, execution_id, result, trace)
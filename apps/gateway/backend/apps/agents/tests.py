@@ -1,3 +1,604 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.conf import settings
+from django.test import AsyncClient, TestCase, override_settings
 
-# Create your tests here.
+from . import breakers, db, inspection, orchestrator as orchestrator_module, registry, result_cache, views
+from .breakers import CircuitBreaker
+from .inspection import build_decision, inspect_batch
+from .lru import LRUCache
+from .models import AgentExecution, RedactionPolicy
+from .orchestrator import AgentOrchestrator
+from .persistence import ExecutionRecorder
+from .planner import TRIAGE_PLAN
+from .redactor import PIIRedactor
+from .tools import DataLoader, get_loaders
+from .result_cache import TriageResultCache, bump_data_version, get_data_version
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TRIAGE_RESULT_CACHE_TTL=60)
+class DataVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_changes_result_key(self):
+        results = TriageResultCache()
+        before = results.key_for('cust_1', 'txn_1', 'Check this')
+        bump_data_version(['cust_1'])
+        self.assertNotEqual(results.key_for('cust_1', 'txn_1', 'check   THIS'), before)
+
+    def test_async_lookups_run_off_the_event_loop(self):
+        results = TriageResultCache()
+        threads = []
+        real_get = cache.get
+
+        def get(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return real_get(*args, **kwargs)
+
+        async def store_and_lookup():
+            key, cached = await results.alookup('cust_1', 'txn_1', 'Check this')
+            await results.aset(key, 'exec_1', {'decision': 'monitor'}, {'steps': []})
+            return cached, await results.alookup('cust_1', 'txn_1', 'check this'), threading.current_thread()
+
+        with mock.patch.object(result_cache.cache, 'get', side_effect=get):
+            first, (_, second), loop_thread = async_to_sync(store_and_lookup)()
+
+        self.assertIsNone(first)
+        self.assertEqual(second, {'execution_id': 'exec_1', 'result': {'decision': 'monitor'}})
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+    def test_cache_outage_disables_result_cache(self):
+        broken = mock.Mock(**{
+            'get.side_effect': ConnectionError('down'),
+            'incr.side_effect': ConnectionError('down'),
+            'set.side_effect': ConnectionError('down')
+        })
+        with mock.patch.object(result_cache, 'cache', broken):
+            bump_data_version(['cust_1'])
+            self.assertIsNone(get_data_version('cust_1'))
+            results = TriageResultCache()
+            key = results.key_for('cust_1', 'txn_1', None)
+            self.assertIsNone(key)
+            self.assertIsNone(results.get('triage_result:cust_1'))
+            results.set('triage_result:cust_1', 'exec_1', {}, {'steps': []})
+
+
+@override_settings(CACHES=LOCMEM_CACHE, CIRCUIT_BREAKER_THRESHOLD=2, CIRCUIT_BREAKER_TIMEOUT=30)
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker('getProfile')
+
+    def test_opens_at_threshold_and_closes_on_success(self):
+        self.assertEqual(self.breaker.allow_request(), (True, False))
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.allow_request(), (True, True))
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.allow_request(), (False, True))
+
+        self.breaker.record_success(True)
+        self.assertEqual(self.breaker.allow_request(), (True, False))
+
+    def test_success_without_recorded_state_skips_the_cache(self):
+        with mock.patch.object(breakers.cache, 'delete_many') as delete_many:
+            _, recorded = self.breaker.allow_request()
+            self.breaker.record_success(recorded)
+        delete_many.assert_not_called()
+
+    def test_cache_outage_counts_as_closed(self):
+        broken = mock.Mock(**{
+            'get_many.side_effect': ConnectionError('down'),
+            'add.side_effect': ConnectionError('down'),
+            'delete_many.side_effect': ConnectionError('down')
+        })
+        with mock.patch.object(breakers, 'cache', broken):
+            self.assertEqual(async_to_sync(self.breaker.aallow_request)(), (True, False))
+            async_to_sync(self.breaker.arecord_failure)()
+            async_to_sync(self.breaker.arecord_success)(True)
+
+
+class InspectBatchTests(TestCase):
+    def test_tenant_redactors_are_resolved_on_the_db_pool(self):
+        threads = []
+
+        def redactor_for(tenant_id):
+            threads.append((tenant_id, threading.current_thread().name))
+            return PIIRedactor()
+
+        async def inspect(items):
+            return [result async for result in inspect_batch(redactor_for, items)]
+
+        items = [{'request_id': f'r{n}', 'tenant_id': f't{n % 2}', 'text': 'mail a@b.com'} for n in range(5)]
+        items.append({'request_id': 'r5', 'tenant_id': ['t0'], 'text': 'x'})
+        with override_settings(INSPECT_BATCH_CHUNK_SIZE=2, INSPECT_BATCH_WORKERS=0):
+            results = async_to_sync(inspect)(items)
+
+        self.assertEqual([result['request_id'] for result in results], ['r0', 'r1', 'r2', 'r3', 'r4', 'r5'])
+        self.assertEqual(results[0]['action'], 'REDACT')
+        self.assertIn('error', results[5])
+        self.assertEqual(len(threads), 5)  # once per tenant and chunk
+        self.assertTrue(all(name.startswith('agent-db') for _, name in threads))
+
+
+@override_settings(PII_POLICY_REFRESH_INTERVAL=0, PII_SCAN_CACHE_SIZE=16)
+class TenantRedactorTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(registry, '_tenant_redactors', LRUCache(10))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_every_save_gets_a_new_redactor(self):
+        policy = RedactionPolicy.objects.create(tenant_id='t1', patterns={'ticket': r'TKT-\d+'})
+        first = registry.get_tenant_redactor('t1')
+        self.assertIn('ticket', first.patterns)
+        self.assertIs(registry.get_tenant_redactor('t1'), first)
+
+        # A concurrent save loaded before the first one: same starting version
+        stale = RedactionPolicy.objects.get(tenant_id='t1')
+        policy.replacements = {'ticket': '[T]'}
+        policy.save(update_fields=['replacements'])
+        second = registry.get_tenant_redactor('t1')
+        stale.patterns = {'case': r'CASE-\d+'}
+        stale.save()
+        third = registry.get_tenant_redactor('t1')
+        self.assertIsNot(second, first)
+        self.assertIsNot(third, second)
+        self.assertIn('case', third.patterns)
+
+    def test_recreated_policy_gets_a_new_redactor(self):
+        RedactionPolicy.objects.create(tenant_id='t1', patterns={'ticket': r'TKT-\d+'})
+        self.assertIn('ticket', registry.get_tenant_redactor('t1').patterns)
+
+        # Between two polls
+        RedactionPolicy.objects.filter(tenant_id='t1').delete()
+        RedactionPolicy.objects.create(tenant_id='t1', patterns={'order': r'ORD-\d+'})
+        redactor = registry.get_tenant_redactor('t1')
+        self.assertIn('order', redactor.patterns)
+        self.assertNotIn('ticket', redactor.patterns)
+
+        RedactionPolicy.objects.filter(tenant_id='t1').delete()
+        self.assertIs(registry.get_tenant_redactor('t1'), registry.get_redactor())
+
+    def test_tenant_redactors_use_the_scan_cache(self):
+        RedactionPolicy.objects.create(tenant_id='t1', patterns={'ticket': r'TKT-\d+'})
+        self.assertEqual(registry.get_tenant_redactor('t1').scan_cache.maxsize, 16)
+
+
+class DecisionCacheTests(TestCase):
+    def test_equal_payloads_share_an_entry(self):
+        cache = LRUCache(10)
+        redactor = PIIRedactor()
+        first = build_decision(redactor, 'r1', 't1', payload={'a': 'mail a@b.com', 'b': [1, 2]}, cache=cache)
+        second = build_decision(redactor, 'r2', 't1', payload={'b': [1, 2], 'a': 'mail a@b.com'}, cache=cache)
+
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+        self.assertEqual(second, {**first, 'request_id': 'r2'})
+
+    @override_settings(INSPECT_DECISION_CACHE_MAX_PAYLOAD=100)
+    def test_large_payloads_bypass_the_cache(self):
+        cache = LRUCache(10)
+        decision = build_decision(PIIRedactor(), 'r1', 't1', payload={'notes': ['x' * 60, 'a@b.com' * 10]}, cache=cache)
+
+        self.assertEqual(cache.stats()['size'], 0)
+        self.assertEqual(decision['action'], 'REDACT')
+
+
+class FakeTool:
+    def __init__(self, result=None, delay=0):
+        self.result = result or {}
+        self.delay = delay
+        self.calls = []
+
+    async def execute(self, context):
+        self.calls.append(context)
+        await asyncio.sleep(self.delay)
+        result = self.result(context) if callable(self.result) else self.result
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class FakeRecentTransactionsTool(FakeTool):
+    def __init__(self, suspects):
+        super().__init__({'transactions': []})
+        self.suspects = suspects
+        self.loads = []
+
+    async def load_suspect_transactions(self, customer_id, txn_ids):
+        self.loads.append((customer_id, sorted(txn_ids)))
+        if customer_id == 'cust_broken':
+            raise ConnectionError('database unavailable')
+        return {txn_id: self.suspects[txn_id] for txn_id in txn_ids if txn_id in self.suspects}
+
+
+def fake_orchestrator(suspects, decide_delay=None):
+    orchestrator = AgentOrchestrator()
+    risk = {'risk_score': 10, 'risk_level': 'low', 'risk_signals': []}
+    decide = FakeTool({'decision': 'monitor'})
+    if decide_delay:
+        async def execute(context):
+            await asyncio.sleep(decide_delay.get(context['suspect_txn_id'], 0))
+            return {'decision': 'monitor'}
+        decide.execute = execute
+    orchestrator.tools = {
+        'getProfile': FakeTool({'profile': {}}),
+        'getRecentTransactions': FakeRecentTransactionsTool(suspects),
+        'riskSignals': FakeTool(lambda context: dict(risk, txn=context['suspect_txn_id'])),
+        'decide': decide
+    }
+    return orchestrator
+
+
+@override_settings(AGENT_TIMEOUT=5, TOOL_TIMEOUT=5)
+class BatchTriageTests(TestCase):
+    suspects = {'txn_1': {'id': 'txn_1'}, 'txn_2': {'id': 'txn_2'}, 'txn_3': {'id': 'txn_3'}}
+
+    def run_batch(self, orchestrator, items):
+        async def collect():
+            return [result async for result in orchestrator.execute_batch_triage(items)]
+        return async_to_sync(collect)()
+
+    def test_context_is_loaded_once_per_customer(self):
+        orchestrator = fake_orchestrator(self.suspects)
+        items = [
+            {'customer_id': 'cust_1', 'suspect_txn_id': 'txn_1'},
+            {'customer_id': 'cust_2', 'suspect_txn_id': 'txn_3'},
+            {'customer_id': 'cust_1', 'suspect_txn_id': 'txn_2'}
+        ]
+        results = self.run_batch(orchestrator, items)
+
+        self.assertEqual(sorted(result['index'] for result in results), [0, 1, 2])
+        self.assertTrue(all(result['status'] == 'completed' for result in results))
+        self.assertEqual(len(orchestrator.tools['getProfile'].calls), 2)
+        self.assertEqual(
+            sorted(orchestrator.tools['getRecentTransactions'].loads),
+            [('cust_1', ['txn_1', 'txn_2']), ('cust_2', ['txn_3'])]
+        )
+        scored = {context['suspect_txn_id']: context for context in orchestrator.tools['riskSignals'].calls}
+        self.assertEqual(scored['txn_2']['getRecentTransactions_result']['suspect_transaction'], {'id': 'txn_2'})
+
+    def test_failures_only_fail_their_own_items(self):
+        orchestrator = fake_orchestrator(self.suspects)
+        items = [
+            {'customer_id': 'cust_1', 'suspect_txn_id': 'txn_1'},
+            {'customer_id': 'cust_1', 'suspect_txn_id': 'txn_missing'},
+            {'customer_id': 'cust_broken', 'suspect_txn_id': 'txn_2'},
+            {'customer_id': 'cust_broken', 'suspect_txn_id': 'txn_3'}
+        ]
+        results = {result['index']: result for result in self.run_batch(orchestrator, items)}
+
+        self.assertEqual(results[0]['status'], 'completed')
+        self.assertEqual(results[1], {
+            'index': 1, 'customerId': 'cust_1', 'suspectTxnId': 'txn_missing',
+            'status': 'failed', 'error': 'Transaction not found'
+        })
+        self.assertEqual([results[2]['error'], results[3]['error']], ['database unavailable'] * 2)
+
+    def test_cancelled_item_does_not_cancel_the_shared_context(self):
+        orchestrator = fake_orchestrator(self.suspects)
+
+        async def run():
+            context = asyncio.ensure_future(orchestrator._load_batch_context('cust_1', ['txn_1', 'txn_2']))
+            first = asyncio.ensure_future(
+                orchestrator._score_batch_item(0, {'customer_id': 'cust_1', 'suspect_txn_id': 'txn_1'}, context)
+            )
+            second = asyncio.ensure_future(
+                orchestrator._score_batch_item(1, {'customer_id': 'cust_1', 'suspect_txn_id': 'txn_2'}, context)
+            )
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second, first.cancelled(), context.cancelled()
+
+        result, first_cancelled, context_cancelled = async_to_sync(run)()
+        self.assertTrue(first_cancelled)
+        self.assertFalse(context_cancelled)
+        self.assertEqual(result['status'], 'completed')
+
+    def test_endpoint_streams_results_in_completion_order(self):
+        orchestrator = fake_orchestrator(self.suspects, decide_delay={'txn_1': 0.2})
+        body = {'items': [
+            {'customerId': 'cust_1', 'suspectTxnId': 'txn_1'},
+            {'customerId': 'cust_1', 'suspectTxnId': 'txn_2'},
+            {'customerId': 'cust_2', 'suspectTxnId': 'txn_missing'}
+        ]}
+
+        async def post():
+            response = await AsyncClient().post(
+                '/api/triage/batch', body, content_type='application/json', headers={'X-API-Key': settings.API_KEY}
+            )
+            lines = [chunk async for chunk in response.streaming_content]
+            return response, [json.loads(line) for line in b''.join(lines).splitlines()]
+
+        with mock.patch.object(views, 'get_orchestrator', return_value=orchestrator):
+            response, lines = async_to_sync(post)()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[-1]['index'], 0)
+        self.assertEqual({line['index']: line['status'] for line in lines}, {0: 'completed', 1: 'completed', 2: 'failed'})
+
+    def test_endpoint_rejects_invalid_items(self):
+        response = self.client.post(
+            '/api/triage/batch', {'items': [{'customerId': 'cust_1'}]},
+            content_type='application/json', HTTP_X_API_KEY=settings.API_KEY
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'items[0]: customerId and suspectTxnId are required'})
+
+
+class DataLoaderTests(TestCase):
+    def setUp(self):
+        self.batches = []
+
+    def batch_load(self, keys):
+        self.batches.append(sorted(keys))
+        if 'boom' in keys:
+            raise ConnectionError('database unavailable')
+        return {key: key.upper() for key in keys if key != 'missing'}
+
+    def test_lookups_in_one_tick_share_a_batch(self):
+        loader = DataLoader(self.batch_load)
+
+        async def run():
+            together = await asyncio.gather(loader.load('a'), loader.load('b'), loader.load('a'), loader.load('missing'))
+            later = await loader.load_many(['a'])
+            return together, later
+
+        together, later = async_to_sync(run)()
+        self.assertEqual(together, ['A', 'B', 'A', None])
+        self.assertEqual(later, ['A'])
+        self.assertEqual(self.batches, [['a', 'b', 'missing'], ['a']])  # nothing memoized
+
+    def test_failed_batch_fails_every_waiter_and_is_not_kept(self):
+        loader = DataLoader(self.batch_load)
+
+        async def run():
+            results = await asyncio.gather(loader.load('a'), loader.load('boom'), return_exceptions=True)
+            return results, loader._in_flight.copy()
+
+        results, in_flight = async_to_sync(run)()
+        self.assertTrue(all(isinstance(result, ConnectionError) for result in results))
+        self.assertEqual(in_flight, {})
+
+    def test_loaders_are_per_event_loop(self):
+        async def loaders_twice():
+            return get_loaders(), get_loaders()
+
+        def in_new_loop():
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(loaders_twice())
+            finally:
+                loop.close()
+
+        first, same_loop = in_new_loop()
+        second, _ = in_new_loop()
+        self.assertIs(first, same_loop)
+        self.assertIsNot(first, second)
+
+
+class RunDbTests(TestCase):
+    def test_calls_run_on_the_pool_after_closing_old_connections(self):
+        events = []
+
+        def query(value, scale=1):
+            events.append(('query', threading.current_thread().name))
+            return value * scale
+
+        with mock.patch.object(db, 'close_old_connections', side_effect=lambda: events.append(('close', None))):
+            result = async_to_sync(db.run_db)(query, 2, scale=3)
+
+        self.assertEqual(result, 6)
+        self.assertEqual(events[0], ('close', None))
+        self.assertEqual(events[1][0], 'query')
+        self.assertTrue(events[1][1].startswith('agent-db'))
+
+    def test_errors_reach_the_caller(self):
+        def query():
+            raise ValueError('bad query')
+
+        with self.assertRaisesMessage(ValueError, 'bad query'):
+            async_to_sync(db.run_db)(query)
+
+    def test_pool_is_shared_and_sized_from_settings(self):
+        with mock.patch.object(db, '_executor', None), override_settings(AGENT_DB_POOL_SIZE=3):
+            executor = db.get_executor()
+            self.assertIs(db.get_executor(), executor)
+            self.assertEqual(executor._max_workers, 3)
+        executor.shutdown()
+
+
+class FlakyTool:
+    def __init__(self, failures=0, delay=0, error_result=False):
+        self.failures = failures
+        self.delay = delay
+        self.error_result = error_result
+        self.calls = 0
+
+    async def execute(self, context):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.calls <= self.failures:
+            if self.error_result:
+                return {'error': 'database unavailable'}
+            raise ConnectionError('upstream unavailable')
+        return {'risk_score': 10}
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TOOL_TIMEOUT=5, MAX_RETRIES=2, RETRY_BACKOFF_BASE=0.01,
+                   CIRCUIT_BREAKER_THRESHOLD=100)
+class RunStepTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.orchestrator = AgentOrchestrator()
+        self.orchestrator.fallback_manager = mock.Mock(get_fallback=mock.AsyncMock(return_value={'fallback': True}))
+        self.recorder = ExecutionRecorder(AgentExecution())
+
+    def run_step(self, tool, budget):
+        self.orchestrator.tools['riskSignals'] = tool
+        now = time.monotonic()
+        with mock.patch.object(orchestrator_module, 'compact_inputs', return_value={}):
+            return async_to_sync(self.orchestrator._run_step)(
+                TRIAGE_PLAN, 'riskSignals', {}, self.recorder, now, now + budget
+            )
+
+    def test_attempt_is_bounded_by_the_remaining_budget(self):
+        tool = FlakyTool(delay=2)
+        started = time.monotonic()
+        result = self.run_step(tool, budget=0.1)
+
+        self.assertLess(time.monotonic() - started, 1)  # not TOOL_TIMEOUT
+        self.assertTrue(result['timed_out'])
+        self.assertEqual(result['fallback_result'], {'fallback': True})
+        self.assertEqual(self.recorder.tool_calls[0].status, 'TIMEOUT')
+
+    @override_settings(TOOL_TIMEOUT=0.05, MAX_RETRIES=0)
+    def test_attempt_is_bounded_by_tool_timeout(self):
+        result = self.run_step(FlakyTool(delay=2), budget=5)
+
+        self.assertEqual(result['status'], 'failed')
+        self.assertEqual(result['error'], 'Tool riskSignals timed out')
+
+    def test_failures_are_retried_with_jittered_backoff(self):
+        tool = FlakyTool(failures=2)
+        with mock.patch.object(orchestrator_module.random, 'uniform', return_value=0) as uniform:
+            result = self.run_step(tool, budget=5)
+
+        self.assertEqual(result['status'], 'completed')
+        self.assertEqual(result['retries'], 2)
+        self.assertEqual(tool.calls, 3)
+        self.assertEqual(uniform.call_args_list, [mock.call(0, 0.01), mock.call(0, 0.02)])
+
+    def test_error_results_are_retried_then_fall_back(self):
+        tool = FlakyTool(failures=5, error_result=True)
+        with mock.patch.object(orchestrator_module.random, 'uniform', return_value=0) as uniform:
+            result = self.run_step(tool, budget=5)
+
+        self.assertEqual((tool.calls, result['retries'], uniform.call_count), (3, 2, 3))
+        self.assertEqual(result['status'], 'failed')
+        self.assertTrue(result['fallback_used'])
+        self.assertEqual(result['fallback_result'], {'fallback': True})
+        self.orchestrator.fallback_manager.get_fallback.assert_awaited_once_with('riskSignals', {}, 'database unavailable')
+        self.assertEqual(self.recorder.tool_calls[0].status, 'FAILED')
+
+        tool = FlakyTool(failures=1, error_result=True)
+        with mock.patch.object(orchestrator_module.random, 'uniform', return_value=0):
+            result = self.run_step(tool, budget=5)
+        self.assertEqual((result['status'], result['retries']), ('completed', 1))
+
+    def test_retries_stop_at_max_retries(self):
+        tool = FlakyTool(failures=5)
+        result = self.run_step(tool, budget=5)
+
+        self.assertEqual(result['status'], 'failed')
+        self.assertEqual(result['error'], 'upstream unavailable')
+        self.assertEqual((tool.calls, result['retries']), (3, 2))
+
+    def test_no_retry_when_backoff_would_overrun_the_budget(self):
+        tool = FlakyTool(failures=1)
+        with mock.patch.object(orchestrator_module.random, 'uniform', return_value=1):
+            result = self.run_step(tool, budget=0.5)
+
+        self.assertEqual(result['status'], 'failed')
+        self.assertEqual((tool.calls, result['retries']), (1, 0))
+
+    @override_settings(MAX_RETRIES=0)
+    def test_error_results_count_as_breaker_failures(self):
+        with mock.patch.object(CircuitBreaker, 'arecord_failure') as record_failure, \
+                mock.patch.object(CircuitBreaker, 'arecord_success') as record_success:
+            result = self.run_step(FlakyTool(failures=1, error_result=True), budget=5)
+
+        self.assertEqual(result['status'], 'failed')
+        self.assertEqual(result['error'], 'database unavailable')
+        record_failure.assert_called_once_with()
+        record_success.assert_not_called()
+
+    def test_exhausted_budget_skips_the_tool(self):
+        tool = FlakyTool()
+        with mock.patch.object(CircuitBreaker, 'arecord_failure') as record_failure:
+            result = self.run_step(tool, budget=-1)
+
+        self.assertTrue(result['timed_out'])
+        self.assertEqual(tool.calls, 0)
+        record_failure.assert_not_called()
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class InspectSafetyBatchEndpointTests(TestCase):
+    items = [
+        {'request_id': 'r0', 'tenant_id': 't1', 'text': 'Card 4111 1111 1111 1111, mail jane@example.com'},
+        {'request_id': 'r1', 'tenant_id': 't1', 'text': 'nothing to see'},
+        {'request_id': 'r2', 'tenant_id': 't2', 'payload': {'contact': {'email': 'a@b.com'}, 'ids': ['1234 5678 9012']}},
+        {'request_id': 'r3', 'text': 'call 9876543210', 'payload': ['clean', {'k': 'jane@example.com'}]},
+        {'request_id': 'r4', 'tenant_id': 't2'}
+    ]
+
+    def setUp(self):
+        cache.clear()  # request rate limits
+
+    async def post(self, path, body, content_type='application/json'):
+        response = await AsyncClient().post(
+            path, body, content_type=content_type, headers={'X-API-Key': settings.API_KEY}
+        )
+        if response.streaming:
+            response.body = b''.join([chunk async for chunk in response.streaming_content])
+        else:
+            response.body = response.content
+        return response
+
+    def inspect_batch(self, body, content_type='application/json'):
+        response = async_to_sync(self.post)('/api/triage/inspect/batch', body, content_type)
+        return response, json.loads(response.body)
+
+    def test_batch_matches_single_inspection(self):
+        response, results = self.inspect_batch(self.items + ['not an item'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        expected = [async_to_sync(self.post)('/api/triage/inspect', item) for item in self.items]
+        self.assertTrue(all(single.status_code == 200 for single in expected))
+        self.assertEqual(results[:-1], [json.loads(single.body) for single in expected])
+        self.assertEqual([result['action'] for result in results[:-1]], ['REDACT', 'ALLOW', 'REDACT', 'REDACT', 'ALLOW'])
+        self.assertEqual(results[-1], {'request_id': None, 'error': 'item must be an object'})
+
+    @override_settings(INSPECT_BATCH_MAX_ITEMS=2)
+    def test_ndjson_body_is_streamed_and_truncated(self):
+        body = '\n'.join([json.dumps(self.items[0]), '{broken', '', json.dumps(self.items[1])])
+        response, results = self.inspect_batch(body, 'application/x-ndjson; charset=utf-8')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(results[0]['request_id'], 'r0')
+        self.assertEqual(results[1], {'request_id': None, 'error': 'item must be an object'})
+        self.assertEqual(results[2], {'request_id': None, 'error': 'Batch truncated at 2 items'})
+
+    @override_settings(INSPECT_BATCH_MAX_ITEMS=2)
+    def test_invalid_json_bodies_are_rejected(self):
+        response, error = self.inspect_batch({'items': self.items})
+        self.assertEqual((response.status_code, error), (400, {'error': 'Body must be a JSON array or NDJSON'}))
+
+        response, error = self.inspect_batch(self.items)
+        self.assertEqual((response.status_code, error), (400, {'error': 'At most 2 items per batch'}))
+
+    @override_settings(INSPECT_BATCH_WORKERS=1, INSPECT_BATCH_POOL_MIN_ITEMS=2, INSPECT_BATCH_CHUNK_SIZE=2)
+    def test_pool_path_matches_thread_path(self):
+        with override_settings(INSPECT_BATCH_WORKERS=0):
+            _, expected = self.inspect_batch(self.items * 3)
+
+        with mock.patch.object(inspection, '_pool', None):
+            response, results = self.inspect_batch(self.items * 3)
+            pool = inspection._pool
+        self.assertIsNotNone(pool)
+        pool.shutdown()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(results, expected)
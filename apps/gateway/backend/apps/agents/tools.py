@@ -2,25 +2,149 @@
 Agent Tools for Fraud Triage
 """
 
+import asyncio
 import logging
-from typing import Dict, Any, List
+import weakref
+from typing import Dict, Any, List, Callable, Hashable
 from datetime import datetime, timedelta
 from django.core.cache import cache
+from django.db.models import Count
 
 from apps.customers.models import Customer, Card, Device
 from apps.transactions.models import Transaction, Chargeback
 from apps.insights.models import KnowledgeBaseDocument
 from .redactor import PIIRedactor
-from asgiref.sync import sync_to_async
+from .db import run_db
 
 logger = logging.getLogger(__name__)
 
 
+def serialize_transaction(txn: Transaction) -> Dict[str, Any]:
+    """Transaction fields the risk and decision tools read."""
+    return {
+        'id': txn.id,
+        'merchant': txn.merchant,
+        'amount': txn.amount,
+        'mcc': txn.mcc,
+        'timestamp': txn.timestamp.isoformat(),
+        'device_id': txn.device_id,
+        'geo_country': txn.geo_country
+    }
+
+
+class DataLoader:
+    """
+    Coalesces key lookups issued within one event-loop tick into a single
+    batch call, and shares in-flight lookups for the same key.
+    
+    ``batch_load`` is a synchronous function taking a list of keys and
+    returning a dict of key -> value, run on the database pool; keys missing
+    from the dict load as None. Nothing is memoized once a batch resolves, so later lookups always
+    see fresh data.
+    """
+    
+    def __init__(self, batch_load: Callable[[List[Hashable]], Dict[Hashable, Any]]):
+        self.batch_load = batch_load
+        self._in_flight = {}
+        self._queued = {}
+    
+    async def load(self, key: Hashable) -> Any:
+        future = self._in_flight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._in_flight[key] = future
+            self._queued[key] = future
+            if len(self._queued) == 1:
+                # Dispatch after every coroutine runnable in this tick has queued its keys
+                loop.call_soon(self._dispatch)
+        return await asyncio.shield(future)
+    
+    async def load_many(self, keys: List[Hashable]) -> List[Any]:
+        return await asyncio.gather(*(self.load(key) for key in keys))
+    
+    def _dispatch(self):
+        batch, self._queued = self._queued, {}
+        asyncio.ensure_future(self._run_batch(batch))
+    
+    async def _run_batch(self, batch: Dict[Hashable, asyncio.Future]):
+        try:
+            results = await run_db(self.batch_load, list(batch))
+            for key, future in batch.items():
+                if not future.done():
+                    future.set_result(results.get(key))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for key in batch:
+                self._in_flight.pop(key, None)
+
+
+def _load_customers(customer_ids):
+    return Customer.objects.in_bulk(customer_ids)
+
+
+def _load_cards(customer_ids):
+    cards = {customer_id: [] for customer_id in customer_ids}
+    for card in Card.objects.filter(customer_id__in=customer_ids):
+        cards[card.customer_id].append(card)
+    return cards
+
+
+def _load_devices(customer_ids):
+    devices = {customer_id: [] for customer_id in customer_ids}
+    for device in Device.objects.filter(customer_id__in=customer_ids):
+        devices[device.customer_id].append(device)
+    return devices
+
+
+def _load_recent_chargeback_counts(customer_ids):
+    counts = {customer_id: 0 for customer_id in customer_ids}
+    rows = Chargeback.objects.filter(
+        customer_id__in=customer_ids,
+        created_at__gte=datetime.now() - timedelta(days=365)
+    ).values('customer_id').annotate(count=Count('id'))
+    for row in rows:
+        counts[row['customer_id']] = row['count']
+    return counts
+
+
+def _load_transactions(txn_ids):
+    return Transaction.objects.in_bulk(txn_ids)
+
+
+class Loaders:
+    """The set of loaders shared by every tool running on one event loop."""
+    
+    def __init__(self):
+        self.customers = DataLoader(_load_customers)
+        self.cards_by_customer = DataLoader(_load_cards)
+        self.devices_by_customer = DataLoader(_load_devices)
+        self.chargeback_counts = DataLoader(_load_recent_chargeback_counts)
+        self.transactions = DataLoader(_load_transactions)
+
+
+_loaders_by_loop = weakref.WeakKeyDictionary()
+
+
+def get_loaders() -> Loaders:
+    """
+    Loaders for the running event loop (futures cannot cross loops).
+    """
+    loop = asyncio.get_running_loop()
+    loaders = _loaders_by_loop.get(loop)
+    if loaders is None:
+        loaders = _loaders_by_loop[loop] = Loaders()
+    return loaders
+
+
 class BaseTool:
     """Base class for all agent tools."""
     
-    def __init__(self):
-        self.redactor = PIIRedactor()
+    def __init__(self, redactor: PIIRedactor = None):
+        self.redactor = redactor or PIIRedactor()
     
     async def execute(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """Execute the tool with given context."""
@@ -34,15 +158,16 @@ class GetProfileTool(BaseTool):
         customer_id = context['customer_id']
         
         try:
-            customer = await sync_to_async(Customer.objects.get)(id=customer_id)
-            cards = await sync_to_async(list)(Card.objects.filter(customer=customer))
-            devices = await sync_to_async(list)(Device.objects.filter(customer=customer))
-            
-            # Get recent chargebacks
-            recent_chargebacks = await sync_to_async(Chargeback.objects.filter(
-                customer=customer,
-                created_at__gte=datetime.now() - timedelta(days=365)
-            ).count)()
+            # Issued together so concurrent triages share one query per lookup
+            loaders = get_loaders()
+            customer, cards, devices, recent_chargebacks = await asyncio.gather(
+                loaders.customers.load(customer_id),
+                loaders.cards_by_customer.load(customer_id),
+                loaders.devices_by_customer.load(customer_id),
+                loaders.chargeback_counts.load(customer_id)
+            )
+            if customer is None:
+                raise Customer.DoesNotExist
             
             profile = {
                 'customer_id': customer.id,
@@ -91,7 +216,7 @@ class GetRecentTransactionsTool(BaseTool):
             end_date = datetime.now()
             start_date = end_date - timedelta(days=30)
             
-            transactions = await sync_to_async(list)(Transaction.objects.filter(
+            transactions = await run_db(list, Transaction.objects.filter(
                 customer_id=customer_id,
                 timestamp__gte=start_date,
                 timestamp__lte=end_date
@@ -100,25 +225,11 @@ class GetRecentTransactionsTool(BaseTool):
             # Get suspect transaction if provided
             suspect_transaction = None
             if suspect_txn_id:
-                try:
-                    suspect_transaction = await sync_to_async(Transaction.objects.get)(
-                        id=suspect_txn_id,
-                        customer_id=customer_id
-                    )
-                except Transaction.DoesNotExist:
-                    pass
-            
-            transaction_data = []
-            for txn in transactions:
-                transaction_data.append({
-                    'id': txn.id,
-                    'merchant': txn.merchant,
-                    'amount': txn.amount,
-                    'mcc': txn.mcc,
-                    'timestamp': txn.timestamp.isoformat(),
-                    'device_id': txn.device_id,
-                    'geo_country': txn.geo_country
-                })
+                suspect_transaction = await get_loaders().transactions.load(suspect_txn_id)
+                if suspect_transaction and suspect_transaction.customer_id != customer_id:
+                    suspect_transaction = None
+            
+            transaction_data = [serialize_transaction(txn) for txn in transactions]
             
             result = {
                 'recent_transactions': transaction_data,
@@ -126,21 +237,24 @@ class GetRecentTransactionsTool(BaseTool):
             }
             
             if suspect_transaction:
-                result['suspect_transaction'] = {
-                    'id': suspect_transaction.id,
-                    'merchant': suspect_transaction.merchant,
-                    'amount': suspect_transaction.amount,
-                    'mcc': suspect_transaction.mcc,
-                    'timestamp': suspect_transaction.timestamp.isoformat(),
-                    'device_id': suspect_transaction.device_id,
-                    'geo_country': suspect_transaction.geo_country
-                }
+                result['suspect_transaction'] = serialize_transaction(suspect_transaction)
             
             return result
             
         except Exception as e:
             logger.error(f"Error in GetRecentTransactionsTool: {str(e)}")
             return {'error': str(e)}
+    
+    async def load_suspect_transactions(self, customer_id: str, txn_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch several of a customer's transactions in one query, keyed by id.
+        """
+        transactions = await get_loaders().transactions.load_many(txn_ids)
+        return {
+            txn.id: serialize_transaction(txn)
+            for txn in transactions
+            if txn is not None and txn.customer_id == customer_id
+        }
 
 
 class RiskSignalsTool(BaseTool):
@@ -310,21 +424,14 @@ class KBLookupTool(BaseTool):
                 elif signal['signal'] == 'geo_anomaly':
                     search_terms.append('travel')
             
-            # Search knowledge base
+            # Search knowledge base, one query per term in parallel
             kb_results = []
             if search_terms:
-                for term in search_terms:
-                    docs = KnowledgeBaseDocument.objects.filter(
-                        content__icontains=term
-                    )[:3]  # Limit to 3 results per term
-                    
-                    for doc in docs:
-                        kb_results.append({
-                            'doc_id': doc.id,
-                            'title': doc.title,
-                            'anchor': doc.anchor,
-                            'extract': doc.content[:200] + '...' if len(doc.content) > 200 else doc.content
-                        })
+                results_per_term = await asyncio.gather(*(
+                    run_db(self._search, term) for term in search_terms
+                ))
+                for results in results_per_term:
+                    kb_results.extend(results)
             
             return {
                 'kb_results': kb_results,
@@ -334,6 +441,21 @@ class KBLookupTool(BaseTool):
         except Exception as e:
             logger.error(f"Error in KBLookupTool: {str(e)}")
             return {'error': str(e)}
+    
+    def _search(self, term: str) -> List[Dict[str, Any]]:
+        docs = KnowledgeBaseDocument.objects.filter(
+            content__icontains=term
+        )[:3]  # Limit to 3 results per term
+        
+        return [
+            {
+                'doc_id': doc.id,
+                'title': doc.title,
+                'anchor': doc.anchor,
+                'extract': doc.content[:200] + '...' if len(doc.content) > 200 else doc.content
+            }
+            for doc in docs
+        ]
 
 
 class DecideTool(BaseTool):
@@ -443,7 +565,7 @@ class ProposeActionTool(BaseTool):
                 if transaction_id:
                     try:
                         from apps.transactions.models import Transaction
-                        transaction = await sync_to_async(Transaction.objects.get)(id=transaction_id)
+                        transaction = await run_db(Transaction.objects.get, id=transaction_id)
                         
                         # Update transaction status based on action
                         if action == 'FREEZE_CARD':
@@ -457,7 +579,7 @@ class ProposeActionTool(BaseTool):
                         else:
                             transaction.status = 'COMPLETED'
                         
-                        await sync_to_async(transaction.save)()
+                        await run_db(transaction.save)
                         logger.info(f"Updated transaction {transaction_id} status to {transaction.status}")
                         
                     except Transaction.DoesNotExist:
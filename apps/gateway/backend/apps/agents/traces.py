@@ -0,0 +1,72 @@
+"""
+Compact Trace Encoding
+"""
+
+import json
+import zlib
+from typing import Dict, List, Any, Optional
+
+from .planner import ExecutionPlan
+
+REF_KEY = '$ref'
+
+
+def compact_inputs(plan: ExecutionPlan, tool_name: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the stored input for a tool call: only the keys the step declares,
+    with upstream results replaced by a reference to the producing step.
+    """
+    inputs = {}
+    for key in plan.steps[tool_name].inputs:
+        producer = plan.producers.get(key)
+        if producer:
+            inputs[key] = {REF_KEY: producer}
+        else:
+            inputs[key] = context.get(key)
+    return inputs
+
+
+def resolve_inputs(input_data: Dict[str, Any], outputs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Expand references in a stored tool-call input using the outputs of the
+    producing steps (tool name -> output).
+    """
+    resolved = {}
+    for key, value in (input_data or {}).items():
+        if isinstance(value, dict) and set(value) == {REF_KEY}:
+            resolved[key] = outputs.get(value[REF_KEY])
+        else:
+            resolved[key] = value
+    return resolved
+
+
+def encode_trace(trace: Dict[str, Any], compression: Optional[str]) -> Optional[bytes]:
+    """
+    Serialize a trace into a compressed blob, or return None when compression
+    is disabled.
+    """
+    if not compression:
+        return None
+    if compression != 'zlib':
+        raise ValueError(f"Unsupported trace compression: {compression}")
+    payload = json.dumps(trace, separators=(',', ':'), default=str).encode('utf-8')
+    return zlib.compress(payload)
+
+
+def decode_trace(blob: bytes, compression: str) -> Dict[str, Any]:
+    """Inverse of ``encode_trace``."""
+    if compression != 'zlib':
+        raise ValueError(f"Unsupported trace compression: {compression}")
+    return json.loads(zlib.decompress(bytes(blob)).decode('utf-8'))
+
+
+def expand_tool_calls(tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Rebuild the full per-call view (inputs with references resolved) from
+    stored tool-call rows given as dicts with tool_name/input_data/output_data.
+    """
+    outputs = {call['tool_name']: call['output_data'] for call in tool_calls}
+    return [
+        dict(call, input_data=resolve_inputs(call['input_data'], outputs))
+        for call in tool_calls
+    ]
@@ -2,23 +2,23 @@ from rest_framework.decorators import api_view, permission_classes, authenticati
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.http import StreamingHttpResponse
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
 import json
-import asyncio
 import logging
-from .orchestrator import AgentOrchestrator
 from .models import AgentExecution
-from .redactor import PIIRedactor
+from .registry import get_orchestrator, get_tenant_redactor
+from .inspection import build_decision, inspect_batch, get_decision_cache
+from .traces import decode_trace, expand_tool_calls
 from apps.core.authentication import APIKeyAuthentication
-from agentguard_contracts.decision import Decision, DecisionAction, Redaction as RedactionModel
+from apps.core.decorators import async_api_view
+from apps.core.renderers import dumps
 
 logger = logging.getLogger(__name__)
 
 
-@api_view(['POST'])
-@authentication_classes([APIKeyAuthentication])
-@permission_classes([IsAuthenticated])
-def triage_fraud(request):
+@async_api_view(['POST'])
+async def triage_fraud(request):
     """
     Start fraud triage process with streaming updates.
     """
@@ -28,40 +28,27 @@ def triage_fraud(request):
         user_message = request.data.get('userMessage', '')
         
         if not customer_id or not suspect_txn_id:
-            return Response(
+            return JsonResponse(
                 {'error': 'customerId and suspectTxnId are required'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create orchestrator and start execution
-        orchestrator = AgentOrchestrator()
-        
-        # Run async execution
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        # Shared orchestrator, run on the server's event loop
+        orchestrator = get_orchestrator()
+        result = await orchestrator.execute_triage(customer_id, suspect_txn_id, user_message)
         
-        try:
-            result = loop.run_until_complete(
-                orchestrator.execute_triage(customer_id, suspect_txn_id, user_message)
-            )
-            
-            return Response(result)
-            
-        finally:
-            loop.close()
+        return JsonResponse(result)
         
     except Exception as e:
         logger.error(f"Error in triage_fraud: {str(e)}")
-        return Response(
+        return JsonResponse(
             {'error': 'Internal server error'}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
 
-@api_view(['POST'])
-@authentication_classes([APIKeyAuthentication])
-@permission_classes([IsAuthenticated])
-def triage_fraud_stream(request):
+@async_api_view(['POST'])
+async def triage_fraud_stream(request):
     """
     Start fraud triage process with Server-Sent Events streaming.
     """
@@ -71,40 +58,24 @@ def triage_fraud_stream(request):
         user_message = request.data.get('userMessage', '')
         
         if not customer_id or not suspect_txn_id:
-            return Response(
+            return JsonResponse(
                 {'error': 'customerId and suspectTxnId are required'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        def event_stream():
+        async def event_stream():
             """Generate SSE events for triage progress."""
             try:
                 # Send initial event
                 yield f"data: {json.dumps({'event': 'plan_built', 'message': 'Starting fraud triage analysis'})}\n\n"
                 
-                # Create orchestrator
-                orchestrator = AgentOrchestrator()
+                orchestrator = get_orchestrator()
                 
-                # Run async execution with progress updates
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-                try:
-                    # Execute the async generator
-                    async_gen = orchestrator.execute_triage_with_progress(
-                        customer_id, suspect_txn_id, user_message, event_stream
-                    )
-                    
-                    # Consume the async generator using asyncio
-                    while True:
-                        try:
-                            event = loop.run_until_complete(async_gen.__anext__())
-                            yield event
-                        except StopAsyncIteration:
-                            break
-                    
-                finally:
-                    loop.close()
+                # Relay progress events as the orchestrator produces them
+                async for event in orchestrator.execute_triage_with_progress(
+                    customer_id, suspect_txn_id, user_message, event_stream
+                ):
+                    yield event
                     
             except Exception as e:
                 logger.error(f"Error in event_stream: {str(e)}")
@@ -122,7 +93,62 @@ def triage_fraud_stream(request):
         
     except Exception as e:
         logger.error(f"Error in triage_fraud_stream: {str(e)}")
-        return Response(
+        return JsonResponse(
+            {'error': 'Internal server error'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@async_api_view(['POST'])
+async def triage_batch(request):
+    """
+    Score many suspect transactions in one call.
+    Results are streamed as NDJSON, one line per item in completion order;
+    each line carries the item's index in the request.
+    """
+    try:
+        raw_items = request.data.get('items')
+        
+        if not isinstance(raw_items, list) or not raw_items:
+            return JsonResponse(
+                {'error': 'items must be a non-empty list'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if len(raw_items) > settings.TRIAGE_BATCH_MAX_ITEMS:
+            return JsonResponse(
+                {'error': f'At most {settings.TRIAGE_BATCH_MAX_ITEMS} items per batch'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        items = []
+        for index, raw_item in enumerate(raw_items):
+            if not isinstance(raw_item, dict) or not raw_item.get('customerId') or not raw_item.get('suspectTxnId'):
+                return JsonResponse(
+                    {'error': f'items[{index}]: customerId and suspectTxnId are required'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            items.append({
+                'customer_id': raw_item['customerId'],
+                'suspect_txn_id': raw_item['suspectTxnId'],
+                'user_message': raw_item.get('userMessage', '')
+            })
+        
+        async def result_stream():
+            async for result in get_orchestrator().execute_batch_triage(items):
+                yield json.dumps(result) + '\n'
+        
+        response = StreamingHttpResponse(
+            result_stream(),
+            content_type='application/x-ndjson'
+        )
+        response['Cache-Control'] = 'no-cache'
+        
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error in triage_batch: {str(e)}")
+        return JsonResponse(
             {'error': 'Internal server error'}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
@@ -167,14 +193,27 @@ def get_execution_status(request, execution_id):
 def get_execution_trace(request, execution_id):
     """
     Get detailed trace of agent execution.
+    Compressed traces are decoded and tool-call input references are
+    resolved against the producing step's output.
     """
     try:
         execution = AgentExecution.objects.get(id=execution_id)
         
+        if execution.trace_encoding:
+            trace = decode_trace(execution.trace_blob, execution.trace_encoding)
+        else:
+            trace = execution.trace
+        
+        tool_calls = list(execution.tool_calls.order_by('started_at').values(
+            'tool_name', 'status', 'input_data', 'output_data',
+            'error_message', 'duration_ms'
+        ))
+        
         return Response({
             'execution_id': execution.id,
-            'trace': execution.trace,
-            'plan': execution.plan
+            'trace': trace,
+            'plan': execution.plan,
+            'tool_calls': expand_tool_calls(tool_calls)
         })
         
     except AgentExecution.DoesNotExist:
@@ -204,48 +243,88 @@ def inspect_safety(request):
         text = request.data.get('text')
         payload = request.data.get('payload')
         
-        redactor = PIIRedactor()
-        findings = []
-        redactions = []
-        action = DecisionAction.ALLOW
-        
-        if text:
-            # Detect PII
-            detected_types = redactor.get_pii_types(text)
-            if detected_types:
-                action = DecisionAction.REDACT
-                for pii_type in detected_types:
-                    pattern = redactor.patterns[pii_type]
-                    for match in pattern.finditer(text):
-                        redactions.append(
-                            RedactionModel(
-                                type=pii_type,
-                                replacement=redactor.replacements[pii_type],
-                                start=match.start(),
-                                end=match.end()
-                            )
-                        )
-                findings.append(f"PII detected: {', '.join(detected_types)}")
-
-        # Build decision
-        decision_dict = {
-            "request_id": request_id,
-            "tenant_id": tenant_id,
-            "action": action,
-            "reasons": findings,
-            "redactions": [r.model_dump() for r in redactions],
-            "allowed_tools": [],
-            "requires_approval": False
-        }
-        
-        # Validate against Pydantic contract
-        validated_decision = Decision.model_validate(decision_dict)
-        
-        return Response(validated_decision.model_dump())
+        decision = build_decision(get_tenant_redactor(tenant_id), request_id, tenant_id, text, payload, cache=get_decision_cache())
+        
+        return Response(decision)
         
     except Exception as e:
         logger.error(f"Error in inspect_safety: {str(e)}")
         return Response(
             {'error': 'Safety inspection failed', 'details': str(e)}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+
+def _read_ndjson(request, max_items: int, state: dict):
+    """
+    Parse an NDJSON body line by line; unparseable lines yield None. Stops
+    after ``max_items`` and sets ``state['truncated']``.
+    """
+    count = 0
+    for line in request:
+        line = line.strip()
+        if not line:
+            continue
+        if count >= max_items:
+            state['truncated'] = True
+            return
+        count += 1
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+@async_api_view(['POST'])
+async def inspect_safety_batch(request):
+    """
+    Inspect many items ({request_id, tenant_id, text, payload}) in one call.
+    Accepts a JSON array or an NDJSON body and streams back a JSON array of
+    Decisions in input order; items that cannot be inspected get an
+    {request_id, error} entry instead.
+    """
+    try:
+        max_items = settings.INSPECT_BATCH_MAX_ITEMS
+        state = {'truncated': False}
+        
+        if request.content_type.startswith('application/x-ndjson'):
+            items = _read_ndjson(request._request, max_items, state)
+        else:
+            items = request.data
+            if not isinstance(items, list):
+                return JsonResponse(
+                    {'error': 'Body must be a JSON array or NDJSON'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if len(items) > max_items:
+                return JsonResponse(
+                    {'error': f'At most {max_items} items per batch'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        async def decision_stream():
+            yield b'['
+            first = True
+            async for result in inspect_batch(get_tenant_redactor, items):
+                yield (b'' if first else b',') + dumps(result)
+                first = False
+            if state['truncated']:
+                yield (b'' if first else b',') + dumps({
+                    'request_id': None,
+                    'error': f'Batch truncated at {max_items} items'
+                })
+            yield b']'
+        
+        response = StreamingHttpResponse(
+            decision_stream(),
+            content_type='application/json'
+        )
+        response['Cache-Control'] = 'no-cache'
+        
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error in inspect_safety_batch: {str(e)}")
+        return JsonResponse(
+            {'error': 'Internal server error'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
@@ -0,0 +1,90 @@
+"""
+Async counterpart of DRF's @api_view for views served over ASGI.
+"""
+
+import functools
+import logging
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import MethodNotAllowed
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose request handling steps are driven by ``async_api_view``
+    rather than ``dispatch``.
+    """
+
+    @property
+    def allowed_methods(self):
+        return [method.upper() for method in self.http_method_names]
+
+    def perform_content_negotiation(self, request, force=False):
+        # Async views stream their own content types (SSE, NDJSON); an Accept
+        # header no renderer matches must not turn them into a 406
+        return super().perform_content_negotiation(request, force=True)
+
+
+def async_api_view(http_method_names):
+    """
+    Wrap an ``async def`` view so it runs through the same steps as an
+    ``@api_view``: a DRF ``Request`` (parsed ``request.data``), authentication,
+    permissions, throttling, content negotiation, and errors (including
+    ``APIException`` raised by the view) turned into responses by the
+    configured EXCEPTION_HANDLER. DRF 3.14 dispatches views synchronously, so
+    ``@api_view`` cannot be used for coroutines.
+
+    Stack ``@authentication_classes``, ``@permission_classes`` and
+    ``@throttle_classes`` under it as with ``@api_view``. The view returns a
+    DRF ``Response`` or a Django ``HttpResponse`` (``JsonResponse`` or
+    ``StreamingHttpResponse``).
+    """
+    allowed = [method.lower() for method in http_method_names]
+
+    def decorator(view):
+        view_class = type(view.__name__, (AsyncAPIView,), {
+            'http_method_names': allowed,
+            'authentication_classes': getattr(view, 'authentication_classes', APIView.authentication_classes),
+            'permission_classes': getattr(view, 'permission_classes', APIView.permission_classes),
+            'throttle_classes': getattr(view, 'throttle_classes', APIView.throttle_classes),
+            '__doc__': view.__doc__,
+        })
+
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            instance = view_class()
+            instance.args = args
+            instance.kwargs = kwargs
+            instance.headers = instance.default_response_headers
+            request = instance.initialize_request(request, *args, **kwargs)
+            instance.request = request
+
+            try:
+                # Throttles keep their history in the cache: run them off the
+                # event loop. API key authentication and IsAuthenticated only
+                # look at the request and settings.
+                if instance.throttle_classes:
+                    await sync_to_async(instance.initial, thread_sensitive=False)(request, *args, **kwargs)
+                else:
+                    instance.initial(request, *args, **kwargs)
+                if request.method.lower() not in allowed:
+                    raise MethodNotAllowed(request.method)
+                response = await view(request, *args, **kwargs)
+            except Exception as exc:
+                response = instance.handle_exception(exc)
+
+            response = instance.finalize_response(request, response, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                # Rendered here rather than by Django's handler on a sync thread
+                response = response.render()
+            return response
+
+        # Django 4.2's csrf_exempt wraps coroutines in a sync function, so set
+        # the flag directly (DRF views are CSRF exempt in the same way).
+        wrapper.csrf_exempt = True
+        wrapper.cls = view_class
+        return wrapper
+
+    return decorator
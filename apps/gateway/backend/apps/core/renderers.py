@@ -0,0 +1,34 @@
+"""
+Fast JSON rendering.
+"""
+
+import orjson
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import JSONRenderer
+
+_encoder = JSONEncoder()
+
+# Datetimes go through DRF's encoder so they keep its format ('Z' for UTC)
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def dumps(data) -> bytes:
+    """
+    Serialize to compact UTF-8 JSON with orjson; types it does not know
+    (Decimal, lazy strings, querysets, ...) fall back to DRF's encoder.
+    """
+    return orjson.dumps(data, default=_encoder.default, option=_OPTIONS)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    DRF JSONRenderer on orjson. Indented output (``; indent=`` in the Accept
+    header) is still rendered by DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
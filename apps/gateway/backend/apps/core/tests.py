@@ -1,3 +1,84 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework.decorators import throttle_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
 
-# Create your tests here.
+from .decorators import async_api_view
+
+
+class OncePerTest(BaseThrottle):
+    calls = 0
+
+    def allow_request(self, request, view):
+        OncePerTest.calls += 1
+        return OncePerTest.calls == 1
+
+    def wait(self):
+        return 5
+
+
+@async_api_view(['POST'])
+async def echo(request):
+    if 'fail' in request.data:
+        raise ValidationError({'fail': ['asked to fail']})
+    return Response({'echo': request.data, 'role': request.user.role})
+
+
+@async_api_view(['POST'])
+@throttle_classes([OncePerTest])
+async def throttled(request):
+    return Response({'ok': True})
+
+
+def custom_exception_handler(exc, context):
+    return Response({'error': type(exc).__name__, 'view': context['view'].__class__.__name__}, status=418)
+
+
+class AsyncApiViewTests(SimpleTestCase):
+    def call(self, view, data=None, method='post', **headers):
+        request = getattr(RequestFactory(), method)('/', data or {}, content_type='application/json', **headers)
+        return async_to_sync(view)(request)
+
+    def test_authenticated_request_gets_parsed_data_and_rendered_response(self):
+        response = self.call(echo, {'a': 1}, HTTP_X_API_KEY=settings.API_KEY)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'echo': {'a': 1}, 'role': 'agent'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_missing_or_invalid_api_key_is_rejected(self):
+        response = self.call(echo)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'X-API-Key')
+
+        response = self.call(echo, HTTP_X_API_KEY='wrong')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(str(response.data['detail']), 'Invalid API key')
+
+    def test_api_exceptions_and_wrong_methods_become_error_responses(self):
+        response = self.call(echo, {'fail': True}, HTTP_X_API_KEY=settings.API_KEY)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'fail': ['asked to fail']})
+
+        response = self.call(echo, method='get', HTTP_X_API_KEY=settings.API_KEY)
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response['Allow'], 'POST')
+
+    def test_configured_exception_handler_is_used(self):
+        rest_framework = {**settings.REST_FRAMEWORK, 'EXCEPTION_HANDLER': f'{__name__}.custom_exception_handler'}
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            response = self.call(echo)
+
+        self.assertEqual(response.status_code, 418)
+        self.assertEqual(response.data, {'error': 'NotAuthenticated', 'view': 'echo'})
+
+    def test_throttles_are_applied(self):
+        OncePerTest.calls = 0
+        self.assertEqual(self.call(throttled, HTTP_X_API_KEY=settings.API_KEY).status_code, 200)
+
+        response = self.call(throttled, HTTP_X_API_KEY=settings.API_KEY)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '5')
@@ -10,6 +10,9 @@ from apps.core.authentication import APIKeyAuthentication
 from rest_framework.permissions import IsAuthenticated
 from apps.transactions.models import Transaction
 from apps.actions.models import Action
+from apps.agents.redactor import prefilter_stats
+from apps.agents.registry import get_redactor
+from apps.agents.inspection import get_decision_cache
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +66,19 @@ def metrics(request):
             labels_str = ','.join([f'{k}="{v}"' for k, v in metric.labels.items()])
             metrics_data.append(f'{metric.name}{{{labels_str}}} {metric.value}')
         
+        # PII prefilter effectiveness (this process)
+        for (pii_type, result), count in sorted(prefilter_stats.snapshot().items()):
+            metrics_data.append(f'pii_prefilter_total{{pattern="{pii_type}",result="{result}"}} {count}')
+        
+        # Redaction / inspection caches (this process)
+        for cache_name, lru in (('scan', get_redactor().scan_cache), ('decision', get_decision_cache())):
+            if lru is None:
+                continue
+            cache_stats = lru.stats()
+            metrics_data.append(f'pii_cache_total{{cache="{cache_name}",result="hit"}} {cache_stats["hits"]}')
+            metrics_data.append(f'pii_cache_total{{cache="{cache_name}",result="miss"}} {cache_stats["misses"]}')
+            metrics_data.append(f'pii_cache_size{{cache="{cache_name}"}} {cache_stats["size"]}')
+        
         # Add some mock metrics for demonstration
         metrics_data.extend([
             'agent_latency_ms_bucket{le="100"} 45',
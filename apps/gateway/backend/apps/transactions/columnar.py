@@ -0,0 +1,363 @@
+"""
+Columnar Transaction Ingest and Export
+
+Parquet files and Arrow IPC streams are read a record batch at a time. Each
+batch is validated and converted a whole column at a time with Arrow compute
+(amounts to minor units, ISO timestamps, geo decimals, MCC codes) and the
+converted rows go to the same batch writer as CSV and JSON uploads. Exports
+use the same schema, so an export can be ingested again as-is.
+"""
+
+import io
+import itertools
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Union
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from django.conf import settings
+
+from .ingest import CURRENCIES, InvalidRow, _amount, _coordinate, _timestamp
+from .models import Transaction
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_TYPE = pa.timestamp('us', tz='UTC')
+COORDINATE_TYPE = pa.decimal128(10, 6)
+
+# Column names match the CSV upload format
+TRANSACTION_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('customerId', pa.string()),
+    ('cardId', pa.string()),
+    ('deviceId', pa.string()),
+    ('mcc', pa.string()),
+    ('merchant', pa.string()),
+    ('amount', pa.int64()),  # minor units (paise/cents)
+    ('currency', pa.string()),
+    ('ts', TIMESTAMP_TYPE),
+    ('geo_lat', COORDINATE_TYPE),
+    ('geo_lon', COORDINATE_TYPE),
+    ('geo_country', pa.string()),
+])
+
+# Model fields in TRANSACTION_SCHEMA order
+MODEL_FIELDS = [
+    'id', 'customer_id', 'card_id', 'device_id', 'mcc', 'merchant', 'amount',
+    'currency', 'timestamp', 'geo_lat', 'geo_lon', 'geo_country'
+]
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+EXPORT_FORMATS = {
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+
+class _BatchErrors:
+    """The first reason each row of a record batch is invalid."""
+
+    def __init__(self, num_rows: int):
+        self.reasons = [None] * num_rows
+
+    def set(self, index: int, reason: str):
+        if self.reasons[index] is None:
+            self.reasons[index] = reason
+
+    def add(self, mask: pa.Array, reason: Union[str, Callable[[int], str]]):
+        """Mark the rows where ``mask`` is true (null counts as false)."""
+        for index in pc.indices_nonzero(mask).to_pylist():
+            if self.reasons[index] is None:
+                self.reasons[index] = reason(index) if callable(reason) else reason
+
+
+def _column(batch: pa.RecordBatch, *names: str) -> pa.Array:
+    """The first of ``names`` present in the batch, or an all-null column."""
+    for name in names:
+        index = batch.schema.get_field_index(name)
+        if index >= 0:
+            return batch.column(index)
+    return pa.nulls(batch.num_rows)
+
+
+def _geo_column(batch: pa.RecordBatch, key: str) -> pa.Array:
+    """Flat ``geo_<key>`` column, or the ``key`` field of a ``geo`` struct column."""
+    index = batch.schema.get_field_index('geo')
+    if index >= 0 and pa.types.is_struct(batch.schema.field(index).type):
+        geo = batch.column(index)
+        if geo.type.get_field_index(key) >= 0:
+            return geo.field(key)
+    return _column(batch, f"geo_{key}")
+
+
+def _convert_each(column: pa.Array, convert: Callable[[Any], Any], type: pa.DataType,
+                  errors: _BatchErrors) -> pa.Array:
+    """Convert value by value with the row ingest helpers; for columns a cast rejected."""
+    values = []
+    for index, value in enumerate(column.to_pylist()):
+        try:
+            values.append(None if value is None else convert(value))
+        except InvalidRow as e:
+            errors.set(index, str(e))
+            values.append(None)
+    return pa.array(values, type)
+
+
+def _text_column(column: pa.Array, name: str, max_length: int, errors: _BatchErrors,
+                 default: Optional[str] = None, required: bool = False) -> pa.Array:
+    if pa.types.is_integer(column.type) or pa.types.is_null(column.type):
+        column = pc.cast(column, pa.string())
+    elif not (pa.types.is_string(column.type) or pa.types.is_large_string(column.type)):
+        errors.add(pc.invert(pc.is_null(column)), f"{name} must be a string")
+        column = pa.nulls(len(column), pa.string())
+
+    missing = pc.or_kleene(pc.is_null(column), pc.equal(column, ''))
+    if required:
+        errors.add(missing, f"missing {name}")
+    errors.add(pc.greater(pc.utf8_length(column), max_length), f"{name} longer than {max_length} characters")
+    if default is not None:
+        column = pc.if_else(missing, default, column)
+    return column
+
+
+def _amount_column(column: pa.Array, errors: _BatchErrors) -> pa.Array:
+    """
+    Integer, float and string amounts are minor units, as in CSV and JSON.
+    Decimal columns hold major units (rupees, dollars) and are scaled to
+    minor units; fractions of a paisa/cent are rejected.
+    """
+    if pa.types.is_decimal(column.type):
+        try:
+            return pc.cast(pc.multiply(column, pa.scalar(Decimal(100), pa.decimal128(3, 0))), pa.int64())
+        except pa.ArrowInvalid:
+            return _convert_each(column, lambda value: _amount(value * 100), pa.int64(), errors)
+
+    if not (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)
+            or pa.types.is_string(column.type) or pa.types.is_null(column.type)):
+        errors.add(pc.invert(pc.is_null(column)), f"invalid amount type {column.type}")
+        return pa.nulls(len(column), pa.int64())
+    try:
+        return pc.cast(column, pa.int64())
+    except pa.ArrowInvalid:
+        # Fractional, non-numeric or out of range somewhere in the column
+        return _convert_each(column, _amount, pa.int64(), errors)
+
+
+def _timestamp_column(column: pa.Array, errors: _BatchErrors) -> pa.Array:
+    """Timestamp columns (naive ones are taken as UTC) or ISO 8601 strings."""
+    if pa.types.is_timestamp(column.type):
+        return pc.cast(column, TIMESTAMP_TYPE, safe=False)
+    if pa.types.is_null(column.type):
+        return pa.nulls(len(column), TIMESTAMP_TYPE)
+    if not pa.types.is_string(column.type):
+        errors.add(pc.invert(pc.is_null(column)), f"invalid ts type {column.type}")
+        return pa.nulls(len(column), TIMESTAMP_TYPE)
+    try:
+        return pc.cast(column, TIMESTAMP_TYPE)
+    except pa.ArrowInvalid:
+        # Unparseable, or without a zone offset (which the row path reads as UTC)
+        return _convert_each(column, _timestamp, TIMESTAMP_TYPE, errors)
+
+
+def _coordinate_column(column: pa.Array, limit: int, name: str, errors: _BatchErrors) -> pa.Array:
+    if pa.types.is_null(column.type):
+        return pa.nulls(len(column), COORDINATE_TYPE)
+    if pa.types.is_floating(column.type):
+        column = pc.round(column, 6)
+        out_of_range = pc.or_(pc.is_nan(column), pc.greater(pc.abs(column), limit))
+        errors.add(out_of_range, lambda index: f"{name} out of range: {column[index].as_py()!r}")
+        return pc.cast(pc.if_else(out_of_range, None, column), COORDINATE_TYPE, safe=False)
+    try:
+        coordinates = pc.cast(column, COORDINATE_TYPE)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return _convert_each(column, lambda value: _coordinate(value, limit, name), COORDINATE_TYPE, errors)
+    out_of_range = pc.greater(pc.abs(pc.cast(coordinates, pa.float64())), limit)
+    errors.add(out_of_range, lambda index: f"{name} out of range: {column[index].as_py()!r}")
+    return coordinates
+
+
+def _mcc_column(column: pa.Array, errors: _BatchErrors) -> pa.Array:
+    """String codes as given; integer codes are zero-padded to four digits."""
+    if pa.types.is_integer(column.type):
+        errors.add(pc.or_(pc.less(column, 0), pc.greater(column, 9999)),
+                   lambda index: f"invalid mcc {column[index].as_py()!r}")
+        column = pc.utf8_lpad(pc.cast(column, pa.string()), width=4, padding='0')
+    return _text_column(column, 'mcc', 10, errors, default='5999')
+
+
+def _to_list(column: pa.Array) -> list:
+    """
+    Python values of a converted column, going through NumPy, which is several
+    times faster than ``to_pylist()``. Nulls in the integer and timestamp
+    columns only occur in rows already marked invalid, so they are filled.
+    """
+    if pa.types.is_timestamp(column.type):
+        micros = pc.fill_null(pc.cast(column, pa.int64()), 0).to_numpy().tolist()
+        return [EPOCH + timedelta(microseconds=us) for us in micros]
+    if pa.types.is_integer(column.type):
+        return pc.fill_null(column, 0).to_numpy().tolist()
+    return column.to_numpy(zero_copy_only=False).tolist()
+
+
+def batch_to_rows(batch: pa.RecordBatch) -> List[Any]:
+    """
+    Validate and convert a record batch to model field values: one dict per
+    row, or an InvalidRow for a row that cannot be stored. Columns are found
+    by their API/CSV names; geo may also be a struct column.
+    """
+    errors = _BatchErrors(batch.num_rows)
+
+    currency = _text_column(_column(batch, 'currency'), 'currency', 3, errors, default='INR')
+    errors.add(
+        pc.invert(pc.is_in(currency, value_set=pa.array(sorted(CURRENCIES)))),
+        lambda index: f"unsupported currency {currency[index].as_py()!r}"
+    )
+    columns = [
+        _text_column(_column(batch, 'id'), 'id', 50, errors, required=True),
+        _text_column(_column(batch, 'customerId'), 'customerId', 50, errors, required=True),
+        _text_column(_column(batch, 'cardId'), 'cardId', 50, errors, required=True),
+        _text_column(_column(batch, 'deviceId'), 'deviceId', 50, errors),
+        _mcc_column(_column(batch, 'mcc'), errors),
+        _text_column(_column(batch, 'merchant'), 'merchant', 255, errors, default='Unknown'),
+        _amount_column(_column(batch, 'amount'), errors),
+        currency,
+        _timestamp_column(_column(batch, 'ts', 'timestamp'), errors),
+        _coordinate_column(_geo_column(batch, 'lat'), 90, 'geo.lat', errors),
+        _coordinate_column(_geo_column(batch, 'lon'), 180, 'geo.lon', errors),
+        _text_column(_geo_column(batch, 'country'), 'country', 3, errors, default='IN'),
+    ]
+    errors.add(pc.is_null(columns[6]), "missing amount")
+    errors.add(pc.is_null(columns[8]), "missing ts")
+
+    rows = []
+    for index, values in enumerate(zip(*(_to_list(column) for column in columns))):
+        reason = errors.reasons[index]
+        rows.append(InvalidRow(reason) if reason else dict(zip(MODEL_FIELDS, values)))
+    return rows
+
+
+def converted_row(row: Any) -> dict:
+    """``normalize`` step for rows from ``batch_to_rows``, which are already converted."""
+    if isinstance(row, InvalidRow):
+        raise row
+    return row
+
+
+def _slices(batch: pa.RecordBatch, size: int) -> Iterator[pa.RecordBatch]:
+    for offset in range(0, batch.num_rows, size):
+        yield batch.slice(offset, size)
+
+
+def iter_parquet_rows(file, batch_size: Optional[int] = None) -> Iterator[Any]:
+    """
+    Converted rows of a Parquet file (path or seekable binary file), read one
+    record batch at a time. Raises pyarrow.ArrowInvalid for a malformed file.
+    """
+    parquet = pq.ParquetFile(file)
+    for batch in parquet.iter_batches(batch_size=batch_size or settings.INGEST_BATCH_SIZE):
+        yield from batch_to_rows(batch)
+
+
+class _ReadStream(io.RawIOBase):
+    """File object over anything with ``read(n)``, such as a request body."""
+
+    def __init__(self, source):
+        self.source = source
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.source.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def iter_arrow_rows(stream, batch_size: Optional[int] = None) -> Iterator[Any]:
+    """
+    Converted rows of an Arrow IPC stream (binary stream with ``read``, such
+    as a request body). Large record batches are converted in slices.
+    """
+    for batch in pa.ipc.open_stream(_ReadStream(stream)):
+        for piece in _slices(batch, batch_size or settings.INGEST_BATCH_SIZE):
+            yield from batch_to_rows(piece)
+
+
+def export_queryset(customer_id: Optional[str] = None, start: Optional[datetime] = None,
+                    end: Optional[datetime] = None):
+    """A customer's transactions and/or those in [start, end], oldest first."""
+    queryset = Transaction.objects.all()
+    if customer_id:
+        queryset = queryset.filter(customer_id=customer_id)
+    if start:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end:
+        queryset = queryset.filter(timestamp__lte=end)
+    return queryset.order_by('timestamp', 'id')
+
+
+def iter_export_batches(queryset, batch_size: Optional[int] = None) -> Iterator[pa.RecordBatch]:
+    """Record batches in TRANSACTION_SCHEMA, built from one database chunk at a time."""
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    rows = queryset.values_list(*MODEL_FIELDS).iterator(chunk_size=batch_size)
+    while True:
+        chunk = list(itertools.islice(rows, batch_size))
+        if not chunk:
+            return
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(values, field.type) for values, field in zip(zip(*chunk), TRANSACTION_SCHEMA)],
+            schema=TRANSACTION_SCHEMA
+        )
+
+
+class _ChunkSink:
+    """Write-only file object whose output is handed out as it is produced."""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_export(batches: Iterable[pa.RecordBatch], format: str = 'parquet') -> Iterator[bytes]:
+    """
+    Encode record batches as Parquet (one row group per batch) or an Arrow IPC
+    stream, yielding bytes as each batch is written.
+    """
+    sink = _ChunkSink()
+    if format == 'parquet':
+        writer = pq.ParquetWriter(sink, TRANSACTION_SCHEMA)
+    else:
+        writer = pa.ipc.new_stream(sink, TRANSACTION_SCHEMA)
+    for batch in batches:
+        writer.write_batch(batch)
+        yield sink.take()
+    writer.close()
+    yield sink.take()
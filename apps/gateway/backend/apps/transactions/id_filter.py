@@ -0,0 +1,249 @@
+"""
+Known Transaction Ids
+
+A Bloom filter of the transaction ids already stored. At ingest, ids the
+filter has never seen are definitely new and skip the existence query; only
+possible hits are confirmed with one ``id__in`` query per batch.
+
+The filter should not miss a stored id, so it is rebuilt from the database
+when there is no usable saved copy, and caught up from ``created_at`` on load
+and every INGEST_ID_FILTER_REFRESH_INTERVAL seconds (for ids written by other
+processes). ``created_at`` is stamped when a batch is inserted, not when it
+commits, so each catch-up goes back INGEST_ID_FILTER_COMMIT_MARGIN seconds,
+which must exceed the longest batch transaction (``commit_batch`` warns when
+one takes longer). An id missed anyway is caught by the insert's unique key
+and added then. Ids that are deleted, or added by a batch that rolls back,
+only cost a false positive.
+
+Loading and saving run on a background thread: until the filter is loaded
+every id is a possible member, i.e. ingest checks them all with the query.
+"""
+
+import atexit
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Iterable, Optional, Set
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Max
+
+from .models import Transaction
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('<8sQQQq')
+_MAGIC = b'AGIDBLM1'
+_unpack_digest = struct.Struct('<QQ').unpack
+
+
+class BloomFilter:
+    """Bit array sized for ``capacity`` keys at ``error_rate`` false positives."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    # Double hashing: the k positions are h1 + i*h2 from one 128-bit digest.
+    # Both methods are written out in full; they run for every id ingested.
+
+    def add(self, key: str) -> bool:
+        """Set the key's bits; False when they were all set already."""
+        h1, h2 = _unpack_digest(hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest())
+        h2 |= 1
+        bits, size = self.bits, self.size
+        added = False
+        for _ in range(self.hashes):
+            position = h1 % size
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+            h1 += h2
+        self.count += added
+        return added
+
+    def __contains__(self, key: str) -> bool:
+        h1, h2 = _unpack_digest(hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest())
+        h2 |= 1
+        bits, size = self.bits, self.size
+        for _ in range(self.hashes):
+            position = h1 % size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+            h1 += h2
+        return True
+
+
+class KnownTransactionIds:
+    """
+    Process-wide filter of stored transaction ids, saved to ``path`` (kept in
+    memory only when None). Safe to share between threads.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, path: Optional[str] = None,
+                 refresh_interval: float = 5, save_interval: float = 300, commit_margin: float = 60):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.save_interval = save_interval
+        self.commit_margin = timedelta(seconds=commit_margin)
+        self.filter = BloomFilter(capacity, error_rate)
+        self.watermark = None  # created_at of the newest id added from the database
+        self.loaded = threading.Event()
+        self._lock = threading.Lock()
+        self._refreshed_at = 0.0
+        self._dirty = False
+        self._warned_full = False
+
+    def load(self):
+        """Load the saved filter and catch up, or rebuild it from the database."""
+        if not self._load_file():
+            self.rebuild()
+        self.refresh()
+        self.loaded.set()
+
+    def start(self):
+        """Load on a daemon thread, then save every ``save_interval`` seconds."""
+        thread = threading.Thread(target=self._run, name='transaction-id-filter', daemon=True)
+        thread.start()
+
+    def _run(self):
+        try:
+            self.load()
+        except Exception as e:
+            # Ingest keeps checking every id with the existence query
+            logger.error(f"Cannot load transaction id filter: {str(e)}")
+            return
+        finally:
+            close_old_connections()
+        while True:
+            time.sleep(self.save_interval)
+            self.save()
+
+    def _load_file(self) -> bool:
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'rb') as f:
+                magic, size, hashes, count, watermark = _HEADER.unpack(f.read(_HEADER.size))
+                bits = bytearray(f.read())
+        except (OSError, struct.error) as e:
+            logger.warning(f"Cannot read transaction id filter {self.path}: {str(e)}")
+            return False
+        if magic != _MAGIC or size != self.filter.size or hashes != self.filter.hashes or len(bits) != len(self.filter.bits):
+            logger.info("Transaction id filter was saved with other settings, rebuilding")
+            return False
+        self.filter.bits = bits
+        self.filter.count = count
+        self.watermark = datetime.fromtimestamp(watermark / 1e6, dt_timezone.utc) if watermark else None
+        return True
+
+    def rebuild(self):
+        """Add every stored id; a few seconds per million transactions."""
+        started = time.monotonic()
+        self.filter = BloomFilter(self.capacity, self.error_rate)
+        self.watermark = None
+        self._add_from(Transaction.objects.all())
+        self._dirty = True
+        logger.info(
+            f"Rebuilt transaction id filter from {self.filter.count} ids in {time.monotonic() - started:.1f}s"
+        )
+
+    def _add_from(self, queryset):
+        # Read the newest created_at first: anything committed later with an
+        # older stamp is still inside the next catch-up's margin
+        watermark = queryset.aggregate(newest=Max('created_at'))['newest']
+        with self._lock:
+            for txn_id in queryset.values_list('id', flat=True).iterator(chunk_size=10000):
+                self.filter.add(txn_id)
+            if watermark is not None and (self.watermark is None or watermark > self.watermark):
+                self.watermark = watermark
+
+    def refresh(self):
+        """Add ids stored since the watermark, e.g. by other server processes."""
+        self._refreshed_at = time.monotonic()
+        if self.watermark is None:
+            queryset = Transaction.objects.all()
+        else:
+            queryset = Transaction.objects.filter(created_at__gte=self.watermark - self.commit_margin)
+        self._add_from(queryset)
+
+    def possible_members(self, ids: Iterable[str]) -> Set[str]:
+        """The ids that may already be stored; the others are definitely new."""
+        if not self.loaded.is_set():
+            return set(ids)
+        if time.monotonic() - self._refreshed_at > self.refresh_interval:
+            self.refresh()
+        with self._lock:
+            return {txn_id for txn_id in ids if txn_id in self.filter}
+
+    def add(self, ids: Iterable[str]):
+        """Record ids about to be stored (before their batch commits)."""
+        with self._lock:
+            for txn_id in ids:
+                self.filter.add(txn_id)
+            self._dirty = True
+            if self.filter.count > self.capacity and not self._warned_full:
+                self._warned_full = True
+                logger.warning(
+                    f"Transaction id filter holds {self.filter.count} ids, over its capacity of "
+                    f"{self.capacity}; raise INGEST_ID_FILTER_CAPACITY to keep false positives low"
+                )
+
+    def save(self):
+        """Write the filter to ``path``, under a temporary name first."""
+        if not self.path or not self._dirty or not self.loaded.is_set():
+            return
+        with self._lock:
+            watermark = int(self.watermark.timestamp() * 1e6) if self.watermark else 0
+            header = _HEADER.pack(_MAGIC, self.filter.size, self.filter.hashes, self.filter.count, watermark)
+            bits = bytes(self.filter.bits)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            partial_path = f"{self.path}.{os.getpid()}.part"
+            with open(partial_path, 'wb') as f:
+                f.write(header)
+                f.write(bits)
+            os.replace(partial_path, self.path)
+        except OSError as e:
+            logger.warning(f"Cannot save transaction id filter {self.path}: {str(e)}")
+
+
+_known_ids = None
+_known_ids_lock = threading.Lock()
+
+
+def get_known_ids() -> Optional[KnownTransactionIds]:
+    """
+    The process-wide filter of stored transaction ids (None when
+    INGEST_ID_FILTER_CAPACITY is 0). The first call starts loading it in the
+    background.
+    """
+    global _known_ids
+    if not settings.INGEST_ID_FILTER_CAPACITY:
+        return None
+    if _known_ids is None:
+        with _known_ids_lock:
+            if _known_ids is None:
+                known_ids = KnownTransactionIds(
+                    capacity=settings.INGEST_ID_FILTER_CAPACITY,
+                    error_rate=settings.INGEST_ID_FILTER_ERROR_RATE,
+                    path=str(settings.INGEST_ID_FILTER_PATH) if settings.INGEST_ID_FILTER_PATH else None,
+                    refresh_interval=settings.INGEST_ID_FILTER_REFRESH_INTERVAL,
+                    save_interval=settings.INGEST_ID_FILTER_SAVE_INTERVAL,
+                    commit_margin=settings.INGEST_ID_FILTER_COMMIT_MARGIN
+                )
+                known_ids.start()
+                atexit.register(known_ids.save)
+                _known_ids = known_ids
+    return _known_ids
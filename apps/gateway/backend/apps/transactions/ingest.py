@@ -0,0 +1,434 @@
+"""
+Bulk Transaction Ingest
+
+Rows are validated one by one, then written a batch at a time: existing
+transactions, customers, cards and devices are resolved with one ``id__in``
+query each, and whatever is missing is inserted with ``bulk_create``. A batch
+costs a handful of queries however many rows it holds.
+
+Each batch commits on its own, so write locks are only held for one batch; a
+batch the database rejects is rolled back and retried row by row.
+
+Transaction ids are first checked against a Bloom filter of stored ids
+(``id_filter``): only possible hits go to the existence query, so a batch of
+new transactions skips it.
+"""
+
+import csv
+import io
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Any, List, Optional, Callable, Iterable, Iterator, Tuple
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+
+from .id_filter import get_known_ids
+from .models import Transaction
+from apps.customers.models import Customer, Card, Device
+
+logger = logging.getLogger(__name__)
+
+CURRENCIES = {code for code, _ in Transaction.CURRENCY_CHOICES}
+
+
+class InvalidRow(ValueError):
+    """A row that cannot be stored as a transaction."""
+
+
+class IngestReport:
+    """
+    Outcome of an ingest: rows accepted (inserted), skipped (transaction id
+    already stored or repeated in the upload) and invalid, with the reason for
+    the first ``max_errors`` invalid rows, plus how long its batches took.
+    """
+
+    def __init__(self, max_errors: int = 100):
+        self.rows = 0
+        self.accepted = 0
+        self.skipped = 0
+        self.invalid = 0
+        self.errors = []
+        self.max_errors = max_errors
+        self.changed_customers = set()
+        self.batches = {'count': 0, 'retried': 0, 'totalSeconds': 0.0, 'maxSeconds': 0.0, 'lastSeconds': None}
+
+    def add_invalid(self, row_number: int, txn_id: Optional[str], reason: str):
+        self.invalid += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row_number, 'id': txn_id, 'error': reason})
+
+    def merge(self, other: 'IngestReport'):
+        """Add the row outcomes of ``other`` (one batch or row) to this report."""
+        self.accepted += other.accepted
+        self.skipped += other.skipped
+        self.invalid += other.invalid
+        self.errors.extend(other.errors[:self.max_errors - len(self.errors)])
+        self.changed_customers.update(other.changed_customers)
+
+    def add_batch(self, seconds: float, retried: bool = False):
+        seconds = round(seconds, 4)
+        self.batches['count'] += 1
+        self.batches['retried'] += int(retried)
+        self.batches['totalSeconds'] = round(self.batches['totalSeconds'] + seconds, 4)
+        self.batches['maxSeconds'] = max(self.batches['maxSeconds'], seconds)
+        self.batches['lastSeconds'] = seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'accepted': self.accepted,
+            'skipped': self.skipped,
+            'invalid': self.invalid,
+            'errors': self.errors,
+            'errorsTruncated': self.invalid > len(self.errors),
+            'batches': self.batches,
+        }
+
+
+def _text(row: Dict[str, Any], key: str, max_length: int, default: Optional[str] = None,
+          required: bool = False) -> Optional[str]:
+    value = row.get(key)
+    if value is None or value == '':
+        if required:
+            raise InvalidRow(f"missing {key}")
+        return default
+    if not isinstance(value, str):
+        raise InvalidRow(f"{key} must be a string")
+    if len(value) > max_length:
+        raise InvalidRow(f"{key} longer than {max_length} characters")
+    return value
+
+
+def _amount(value: Any) -> int:
+    """
+    Minor units (paise/cents); whole numbers only. A fractional amount is
+    invalid: the column is an integer and would silently truncate it.
+    """
+    if isinstance(value, bool) or value is None or value == '':
+        raise InvalidRow("missing amount")
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise InvalidRow(f"invalid amount {value!r}")
+    if not amount.is_finite() or amount != amount.to_integral_value():
+        raise InvalidRow(f"amount must be a whole number of minor units, got {value!r}")
+    return int(amount)
+
+
+def _timestamp(value: Any) -> datetime:
+    if not isinstance(value, str) or not value:
+        raise InvalidRow("missing ts")
+    try:
+        timestamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise InvalidRow(f"invalid ts {value!r}")
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=dt_timezone.utc)
+    return timestamp
+
+
+def _coordinate(value: Any, limit: int, name: str) -> Optional[Decimal]:
+    if value is None or value == '':
+        return None
+    try:
+        coordinate = Decimal(str(value)).quantize(Decimal('0.000001'))
+    except InvalidOperation:
+        raise InvalidRow(f"invalid {name} {value!r}")
+    if not coordinate.is_finite() or abs(coordinate) > limit:
+        raise InvalidRow(f"{name} out of range: {value!r}")
+    return coordinate
+
+
+def normalize_row(row: Any) -> Dict[str, Any]:
+    """
+    Validate one uploaded transaction (API field names) and convert it to
+    model field values. Raises InvalidRow.
+    """
+    if isinstance(row, InvalidRow):
+        # A row the reader could not parse
+        raise row
+    if not isinstance(row, dict):
+        raise InvalidRow("row must be an object")
+
+    geo = row.get('geo') or {}
+    if not isinstance(geo, dict):
+        raise InvalidRow("geo must be an object")
+
+    currency = _text(row, 'currency', 3, default='INR')
+    if currency not in CURRENCIES:
+        raise InvalidRow(f"unsupported currency {currency!r}")
+
+    return {
+        'id': _text(row, 'id', 50, required=True),
+        'customer_id': _text(row, 'customerId', 50, required=True),
+        'card_id': _text(row, 'cardId', 50, required=True),
+        'device_id': _text(row, 'deviceId', 50),
+        'mcc': _text(row, 'mcc', 10, default='5999'),
+        'merchant': _text(row, 'merchant', 255, default='Unknown'),
+        'amount': _amount(row.get('amount')),
+        'currency': currency,
+        # Fixtures and the generator use 'ts'; older clients send 'timestamp'
+        'timestamp': _timestamp(row.get('ts') or row.get('timestamp')),
+        'geo_lat': _coordinate(geo.get('lat'), 90, 'geo.lat'),
+        'geo_lon': _coordinate(geo.get('lon'), 180, 'geo.lon'),
+        'geo_country': _text(geo, 'country', 3, default='IN'),
+    }
+
+
+def csv_row_to_transaction(row: Dict[str, str]) -> Dict[str, Any]:
+    """Map a CSV upload row (flat geo_* columns) to the API row format."""
+    return {
+        'id': row.get('id') or f"txn_{uuid.uuid4().hex[:8]}",
+        'customerId': row.get('customerId'),
+        'cardId': row.get('cardId'),
+        'deviceId': row.get('deviceId'),
+        'mcc': row.get('mcc'),
+        'merchant': row.get('merchant'),
+        'amount': row.get('amount'),
+        'currency': row.get('currency'),
+        'ts': row.get('ts') or row.get('timestamp'),
+        'geo': {
+            'lat': row.get('geo_lat'),
+            'lon': row.get('geo_lon'),
+            'country': row.get('geo_country'),
+        }
+    }
+
+
+def iter_csv_rows(file) -> Iterator[Dict[str, Any]]:
+    """
+    Rows of a CSV upload (binary file object), decoded as they are read.
+    Raises UnicodeDecodeError or csv.Error for a malformed file.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+    for row in reader:
+        yield csv_row_to_transaction(row)
+
+
+def iter_ndjson_rows(stream, max_line_bytes: int = 64 * 1024) -> Iterator[Any]:
+    """
+    Rows of an NDJSON body (binary stream with ``readline``), one line at a
+    time. Blank lines are ignored; unparseable or overlong lines are yielded
+    as InvalidRow so they are reported with their row number.
+    """
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        if len(line) > max_line_bytes and not line.endswith(b'\n'):
+            # Discard the rest of the line without holding it
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line_bytes)
+            yield InvalidRow(f"line longer than {max_line_bytes} bytes")
+            continue
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield InvalidRow(f"invalid JSON: {e}")
+
+
+def _existing_ids(model, ids: Iterable[str]) -> set:
+    return set(model.objects.filter(id__in=set(ids)).values_list('id', flat=True))
+
+
+def _insert_new(transactions: List[Transaction]) -> List[Transaction]:
+    """
+    Insert transactions whose ids were checked as new and return the ones
+    actually inserted. An id stored after all (a concurrent ingest of the same
+    id, or an id the known-id filter missed) makes the insert fail under its
+    savepoint; those rows are dropped and the rest inserted again.
+    """
+    while transactions:
+        try:
+            with transaction.atomic():
+                Transaction.objects.bulk_create(transactions)
+            return transactions
+        except IntegrityError:
+            stored = _existing_ids(Transaction, (txn.id for txn in transactions))
+            if not stored:
+                raise
+            logger.info(f"{len(stored)} transaction ids were stored while checking for duplicates, skipping them")
+            transactions = [txn for txn in transactions if txn.id not in stored]
+    return transactions
+
+
+def iter_batches(rows: Iterable[Any], batch_size: int, start: int = 1) -> Iterator[List[Tuple[int, Any]]]:
+    """Group rows into lists of (row_number, row), numbering from ``start``."""
+    batch = []
+    for row_number, row in enumerate(rows, start=start):
+        batch.append((row_number, row))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ingest_batch(batch: List[Tuple[int, Any]], report: IngestReport,
+                 normalize: Callable[[Any], Dict[str, Any]] = normalize_row):
+    """
+    Store one batch of (row_number, raw row) and add its outcome to
+    ``report``. ``normalize`` validates a raw row into model field values. Run it inside a transaction so the entities it creates and
+    the transactions referencing them are written together; ``commit_batch``
+    does that and handles a batch the database rejects.
+
+    A row whose transaction id is already stored is skipped whichever
+    customer it names (the id is the primary key), and a row using a card that
+    belongs to another customer is invalid rather than linked to that card.
+    """
+    rows = []
+    seen = set()
+    for row_number, raw in batch:
+        try:
+            values = normalize(raw)
+        except InvalidRow as e:
+            report.add_invalid(row_number, raw.get('id') if isinstance(raw, dict) else None, str(e))
+            continue
+        if values['id'] in seen:
+            report.skipped += 1
+            continue
+        seen.add(values['id'])
+        rows.append((row_number, values))
+
+    if not rows:
+        return
+
+    known_ids = get_known_ids()
+    candidates = seen if known_ids is None else known_ids.possible_members(seen)
+    existing = _existing_ids(Transaction, candidates) if candidates else set()
+    rows = [(row_number, values) for row_number, values in rows if values['id'] not in existing]
+    report.skipped += len(existing)
+    if not rows:
+        return
+
+    # Customers: referenced ones that do not exist yet get a placeholder
+    customer_ids = {values['customer_id'] for _, values in rows}
+    missing = customer_ids - _existing_ids(Customer, customer_ids)
+    Customer.objects.bulk_create([
+        Customer(
+            id=customer_id,
+            name=f"Customer {customer_id}",
+            email_masked=f"c***@{customer_id[:3]}***.com",
+            risk_flags=[]
+        )
+        for customer_id in missing
+    ], ignore_conflicts=True)
+
+    # Cards: a new card belongs to the customer of the first row using it
+    card_owners = dict(
+        Card.objects.filter(id__in={values['card_id'] for _, values in rows}).values_list('id', 'customer_id')
+    )
+    new_cards = {}
+    for _, values in rows:
+        if values['card_id'] not in card_owners and values['card_id'] not in new_cards:
+            new_cards[values['card_id']] = Card(
+                id=values['card_id'],
+                customer_id=values['customer_id'],
+                last4='0000',
+                status='ACTIVE',
+                network='VISA'
+            )
+    Card.objects.bulk_create(new_cards.values(), ignore_conflicts=True)
+    card_owners.update({card_id: card.customer_id for card_id, card in new_cards.items()})
+
+    device_ids = {values['device_id'] for _, values in rows if values['device_id']}
+    missing = {}
+    if device_ids:
+        existing_devices = _existing_ids(Device, device_ids)
+        for _, values in rows:
+            device_id = values['device_id']
+            if device_id and device_id not in existing_devices and device_id not in missing:
+                missing[device_id] = Device(
+                    id=device_id,
+                    customer_id=values['customer_id'],
+                    device_type='mobile',
+                    device_fingerprint=f"fp_{device_id}",
+                    is_trusted=False
+                )
+        Device.objects.bulk_create(missing.values(), ignore_conflicts=True)
+
+    transactions = []
+    for row_number, values in rows:
+        if card_owners.get(values['card_id']) != values['customer_id']:
+            report.add_invalid(row_number, values['id'], f"card {values['card_id']} belongs to another customer")
+            continue
+        transactions.append(Transaction(**values))
+
+    inserted = _insert_new(transactions)
+    report.skipped += len(transactions) - len(inserted)
+    report.accepted += len(inserted)
+    report.changed_customers.update(txn.customer_id for txn in inserted)
+    if known_ids is not None:
+        known_ids.add(txn.id for txn in transactions)
+
+
+def commit_batch(batch: List[Tuple[int, Any]], report: IngestReport,
+                 normalize: Callable[[Any], Dict[str, Any]] = normalize_row):
+    """
+    Store one batch in its own transaction (a savepoint when called inside
+    ``transaction.atomic()``) and add its outcome and timing to ``report``.
+
+    If the database rejects the batch (a constraint or a value it cannot
+    store), the batch is rolled back and retried a row at a time, each row
+    under its own savepoint, so only the offending rows are reported invalid.
+    Other database errors propagate with the batch rolled back.
+    """
+    started = time.monotonic()
+    retried = False
+    outcome = IngestReport(max_errors=report.max_errors)
+    try:
+        with transaction.atomic():
+            ingest_batch(batch, outcome, normalize)
+    except (IntegrityError, DataError) as e:
+        logger.warning(f"Rows {batch[0][0]}-{batch[-1][0]} rejected, retrying row by row: {str(e)}")
+        retried = True
+        outcome = IngestReport(max_errors=report.max_errors)
+        for row_number, raw in batch:
+            row_outcome = IngestReport(max_errors=report.max_errors)
+            try:
+                with transaction.atomic():
+                    ingest_batch([(row_number, raw)], row_outcome, normalize)
+            except (IntegrityError, DataError) as e:
+                outcome.add_invalid(
+                    row_number, raw.get('id') if isinstance(raw, dict) else None, f"rejected by database: {e}"
+                )
+            else:
+                outcome.merge(row_outcome)
+
+    report.merge(outcome)
+    report.add_batch(time.monotonic() - started, retried)
+    if report.batches['lastSeconds'] > settings.INGEST_ID_FILTER_COMMIT_MARGIN:
+        # Other processes' id filters may not catch up with this batch; its
+        # ids then cost them a rejected insert once
+        logger.warning(
+            f"Rows {batch[0][0]}-{batch[-1][0]} took {report.batches['lastSeconds']:.1f}s, longer than "
+            f"INGEST_ID_FILTER_COMMIT_MARGIN; raise it above the longest batch"
+        )
+    logger.debug(
+        f"Ingested rows {batch[0][0]}-{batch[-1][0]} in {report.batches['lastSeconds']:.3f}s"
+        f"{' (retried row by row)' if retried else ''}"
+    )
+
+
+def ingest_rows(rows: Iterable[Any], report: Optional[IngestReport] = None,
+                batch_size: Optional[int] = None,
+                normalize: Callable[[Any], Dict[str, Any]] = normalize_row) -> IngestReport:
+    """
+    Ingest uploaded transaction rows in batches of ``INGEST_BATCH_SIZE``.
+    ``rows`` may be a lazy iterator; only one batch is held at a time.
+
+    Each batch commits as soon as it is written, so when reading ``rows``
+    fails part-way, the batches before it stay stored and ``report`` (if
+    passed in) says how far the ingest got.
+    """
+    report = report or IngestReport(max_errors=settings.INGEST_MAX_ERRORS)
+    for batch in iter_batches(rows, batch_size or settings.INGEST_BATCH_SIZE):
+        commit_batch(batch, report, normalize)
+        report.rows = batch[-1][0]
+    return report
@@ -0,0 +1,283 @@
+"""
+Background Ingest Jobs
+
+``?async=1`` uploads are spooled to local disk and ingested by a daemon
+thread, one committed batch at a time, instead of inside the request.
+"""
+
+import atexit
+import csv
+import itertools
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Any, Optional
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, transaction, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+import pyarrow as pa
+
+from apps.agents.result_cache import bump_data_version
+from .columnar import converted_row, iter_arrow_rows, iter_parquet_rows
+from .ingest import IngestReport, commit_batch, iter_batches, iter_csv_rows, iter_ndjson_rows, normalize_row
+from .models import IngestJob
+
+logger = logging.getLogger(__name__)
+
+HOST = socket.gethostname()
+
+# A spool file that cannot be read this way never will be: its job fails and
+# the spool is removed. Any other error leaves the job to be retried.
+INPUT_ERRORS = (
+    UnicodeDecodeError, csv.Error, pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError,
+    FileNotFoundError
+)
+
+
+def create_job(request_id: str, format: str, source) -> IngestJob:
+    """
+    Spool an upload and queue it. For 'csv', 'ndjson', 'parquet' and 'arrow',
+    ``source`` is a binary file object copied as-is; for 'json' it is the
+    parsed list of rows, written out as NDJSON.
+    """
+    job = IngestJob(format='ndjson' if format == 'json' else format, host=HOST, request_id=request_id)
+    os.makedirs(settings.INGEST_SPOOL_DIR, exist_ok=True)
+    job.spool_path = os.path.join(settings.INGEST_SPOOL_DIR, f"{job.id}.{job.format}")
+
+    # Written under a temporary name so a crash never leaves a truncated spool
+    partial_path = job.spool_path + '.part'
+    with open(partial_path, 'wb') as out:
+        if format == 'json':
+            for row in source:
+                out.write(json.dumps(row, default=str).encode('utf-8') + b'\n')
+        else:
+            shutil.copyfileobj(source, out, 1024 * 1024)
+    os.replace(partial_path, job.spool_path)
+
+    job.save()
+    get_ingest_worker().wake()
+    return job
+
+
+def claim_job() -> Optional[IngestJob]:
+    """
+    Take the oldest pending job spooled on this host, or a running one whose
+    worker stopped sending heartbeats. The conditional update makes the claim
+    atomic across processes.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.INGEST_JOB_STALE_AFTER)
+    candidates = IngestJob.objects.filter(host=HOST).filter(
+        Q(status='PENDING', retry_at__isnull=True) | Q(status='PENDING', retry_at__lte=now)
+        | Q(status='RUNNING', heartbeat_at__lt=stale)
+    ).order_by('created_at').values_list('id', 'status', 'heartbeat_at')[:10]
+
+    for job_id, status, heartbeat_at in candidates:
+        claimed = IngestJob.objects.filter(
+            id=job_id, status=status, heartbeat_at=heartbeat_at
+        ).update(status='RUNNING', heartbeat_at=now)
+        if claimed:
+            return IngestJob.objects.get(id=job_id)
+    return None
+
+
+def _open_rows(job: IngestJob, f):
+    """Rows of a spool file, with the ``normalize`` step they need."""
+    if job.format == 'csv':
+        return iter_csv_rows(f), normalize_row
+    if job.format == 'ndjson':
+        return iter_ndjson_rows(f), normalize_row
+    if job.format == 'parquet':
+        return iter_parquet_rows(f), converted_row
+    return iter_arrow_rows(f), converted_row
+
+
+def _finish(job: IngestJob, status: str, error: str = ''):
+    """Record the job's outcome and remove its spool file."""
+    job.status = status
+    job.error = error
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'attempts', 'finished_at'])
+    try:
+        os.remove(job.spool_path)
+    except FileNotFoundError:
+        pass
+
+
+def run_job(job: IngestJob, stop: Optional[threading.Event] = None):
+    """
+    Ingest a claimed job from its last committed row. Each batch (under its
+    own savepoint) commits together with the job's progress, so ``rows_done``
+    never runs ahead of (or behind) what is stored. Returns early, leaving the job PENDING, when
+    ``stop`` is set.
+
+    Malformed input fails the job. Other errors (a lost connection, a lock
+    timeout, disk or cache trouble) roll back the batch in progress and put
+    the job back to PENDING with its spool, to resume after a backoff that
+    doubles with each attempt. After INGEST_JOB_MAX_ATTEMPTS runs in a row
+    without a committed batch the error is taken to be permanent and the job
+    fails.
+    """
+    report = IngestReport(max_errors=settings.INGEST_MAX_ERRORS)
+    report.accepted = job.accepted
+    report.skipped = job.skipped
+    report.invalid = job.invalid
+    report.errors = list(job.errors)
+    report.batches.update(job.batches)
+
+    if job.started_at is None:
+        job.started_at = timezone.now()
+        job.save(update_fields=['started_at'])
+    if job.rows_done:
+        logger.info(f"Resuming ingest job {job.id} after row {job.rows_done}")
+
+    try:
+        with open(job.spool_path, 'rb') as f:
+            rows, normalize = _open_rows(job, f)
+            rows = itertools.islice(rows, job.rows_done, None)
+            tick = time.monotonic()
+            for batch in iter_batches(rows, settings.INGEST_BATCH_SIZE, start=job.rows_done + 1):
+                with transaction.atomic():
+                    commit_batch(batch, report, normalize)
+                    job.rows_done = batch[-1][0]
+                    job.accepted = report.accepted
+                    job.skipped = report.skipped
+                    job.invalid = report.invalid
+                    job.errors = report.errors
+                    job.batches = report.batches
+                    job.elapsed_seconds += time.monotonic() - tick
+                    job.heartbeat_at = timezone.now()
+                    job.attempts = 0
+                    job.save(update_fields=[
+                        'rows_done', 'accepted', 'skipped', 'invalid', 'errors', 'batches',
+                        'elapsed_seconds', 'heartbeat_at', 'attempts'
+                    ])
+                tick = time.monotonic()
+
+                # Cached triage results for these customers no longer reflect their data
+                bump_data_version(report.changed_customers)
+                report.changed_customers.clear()
+
+                if stop is not None and stop.is_set():
+                    job.status = 'PENDING'
+                    job.save(update_fields=['status'])
+                    return
+    except INPUT_ERRORS as e:
+        logger.error(f"Ingest job {job.id} failed after row {job.rows_done}: {str(e)}")
+        _finish(job, 'FAILED', str(e))
+        return
+    except Exception as e:
+        job.attempts += 1
+        if job.attempts >= settings.INGEST_JOB_MAX_ATTEMPTS:
+            logger.error(
+                f"Ingest job {job.id} failed after row {job.rows_done}, {job.attempts} attempts: {str(e)}"
+            )
+            _finish(job, 'FAILED', str(e))
+            return
+        # The batch rolled back, so retry the job from its last committed row
+        backoff = settings.INGEST_JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+        logger.warning(
+            f"Ingest job {job.id} interrupted after row {job.rows_done}, retrying in {backoff}s: {str(e)}"
+        )
+        job.status = 'PENDING'
+        job.error = f"Interrupted, will retry: {str(e)}"
+        job.retry_at = timezone.now() + timedelta(seconds=backoff)
+        try:
+            IngestJob.objects.filter(id=job.id, status='RUNNING').update(
+                status=job.status, error=job.error, attempts=job.attempts, retry_at=job.retry_at
+            )
+        except (OperationalError, InterfaceError):
+            # Still RUNNING: taken over once its heartbeat is stale
+            pass
+        return
+
+    _finish(job, 'COMPLETED')
+    logger.info(
+        f"Ingest job {job.id}: accepted {job.accepted}, skipped {job.skipped}, invalid {job.invalid}"
+    )
+
+
+def job_to_dict(job: IngestJob) -> Dict[str, Any]:
+    """Status payload for GET /api/ingest/jobs/<id>."""
+    return {
+        'jobId': job.id,
+        'status': job.status,
+        'rowsDone': job.rows_done,
+        'accepted': job.accepted,
+        'skipped': job.skipped,
+        'invalid': job.invalid,
+        'errors': job.errors,
+        'errorsTruncated': job.invalid > len(job.errors),
+        'rowsPerSecond': round(job.rows_done / job.elapsed_seconds, 1) if job.elapsed_seconds else None,
+        'batches': job.batches,
+        'error': job.error or None,
+        'attempts': job.attempts,
+        'requestId': job.request_id,
+        'createdAt': job.created_at.isoformat() if job.created_at else None,
+        'startedAt': job.started_at.isoformat() if job.started_at else None,
+        'finishedAt': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class IngestWorker:
+    """
+    Daemon thread that runs the ingest jobs spooled on this host, one at a
+    time. It polls every INGEST_JOB_POLL_INTERVAL seconds (or when woken by a
+    new job), which is also how jobs interrupted by a restart or a crashed
+    worker are picked up again.
+    """
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ingest-jobs', daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            job = None
+            close_old_connections()
+            try:
+                job = claim_job()
+                if job is not None:
+                    run_job(job, stop=self._stopped)
+            except Exception as e:
+                logger.error(f"Error in ingest worker: {str(e)}")
+            finally:
+                close_old_connections()
+            # Nothing to do, or the job was put back after an error: wait
+            # before claiming again rather than retrying straight away
+            if job is None or job.status == 'PENDING':
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def stop(self):
+        """Stop after the batch in progress; its job is left PENDING to resume."""
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout=30)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_ingest_worker() -> IngestWorker:
+    """Return the process-wide ingest worker, starting it on first use."""
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = IngestWorker(poll_interval=settings.INGEST_JOB_POLL_INTERVAL)
+                atexit.register(_worker.stop)
+    return _worker
@@ -0,0 +1,60 @@
+"""
+Bulk-load transactions from a file: a JSON array (fixtures, or the output of
+scripts/generate_transactions.py), or CSV / NDJSON / Parquet / Arrow IPC
+stream, which are streamed so memory does not grow with the file.
+"""
+
+import csv
+import json
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.agents.result_cache import bump_data_version
+from apps.transactions.columnar import converted_row, iter_arrow_rows, iter_parquet_rows
+from apps.transactions.ingest import IngestReport, ingest_rows, iter_csv_rows, iter_ndjson_rows, normalize_row
+
+
+class Command(BaseCommand):
+    help = "Ingest transactions from a .json (array), .csv, .ndjson, .parquet or .arrows file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Transactions file (.json, .csv, .ndjson, .parquet or .arrows)")
+        parser.add_argument('--batch-size', type=int, default=None, help="Rows per batch (INGEST_BATCH_SIZE)")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        report = IngestReport(max_errors=settings.INGEST_MAX_ERRORS)
+        try:
+            with open(path, 'rb') as f:
+                started = time.monotonic()
+                normalize = normalize_row
+                if path.endswith('.csv'):
+                    rows = iter_csv_rows(f)
+                elif path.endswith('.ndjson'):
+                    rows = iter_ndjson_rows(f)
+                elif path.endswith('.parquet'):
+                    rows, normalize = iter_parquet_rows(f, options['batch_size']), converted_row
+                elif path.endswith('.arrows') or path.endswith('.arrow'):
+                    rows, normalize = iter_arrow_rows(f, options['batch_size']), converted_row
+                else:
+                    rows = json.load(f)
+                    if not isinstance(rows, list):
+                        raise CommandError("Expected a JSON array of transactions")
+                # Each batch commits on its own
+                ingest_rows(rows, report, batch_size=options['batch_size'], normalize=normalize)
+        except (OSError, ValueError, csv.Error) as e:
+            bump_data_version(report.changed_customers)
+            raise CommandError(f"Cannot read {path} after row {report.rows}: {e}")
+        bump_data_version(report.changed_customers)
+
+        for error in report.errors:
+            self.stderr.write(f"row {error['row']} ({error['id']}): {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Accepted {report.accepted}, skipped {report.skipped}, invalid {report.invalid} "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
+        self.stdout.write(
+            f"{report.batches['count']} batches, slowest {report.batches['maxSeconds']:.2f}s, "
+            f"{report.batches['retried']} retried row by row"
+        )
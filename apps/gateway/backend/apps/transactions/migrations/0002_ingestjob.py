@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:40
+
+import apps.transactions.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestJob',
+            fields=[
+                ('id', models.CharField(default=apps.transactions.models.generate_ingest_job_id, max_length=50, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('ndjson', 'NDJSON')], max_length=10)),
+                ('spool_path', models.CharField(max_length=500)),
+                ('host', models.CharField(max_length=255)),
+                ('request_id', models.CharField(max_length=100)),
+                ('rows_done', models.BigIntegerField(default=0)),
+                ('accepted', models.BigIntegerField(default=0)),
+                ('skipped', models.BigIntegerField(default=0)),
+                ('invalid', models.BigIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('elapsed_seconds', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'ingest_jobs',
+                'indexes': [models.Index(fields=['status', 'host'], name='ingest_jobs_status_ea2cf8_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0002_ingestjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjob',
+            name='batches',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0003_ingestjob_batches'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingestjob',
+            name='format',
+            field=models.CharField(choices=[('csv', 'CSV'), ('ndjson', 'NDJSON'), ('parquet', 'Parquet'), ('arrow', 'Arrow IPC stream')], max_length=10),
+        ),
+    ]
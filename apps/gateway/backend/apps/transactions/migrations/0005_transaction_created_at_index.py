@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0004_ingestjob_columnar_formats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['created_at'], name='transaction_created_5c02ac_idx'),
+        ),
+    ]
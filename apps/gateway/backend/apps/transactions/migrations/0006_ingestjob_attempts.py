@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0005_transaction_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingestjob',
+            name='retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -10,6 +10,10 @@ def generate_chargeback_id():
     return f"cb_{uuid.uuid4().hex[:8]}"
 
 
+def generate_ingest_job_id():
+    return f"job_{uuid.uuid4().hex[:12]}"
+
+
 class Transaction(models.Model):
     CURRENCY_CHOICES = [
         ('INR', 'Indian Rupee'),
@@ -41,6 +45,7 @@ class Transaction(models.Model):
             models.Index(fields=['timestamp']),
             models.Index(fields=['device']),
             models.Index(fields=['geo_country']),
+            models.Index(fields=['created_at']),  # id filter catch-up
         ]
         ordering = ['-timestamp']
     
@@ -76,4 +81,54 @@ class Chargeback(models.Model):
         ]
     
     def __str__(self):
-        return f"Chargeback {self.id} - {self.reason_code} - {self.status}"
\ No newline at end of file
+        return f"Chargeback {self.id} - {self.reason_code} - {self.status}"
+
+class IngestJob(models.Model):
+    """
+    A transaction upload spooled to local disk and ingested in the background,
+    one committed batch at a time. ``rows_done`` is the number of spooled rows
+    whose batch has committed, so an interrupted job resumes after it.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+        ('parquet', 'Parquet'),
+        ('arrow', 'Arrow IPC stream'),
+    ]
+    
+    id = models.CharField(max_length=50, primary_key=True, default=generate_ingest_job_id)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    spool_path = models.CharField(max_length=500)
+    host = models.CharField(max_length=255)  # only this host can read the spool file
+    request_id = models.CharField(max_length=100)
+    rows_done = models.BigIntegerField(default=0)
+    accepted = models.BigIntegerField(default=0)
+    skipped = models.BigIntegerField(default=0)
+    invalid = models.BigIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    elapsed_seconds = models.FloatField(default=0)  # processing time, summed over resumes
+    batches = models.JSONField(default=dict, blank=True)  # batch count and timings, see IngestReport
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)  # consecutive runs interrupted without progress
+    retry_at = models.DateTimeField(null=True, blank=True)  # not claimed again before this
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'ingest_jobs'
+        indexes = [
+            models.Index(fields=['status', 'host']),
+        ]
+    
+    def __str__(self):
+        return f"Ingest job {self.id} - {self.status} ({self.rows_done} rows)"
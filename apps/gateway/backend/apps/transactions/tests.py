@@ -1,3 +1,474 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-# Create your tests here.
+from apps.customers.models import Customer, Card, Device
+from . import id_filter
+from .columnar import converted_row, export_queryset, iter_export_batches, iter_parquet_rows, stream_export
+from .id_filter import BloomFilter, KnownTransactionIds
+from .ingest import IngestReport, ingest_rows
+from .jobs import HOST, claim_job, run_job
+from .models import IngestJob, Transaction
+
+
+def memory_id_filter():
+    """An unsaved id filter that only changes through ingest, so query counts do not depend on refreshes."""
+    known_ids = KnownTransactionIds(capacity=100_000, error_rate=0.01, refresh_interval=3600)
+    known_ids.load()
+    return known_ids
+
+
+def setUpModule():
+    mock.patch.object(id_filter, '_known_ids', memory_id_filter()).start()
+
+
+def tearDownModule():
+    mock.patch.stopall()
+
+
+def make_row(n, **overrides):
+    row = {
+        'id': f'txn_{n:05d}',
+        'customerId': f'cust_{n % 3}',
+        'cardId': f'card_{n % 3}',
+        'deviceId': f'dev_{n % 3}',
+        'mcc': '5411',
+        'merchant': 'ABC Mart',
+        'amount': -4999,
+        'currency': 'INR',
+        'ts': '2025-06-12T14:30:00Z',
+        'geo': {'lat': 28.61, 'lon': 77.21, 'country': 'IN'},
+    }
+    row.update(overrides)
+    return row
+
+
+class BulkIngestTests(TestCase):
+    def test_creates_missing_entities_and_reports_each_outcome(self):
+        rows = [make_row(n) for n in range(10)]
+        rows.append(make_row(3))  # repeated in the upload
+        rows.append(make_row(10, amount='12.5'))
+        rows.append(make_row(11, ts='yesterday'))
+        rows.append(make_row(12, cardId='card_1', customerId='cust_0'))
+
+        with transaction.atomic():
+            report = ingest_rows(rows, batch_size=4)
+
+        self.assertEqual((report.accepted, report.skipped, report.invalid), (10, 1, 3))
+        self.assertEqual([error['row'] for error in report.errors], [12, 13, 14])
+        self.assertEqual(Transaction.objects.count(), 10)
+        self.assertEqual(Customer.objects.count(), 3)
+        self.assertEqual(Card.objects.get(id='card_1').customer_id, 'cust_1')
+        self.assertEqual(Device.objects.count(), 3)
+        self.assertEqual(report.changed_customers, {'cust_0', 'cust_1', 'cust_2'})
+
+    def test_fractional_amounts_are_rejected_not_truncated(self):
+        report = ingest_rows([make_row(1, amount='12.5'), make_row(2, amount=12.0), make_row(3, amount='1e3')])
+
+        self.assertEqual((report.accepted, report.invalid), (2, 1))
+        self.assertIn('whole number', report.errors[0]['error'])
+        self.assertEqual(sorted(Transaction.objects.values_list('amount', flat=True)), [12, 1000])
+
+    def test_card_of_another_customer_makes_the_row_invalid(self):
+        ingest_rows([make_row(1)])
+
+        report = ingest_rows([make_row(2, cardId='card_1', customerId='cust_2')])
+
+        self.assertEqual((report.accepted, report.invalid), (0, 1))
+        self.assertEqual(report.errors[0]['error'], 'card card_1 belongs to another customer')
+        self.assertFalse(Transaction.objects.filter(id='txn_00002').exists())
+
+    def test_stored_id_is_skipped_whichever_customer_it_names(self):
+        ingest_rows([make_row(1)])
+
+        report = ingest_rows([make_row(1, customerId='cust_2', cardId='card_2')])
+
+        self.assertEqual((report.accepted, report.skipped, report.invalid), (0, 1, 0))
+        self.assertEqual(Transaction.objects.get(id='txn_00001').customer_id, 'cust_1')
+
+    def test_reingest_skips_stored_rows_with_constant_queries(self):
+        rows = [make_row(n) for n in range(200)]
+        with transaction.atomic():
+            ingest_rows(rows)
+
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            report = ingest_rows(rows)
+
+        self.assertEqual((report.accepted, report.skipped, report.invalid), (0, 200, 0))
+        # Besides the batch's savepoint
+        data_queries = [q for q in queries if 'SAVEPOINT' not in q['sql']]
+        self.assertLessEqual(len(data_queries), 3)
+
+    def test_rejected_batch_is_retried_row_by_row(self):
+        bulk_create = Transaction.objects.bulk_create
+
+        def reject_txn_5(objs, **kwargs):
+            if any(obj.id == 'txn_00005' for obj in objs):
+                raise IntegrityError('CHECK constraint failed: amount')
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(Transaction.objects, 'bulk_create', side_effect=reject_txn_5):
+            report = ingest_rows([make_row(n) for n in range(10)], batch_size=4)
+
+        self.assertEqual((report.accepted, report.skipped, report.invalid), (9, 0, 1))
+        self.assertEqual(report.errors[0]['row'], 6)
+        self.assertIn('rejected by database', report.errors[0]['error'])
+        self.assertEqual((report.batches['count'], report.batches['retried']), (3, 1))
+        self.assertFalse(Transaction.objects.filter(id='txn_00005').exists())
+        self.assertEqual(Transaction.objects.count(), 9)
+
+    def test_batches_read_before_a_failure_stay_committed(self):
+        def rows():
+            yield from (make_row(n) for n in range(5))
+            raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+
+        report = IngestReport()
+        with self.assertRaises(UnicodeDecodeError):
+            ingest_rows(rows(), report, batch_size=4)
+
+        self.assertEqual((report.rows, report.accepted), (4, 4))
+        self.assertEqual(Transaction.objects.count(), 4)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class StreamingIngestViewTests(TestCase):
+    def post(self, body, content_type):
+        return self.client.post(
+            '/api/ingest/transactions', data=body, content_type=content_type,
+            HTTP_X_API_KEY=settings.API_KEY
+        )
+
+    def test_ndjson_body_is_ingested_line_by_line(self):
+        lines = [json.dumps(make_row(n)) for n in range(5)]
+        lines.insert(2, '{"id": "txn_broken",')
+        lines.insert(3, '')
+        response = self.post('\n'.join(lines) + '\n', 'application/x-ndjson')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['accepted'], response.data['invalid']), (5, 1))
+        self.assertEqual(response.data['errors'][0]['row'], 3)
+
+    def test_csv_upload_is_streamed_in_batches(self):
+        header = 'id,customerId,cardId,deviceId,mcc,merchant,amount,currency,ts,geo_lat,geo_lon,geo_country\n'
+        body = '\ufeff' + header + ''.join(
+            f'txn_{n:05d},cust_1,card_1,,5411,ABC Mart,-{n + 100},INR,2025-06-12T14:30:00Z,28.61,77.21,IN\n'
+            for n in range(25)
+        )
+        upload = SimpleUploadedFile('txns.csv', body.encode('utf-8'), content_type='text/csv')
+
+        with override_settings(INGEST_BATCH_SIZE=10):
+            response = self.client.post(
+                '/api/ingest/transactions', data={'file': upload}, HTTP_X_API_KEY=settings.API_KEY
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['accepted'], response.data['invalid']), (25, 0))
+        self.assertEqual(Transaction.objects.get(id='txn_00024').amount, -124)
+
+
+class IngestJobTests(TestCase):
+    def setUp(self):
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.spool_path = os.path.join(spool_dir.name, 'job.ndjson')
+        self.rows = [make_row(n) for n in range(25)]
+        with open(self.spool_path, 'w') as f:
+            f.writelines(json.dumps(row) + '\n' for row in self.rows)
+
+    def test_interrupted_job_resumes_after_last_committed_batch(self):
+        # A previous worker committed the first 10 rows, then died
+        with transaction.atomic():
+            ingest_rows(self.rows[:10])
+        IngestJob.objects.create(
+            id='job_resume', format='ndjson', spool_path=self.spool_path, host=HOST, request_id='r',
+            status='RUNNING', rows_done=10, accepted=10,
+            heartbeat_at=timezone.now() - timedelta(seconds=settings.INGEST_JOB_STALE_AFTER + 1)
+        )
+
+        job = claim_job()
+        self.assertEqual(job.id, 'job_resume')
+        with self.settings(INGEST_BATCH_SIZE=4):
+            run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'COMPLETED')
+        self.assertEqual((job.rows_done, job.accepted, job.skipped), (25, 25, 0))
+        self.assertEqual(Transaction.objects.count(), 25)
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_transient_error_requeues_job_and_keeps_its_spool(self):
+        job = IngestJob.objects.create(
+            id='job_flaky', format='ndjson', spool_path=self.spool_path, host=HOST, request_id='r', status='RUNNING'
+        )
+        with self.settings(INGEST_BATCH_SIZE=10), \
+                mock.patch('apps.transactions.jobs.bump_data_version', side_effect=[None, OSError('disk full')]):
+            run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_done, job.attempts), ('PENDING', 20, 1))
+        self.assertIn('disk full', job.error)
+        self.assertTrue(os.path.exists(self.spool_path))
+
+        # Backing off until retry_at
+        self.assertGreater(job.retry_at, timezone.now() + timedelta(seconds=settings.INGEST_JOB_RETRY_BACKOFF - 5))
+        self.assertIsNone(claim_job())
+        IngestJob.objects.filter(id=job.id).update(retry_at=timezone.now())
+
+        run_job(claim_job())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error, job.accepted), ('COMPLETED', '', 25))
+
+    @override_settings(INGEST_JOB_MAX_ATTEMPTS=2)
+    def test_job_failing_without_progress_fails_after_max_attempts(self):
+        job = IngestJob.objects.create(
+            id='job_bug', format='ndjson', spool_path=self.spool_path, host=HOST, request_id='r', status='RUNNING'
+        )
+        with mock.patch('apps.transactions.jobs.commit_batch', side_effect=KeyError('amount')):
+            run_job(job)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), ('PENDING', 1))
+
+            IngestJob.objects.filter(id=job.id).update(retry_at=timezone.now())
+            run_job(claim_job())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.rows_done), ('FAILED', 2, 0))
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_unsupported_arrow_types_fail_job(self):
+        job = IngestJob.objects.create(
+            id='job_types', format='ndjson', spool_path=self.spool_path, host=HOST, request_id='r', status='RUNNING'
+        )
+        with mock.patch('apps.transactions.jobs.commit_batch', side_effect=pa.ArrowTypeError('bad column')):
+            run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), ('FAILED', 0, 'bad column'))
+
+    def test_malformed_spool_fails_job(self):
+        spool_path = self.spool_path.replace('.ndjson', '.csv')
+        with open(spool_path, 'wb') as f:
+            f.write(b'id,customerId\n\xff\xfe,not utf-8\n')
+        job = IngestJob.objects.create(
+            id='job_bad', format='csv', spool_path=spool_path, host=HOST, request_id='r', status='RUNNING'
+        )
+
+        run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        self.assertFalse(os.path.exists(spool_path))
+
+    def test_running_job_with_fresh_heartbeat_is_not_claimed(self):
+        IngestJob.objects.create(
+            id='job_busy', format='ndjson', spool_path=self.spool_path, host=HOST, request_id='r',
+            status='RUNNING', heartbeat_at=timezone.now()
+        )
+
+        self.assertIsNone(claim_job())
+
+    @mock.patch('apps.transactions.views.get_ingest_worker')
+    @mock.patch('apps.transactions.jobs.get_ingest_worker')
+    def test_async_upload_returns_job_and_reports_progress(self, get_worker, _):
+        with self.settings(INGEST_SPOOL_DIR=os.path.dirname(self.spool_path), ALLOWED_HOSTS=['testserver']):
+            response = self.client.post(
+                '/api/ingest/transactions?async=1', data={'transactions': self.rows},
+                content_type='application/json', HTTP_X_API_KEY=settings.API_KEY
+            )
+            self.assertEqual(response.status_code, 202)
+            get_worker.return_value.wake.assert_called_once()
+
+            run_job(claim_job())
+            response = self.client.get(response.data['statusUrl'], HTTP_X_API_KEY=settings.API_KEY)
+
+        self.assertEqual(response.data['status'], 'COMPLETED')
+        self.assertEqual((response.data['rowsDone'], response.data['accepted']), (25, 25))
+        self.assertIsNotNone(response.data['rowsPerSecond'])
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class ColumnarIngestTests(TestCase):
+    def parquet(self, table):
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer)
+        buffer.seek(0)
+        return buffer
+
+    def test_parquet_columns_are_validated_and_converted_in_batches(self):
+        table = pa.table({
+            'id': ['txn_a', 'txn_b', 'txn_c', 'txn_d', None],
+            'customerId': ['cust_1'] * 5,
+            'cardId': ['card_1'] * 5,
+            'mcc': pa.array([411, 5411, 5411, 5411, 5411], pa.int16()),
+            # Ledger amounts in rupees
+            'amount': pa.array([Decimal('49.99'), Decimal('1.005'), Decimal('-10'), Decimal('1'), Decimal('1')],
+                               pa.decimal128(12, 3)),
+            'currency': ['INR', 'INR', 'GBP', 'USD', 'INR'],
+            'ts': pa.array([datetime(2025, 6, 12, 14, 30)] * 5, pa.timestamp('ms')),
+            'geo': [{'lat': 28.6139, 'lon': 77.209, 'country': 'IN'}] * 4 + [None],
+        })
+
+        report = ingest_rows(iter_parquet_rows(self.parquet(table), 2), batch_size=2, normalize=converted_row)
+
+        self.assertEqual((report.accepted, report.invalid), (2, 3))
+        self.assertEqual([error['error'] for error in report.errors], [
+            "amount must be a whole number of minor units, got Decimal('100.500')",
+            "unsupported currency 'GBP'",
+            'missing id',
+        ])
+        stored = Transaction.objects.get(id='txn_a')
+        self.assertEqual((stored.amount, stored.mcc, stored.geo_lat), (4999, '0411', Decimal('28.613900')))
+        self.assertEqual(stored.timestamp, datetime(2025, 6, 12, 14, 30, tzinfo=dt_timezone.utc))
+
+    def test_export_reads_back_through_columnar_ingest(self):
+        ingest_rows([make_row(n) for n in range(9)])
+        exported = b''.join(stream_export(iter_export_batches(export_queryset('cust_1'), 2)))
+        Transaction.objects.all().delete()
+
+        report = ingest_rows(iter_parquet_rows(io.BytesIO(exported)), normalize=converted_row)
+
+        self.assertEqual((report.accepted, report.invalid), (3, 0))
+        stored = Transaction.objects.get(id='txn_00004')
+        self.assertEqual((stored.amount, stored.geo_lat, stored.device_id), (-4999, Decimal('28.610000'), 'dev_1'))
+
+    def test_parquet_upload_and_arrow_export_endpoints(self):
+        table = pa.Table.from_pylist([make_row(n) for n in range(6)])
+        upload = SimpleUploadedFile('txns.parquet', self.parquet(table).read())
+        response = self.client.post(
+            '/api/ingest/transactions', data={'file': upload}, HTTP_X_API_KEY=settings.API_KEY
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['accepted'], 6)
+
+        body = io.BytesIO()
+        with pa.ipc.new_stream(body, table.schema) as writer:
+            writer.write_table(pa.Table.from_pylist([make_row(n) for n in range(6, 9)], schema=table.schema))
+        response = self.client.post(
+            '/api/ingest/transactions', data=body.getvalue(), content_type='application/vnd.apache.arrow.stream',
+            HTTP_X_API_KEY=settings.API_KEY
+        )
+        self.assertEqual(response.data['accepted'], 3)
+
+        response = self.client.get(
+            '/api/ingest/transactions/export?customerId=cust_2&output=arrow', HTTP_X_API_KEY=settings.API_KEY
+        )
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.arrow.stream')
+        async def read(stream):
+            return b''.join([chunk async for chunk in stream])
+
+        exported = pa.ipc.open_stream(async_to_sync(read)(response.streaming_content)).read_all()
+        self.assertEqual(exported.column('id').to_pylist(), ['txn_00002', 'txn_00005', 'txn_00008'])
+
+    @override_settings(INGEST_BATCH_SIZE=2)
+    def test_export_is_streamed_a_batch_at_a_time(self):
+        ingest_rows([make_row(n) for n in range(9)])
+
+        async def export(**headers):
+            response = await AsyncClient().get(
+                '/api/ingest/transactions/export', {'customerId': 'cust_1'}, headers=headers
+            )
+            if not response.streaming:
+                return response, None
+            return response, [chunk async for chunk in response.streaming_content]
+
+        response, chunks = async_to_sync(export)(**{'X-API-Key': settings.API_KEY})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="transactions.parquet"')
+        self.assertEqual(len([chunk for chunk in chunks if chunk]), 3)  # two row groups, then the footer
+        exported = pq.read_table(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(exported.column('id').to_pylist(), ['txn_00001', 'txn_00004', 'txn_00007'])
+
+        response, _ = async_to_sync(export)()
+        self.assertEqual(response.status_code, 401)
+
+
+class KnownTransactionIdTests(TestCase):
+    def setUp(self):
+        self.enterContext(mock.patch.object(id_filter, '_known_ids', memory_id_filter()))
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(capacity=10_000, error_rate=0.01)
+        for n in range(10_000):
+            bloom.add(f'txn_{n}')
+
+        self.assertTrue(all(f'txn_{n}' in bloom for n in range(10_000)))
+        false_positives = sum(f'other_{n}' in bloom for n in range(10_000))
+        self.assertLess(false_positives, 200)
+
+    def test_new_ids_skip_the_existence_query(self):
+        ingest_rows([make_row(n) for n in range(100)])
+
+        rows = [make_row(n) for n in range(50, 150)]
+        with CaptureQueriesContext(connection) as queries:
+            report = ingest_rows(rows)
+
+        self.assertEqual((report.accepted, report.skipped), (50, 50))
+        lookups = [q['sql'] for q in queries if q['sql'].startswith('SELECT "transactions"."id"')]
+        self.assertEqual(len(lookups), 1)
+        self.assertNotIn("'txn_00149'", lookups[0])
+
+    def test_ids_the_filter_missed_are_skipped_not_accepted(self):
+        ingest_rows([make_row(n) for n in range(10)])
+
+        # A filter that lost track of the stored ids
+        with mock.patch.object(id_filter._known_ids, 'possible_members', return_value=set()):
+            report = ingest_rows([make_row(n) for n in range(5, 15)])
+
+        self.assertEqual((report.accepted, report.skipped, report.invalid), (5, 5, 0))
+        self.assertEqual(Transaction.objects.count(), 15)
+
+    def test_filter_checks_every_id_until_loaded_in_background(self):
+        ingest_rows([make_row(n) for n in range(10)])
+        known_ids = KnownTransactionIds(capacity=1000, error_rate=0.01)
+        self.assertEqual(known_ids.possible_members(['txn_00001', 'txn_99999']), {'txn_00001', 'txn_99999'})
+
+        # The test database is not visible from another thread: only check
+        # that start() loads there
+        with mock.patch.object(known_ids, 'load', side_effect=known_ids.loaded.set) as load:
+            known_ids.start()
+            self.assertTrue(known_ids.loaded.wait(5))
+        load.assert_called_once_with()
+
+        known_ids.load()
+        self.assertEqual(known_ids.possible_members(['txn_00001', 'txn_99999']), {'txn_00001'})
+
+    def test_catch_up_covers_rows_committed_within_the_margin(self):
+        ingest_rows([make_row(n) for n in range(10)])
+        known_ids = KnownTransactionIds(capacity=1000, error_rate=0.01, commit_margin=60)
+        known_ids.load()
+
+        # Stamped before the newest id the filter has seen, committed after it
+        ingest_rows([make_row(10)])
+        Transaction.objects.filter(id='txn_00010').update(created_at=known_ids.watermark - timedelta(seconds=30))
+        known_ids.refresh()
+
+        self.assertEqual(known_ids.possible_members(['txn_00010']), {'txn_00010'})
+
+    def test_saved_filter_catches_up_with_ids_stored_elsewhere(self):
+        ingest_rows([make_row(n) for n in range(10)])
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'ids.bloom')
+        known_ids = KnownTransactionIds(capacity=1000, error_rate=0.01, path=path)
+        known_ids.load()
+        known_ids.save()
+
+        # Stored by another process after the filter was saved
+        ingest_rows([make_row(n) for n in range(10, 15)])
+        reloaded = KnownTransactionIds(capacity=1000, error_rate=0.01, path=path)
+        with mock.patch.object(reloaded, 'rebuild') as rebuild:
+            reloaded.load()
+
+        rebuild.assert_not_called()
+        self.assertEqual(reloaded.possible_members([f'txn_{n:05d}' for n in range(15)]),
+                         {f'txn_{n:05d}' for n in range(15)})
@@ -3,5 +3,7 @@ from . import views
 
 urlpatterns = [
     path('transactions', views.ingest_transactions, name='ingest_transactions'),
+    path('transactions/export', views.export_transactions, name='export_transactions'),
+    path('jobs/<str:job_id>', views.get_ingest_job, name='get_ingest_job'),
     path('<str:customer_id>/transactions', views.get_customer_transactions, name='get_customer_transactions'),
 ]
@@ -2,20 +2,30 @@ from rest_framework.decorators import api_view, permission_classes, authenticati
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
-from django.db import transaction
 from django.core.cache import cache
-import json
+from django.conf import settings
+import csv
+import pyarrow as pa
+from asgiref.sync import sync_to_async
 import uuid
 import logging
 from datetime import datetime
 from .models import Transaction
-from apps.customers.models import Customer, Card, Device
+from .ingest import IngestReport, ingest_rows, iter_csv_rows, iter_ndjson_rows, normalize_row
+from .columnar import (
+    EXPORT_FORMATS, converted_row, export_queryset, iter_arrow_rows, iter_export_batches,
+    iter_parquet_rows, stream_export
+)
+from .jobs import create_job, get_ingest_worker, job_to_dict
+from .models import IngestJob
 from apps.observability.models import AuditLog
 from apps.core.authentication import APIKeyAuthentication
+from apps.core.decorators import async_api_view
+from apps.agents.result_cache import bump_data_version
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +35,8 @@ logger = logging.getLogger(__name__)
 @permission_classes([IsAuthenticated])
 def ingest_transactions(request):
     """
-    Ingest transactions from CSV/JSON data.
+    Ingest transactions from JSON, a CSV or Parquet upload, or an NDJSON or
+    Arrow IPC stream body.
     Supports idempotency via Idempotency-Key header.
     """
     request_id = str(uuid.uuid4())
@@ -45,6 +56,12 @@ def ingest_transactions(request):
         if request.content_type == 'application/json':
             data = request.data
             transactions_data = data.get('transactions', [])
+            if not isinstance(transactions_data, list):
+                return Response(
+                    {'error': 'transactions must be a list'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            upload_format, upload = 'json', transactions_data
         elif 'multipart/form-data' in request.content_type:
             # Handle CSV file upload
             if 'file' not in request.FILES:
@@ -54,129 +71,93 @@ def ingest_transactions(request):
                 )
             
             file = request.FILES['file']
-            if not file.name.endswith('.csv'):
+            if file.name.endswith('.csv'):
+                upload_format, upload = 'csv', file
+            elif file.name.endswith('.parquet'):
+                upload_format, upload = 'parquet', file
+            else:
                 return Response(
-                    {'error': 'Only CSV files are supported'}, 
+                    {'error': 'Only CSV and Parquet files are supported'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            
-            # Parse CSV file
-            import csv
-            import io
-            
-            # Read CSV content
-            csv_content = file.read().decode('utf-8')
-            csv_reader = csv.DictReader(io.StringIO(csv_content))
-            
-            transactions_data = []
-            for row in csv_reader:
-                # Convert CSV row to transaction data
-                transaction_data = {
-                    'id': row.get('id', f"txn_{uuid.uuid4().hex[:8]}"),
-                    'customerId': row.get('customerId'),
-                    'cardId': row.get('cardId'),
-                    'deviceId': row.get('deviceId'),
-                    'mcc': row.get('mcc', '5999'),
-                    'merchant': row.get('merchant', 'Unknown'),
-                    'amount': float(row.get('amount', 0)),
-                    'currency': row.get('currency', 'INR'),
-                    'timestamp': row.get('ts', datetime.now().isoformat()),
-                    'geo': {
-                        'lat': float(row.get('geo_lat', 0)),
-                        'lon': float(row.get('geo_lon', 0)),
-                        'country': row.get('geo_country', 'IN')
-                    }
-                }
-                transactions_data.append(transaction_data)
+        elif request.content_type.startswith('application/x-ndjson'):
+            # One transaction per line, read straight from the request body
+            upload_format, upload = 'ndjson', request._request
+        elif request.content_type.startswith('application/vnd.apache.arrow.stream'):
+            # Record batches read straight from the request body
+            upload_format, upload = 'arrow', request._request
         else:
             return Response(
                 {'error': 'Unsupported content type'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        if not transactions_data:
+        if request.query_params.get('async') in ('1', 'true'):
+            # Spool to disk and return at once; the ingest worker commits the
+            # upload batch by batch and can resume it after a restart
+            job = create_job(request_id, upload_format, upload)
+            result = {
+                **job_to_dict(job),
+                'statusUrl': f"/api/ingest/jobs/{job.id}"
+            }
+            if idempotency_key:
+                cache.set(cache_key, result, timeout=3600)
+            
+            AuditLog.objects.create(
+                event_type='ACTION_CREATED',
+                user_id=request.user.role if hasattr(request.user, 'role') else 'unknown',
+                request_id=request_id,
+                session_id=session_id,
+                details={
+                    'action': 'ingest_transactions',
+                    'job_id': job.id
+                }
+            )
+            
+            return Response(result, status=status.HTTP_202_ACCEPTED)
+        
+        # Rows are decoded as the DB writer consumes them; columnar uploads are
+        # validated and converted a record batch at a time
+        normalize = normalize_row
+        if upload_format == 'csv':
+            transactions_data = iter_csv_rows(upload)
+        elif upload_format == 'ndjson':
+            transactions_data = iter_ndjson_rows(upload)
+        elif upload_format == 'parquet':
+            transactions_data, normalize = iter_parquet_rows(upload), converted_row
+        elif upload_format == 'arrow':
+            transactions_data, normalize = iter_arrow_rows(upload), converted_row
+        
+        # Process transactions in set-based batches, each committed on its own
+        # so table locks are not held for the whole upload; streamed uploads
+        # are only held one batch at a time
+        report = IngestReport(max_errors=settings.INGEST_MAX_ERRORS)
+        try:
+            ingest_rows(transactions_data, report, normalize=normalize)
+        except (UnicodeDecodeError, csv.Error, pa.ArrowInvalid) as e:
+            # Batches before the malformed part are already stored
+            bump_data_version(report.changed_customers)
             return Response(
-                {'error': 'No transactions provided'}, 
+                {
+                    'error': f'Malformed upload: {str(e)}',
+                    'rowsDone': report.rows,
+                    **report.to_dict()
+                }, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Process transactions
-        processed_count = 0
-        skipped_count = 0
+        if not report.rows:
+            return Response(
+                {'error': 'No transactions provided'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        with transaction.atomic():
-            for txn_data in transactions_data:
-                try:
-                    # Check if transaction already exists
-                    existing_txn = Transaction.objects.filter(
-                        customer_id=txn_data['customerId'],
-                        id=txn_data['id']
-                    ).first()
-                    
-                    if existing_txn:
-                        skipped_count += 1
-                        continue
-                    
-                    # Get or create customer
-                    customer, _ = Customer.objects.get_or_create(
-                        id=txn_data['customerId'],
-                        defaults={
-                            'name': f"Customer {txn_data['customerId']}",
-                            'email_masked': f"c***@{txn_data['customerId'][:3]}***.com",
-                            'risk_flags': []
-                        }
-                    )
-                    
-                    # Get or create card
-                    card, _ = Card.objects.get_or_create(
-                        id=txn_data['cardId'],
-                        defaults={
-                            'customer': customer,
-                            'last4': txn_data.get('last4', '0000'),
-                            'status': 'ACTIVE',
-                            'network': 'VISA'
-                        }
-                    )
-                    
-                    # Get device if provided
-                    device = None
-                    if txn_data.get('deviceId'):
-                        device, _ = Device.objects.get_or_create(
-                            id=txn_data['deviceId'],
-                            defaults={
-                                'customer': customer,
-                                'device_type': 'mobile',
-                                'device_fingerprint': f"fp_{txn_data['deviceId']}",
-                                'is_trusted': False
-                            }
-                        )
-                    
-                    # Create transaction
-                    txn = Transaction.objects.create(
-                        id=txn_data['id'],
-                        customer=customer,
-                        card=card,
-                        mcc=txn_data['mcc'],
-                        merchant=txn_data['merchant'],
-                        amount=txn_data['amount'],
-                        currency=txn_data.get('currency', 'INR'),
-                        timestamp=datetime.fromisoformat(txn_data['timestamp'].replace('Z', '+00:00')),
-                        device=device,
-                        geo_lat=txn_data.get('geo', {}).get('lat'),
-                        geo_lon=txn_data.get('geo', {}).get('lon'),
-                        geo_country=txn_data.get('geo', {}).get('country', 'IN')
-                    )
-                    
-                    processed_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"Error processing transaction {txn_data.get('id', 'unknown')}: {str(e)}")
-                    continue
+        # Cached triage results for these customers no longer reflect their data
+        bump_data_version(report.changed_customers)
         
         result = {
-            'accepted': True,
-            'count': processed_count,
-            'skipped': skipped_count,
+            **report.to_dict(),
+            'count': report.accepted,
             'requestId': request_id
         }
         
@@ -192,12 +173,15 @@ def ingest_transactions(request):
             session_id=session_id,
             details={
                 'action': 'ingest_transactions',
-                'processed_count': processed_count,
-                'skipped_count': skipped_count
+                'processed_count': report.accepted,
+                'skipped_count': report.skipped,
+                'invalid_count': report.invalid
             }
         )
         
-        logger.info(f"Successfully ingested {processed_count} transactions, skipped {skipped_count}")
+        logger.info(
+            f"Ingested {report.accepted} transactions, skipped {report.skipped}, invalid {report.invalid}"
+        )
         
         return Response(result, status=status.HTTP_201_CREATED)
         
@@ -209,6 +193,28 @@ def ingest_transactions(request):
         )
 
 
+@api_view(['GET'])
+@authentication_classes([APIKeyAuthentication])
+@permission_classes([IsAuthenticated])
+def get_ingest_job(request, job_id):
+    """
+    Progress of an asynchronous ingest: rows done, accepted, skipped and
+    invalid so far, and throughput.
+    """
+    try:
+        job = IngestJob.objects.get(id=job_id)
+    except IngestJob.DoesNotExist:
+        return Response(
+            {'error': 'Ingest job not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    # Make sure this host's worker is up to resume interrupted jobs
+    get_ingest_worker()
+    
+    return Response(job_to_dict(job))
+
+
 @api_view(['GET'])
 @authentication_classes([APIKeyAuthentication])
 @permission_classes([IsAuthenticated])
@@ -291,4 +297,64 @@ def get_customer_transactions(request, customer_id):
         return Response(
             {'error': 'Internal server error'}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+
+@async_api_view(['GET'])
+async def export_transactions(request):
+    """
+    Export a customer's and/or a date range's transactions as Parquet or an
+    Arrow IPC stream (?output=arrow), in the schema the columnar ingest reads.
+    The file is written and sent a batch at a time. (``format`` is taken by
+    DRF's renderer override.)
+    
+    An async view, so the ASGI server streams the response as it is produced;
+    Django would buffer a sync iterator (under ASGI) or an async one (under
+    WSGI) whole.
+    """
+    try:
+        customer_id = request.GET.get('customerId')
+        from_date = request.GET.get('from')
+        to_date = request.GET.get('to')
+        export_format = request.GET.get('output', 'parquet')
+        
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"output must be one of: {', '.join(EXPORT_FORMATS)}"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not (customer_id or from_date or to_date):
+            return Response(
+                {'error': 'customerId or a from/to date range is required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            start = datetime.fromisoformat(from_date.replace('Z', '+00:00')) if from_date else None
+            end = datetime.fromisoformat(to_date.replace('Z', '+00:00')) if to_date else None
+        except ValueError:
+            return Response(
+                {'error': 'from and to must be ISO 8601 dates'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        chunks = stream_export(iter_export_batches(export_queryset(customer_id, start, end)), export_format)
+        
+        async def export_stream():
+            # The writer reads the database, so each chunk is produced off the event loop
+            while True:
+                chunk = await sync_to_async(next)(chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        
+        content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(export_stream(), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="transactions.{extension}"'
+        
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error in export_transactions: {str(e)}")
+        return Response(
+            {'error': 'Internal server error'}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
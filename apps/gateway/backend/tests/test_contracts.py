@@ -2,7 +2,8 @@ import json
 import os
 import pytest
 from jsonschema import validate
-from agentguard_contracts.decision import Decision, DecisionAction
+from agentguard_contracts.decision import Decision, DecisionAction, decision_dict, redaction_dict
+from agentguard_contracts.validation import ContractViolation, validate_decision
 
 def test_decision_contract_consistency():
     """
@@ -33,3 +34,33 @@ def test_decision_contract_consistency():
     # 3. Validate the Pydantic-exported dict against the JSON schema
     # If this fails, it means Pydantic and Zod have drifted.
     validate(instance=sample_decision.model_dump(), schema=schema)
+
+
+def test_fast_path_decision_matches_contract():
+    """
+    Decisions built as plain dicts must be what the Pydantic model would emit
+    (minus unset optionals) and must pass the JSON schema.
+    """
+    decision = decision_dict(
+        request_id="test-req-1",
+        tenant_id="demo",
+        action=DecisionAction.REDACT,
+        reasons=["PII detected in payload: email"],
+        redactions=[redaction_dict("email", "[REDACTED]", 0, 10, path="$.customer.email")],
+    )
+
+    validate_decision(decision)
+    assert decision == Decision.model_validate(decision).model_dump(exclude_none=True)
+
+
+def test_validate_decision_reports_drift():
+    decision = decision_dict(request_id="r", tenant_id="t", action=DecisionAction.ALLOW)
+
+    for drifted in (
+        {**decision, "action": "BLOCK"},
+        {**decision, "audit_id": None},
+        {**decision, "risk_score": 0.5},
+        {**decision, "redactions": [redaction_dict("email", "x", "0", 1)]},
+    ):
+        with pytest.raises(ContractViolation):
+            validate_decision(drifted)
@@ -0,0 +1,66 @@
+import pytest
+from apps.agents.planner import ExecutionPlan, PlanStep, TRIAGE_PLAN
+from apps.agents.traces import compact_inputs, resolve_inputs, encode_trace, decode_trace
+
+
+def test_triage_plan_runs_independent_steps_first():
+    ready = TRIAGE_PLAN.ready_steps(completed=[], scheduled=[])
+    assert ready == ["getProfile", "getRecentTransactions", "kbLookup"]
+
+    ready = TRIAGE_PLAN.ready_steps(
+        completed=["getProfile", "getRecentTransactions"],
+        scheduled=["getProfile", "getRecentTransactions", "kbLookup"],
+    )
+    assert ready == ["riskSignals"]
+
+
+def test_plan_rejects_cycles_and_unresolved_inputs():
+    with pytest.raises(ValueError):
+        ExecutionPlan([
+            PlanStep("a", inputs=["b_result"]),
+            PlanStep("b", inputs=["a_result"]),
+        ])
+
+    with pytest.raises(ValueError):
+        ExecutionPlan([PlanStep("a", inputs=["missing"])])
+
+
+def test_critical_path_follows_latest_dependency():
+    timings = {
+        "getProfile": {"ended_offset_ms": 40},
+        "getRecentTransactions": {"ended_offset_ms": 90},
+        "kbLookup": {"ended_offset_ms": 20},
+        "riskSignals": {"ended_offset_ms": 95},
+        "decide": {"ended_offset_ms": 97},
+        "proposeAction": {"ended_offset_ms": 110},
+    }
+    assert TRIAGE_PLAN.critical_path(timings) == [
+        "getRecentTransactions", "riskSignals", "decide", "proposeAction"
+    ]
+
+
+def test_tool_call_inputs_reference_producing_step():
+    context = {
+        "customer_id": "cust_1",
+        "user_message": "lost card",
+        "getProfile_result": {"profile": {"id": "cust_1"}},
+        "getRecentTransactions_result": {"recent_transactions": []},
+    }
+    stored = compact_inputs(TRIAGE_PLAN, "riskSignals", context)
+    assert stored["getProfile_result"] == {"$ref": "getProfile"}
+    assert stored["user_message"] == "lost card"
+
+    outputs = {
+        "getProfile": context["getProfile_result"],
+        "getRecentTransactions": context["getRecentTransactions_result"],
+    }
+    assert resolve_inputs(stored, outputs) == {
+        key: context[key] for key in TRIAGE_PLAN.steps["riskSignals"].inputs
+    }
+
+
+def test_compressed_trace_round_trip():
+    trace = {"steps": [{"tool": "decide", "result": {"action": "EXPLAIN_ONLY"}}]}
+    blob = encode_trace(trace, "zlib")
+    assert decode_trace(blob, "zlib") == trace
+    assert encode_trace(trace, None) is None
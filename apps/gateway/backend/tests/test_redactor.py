@@ -0,0 +1,146 @@
+import logging
+import re
+import sys
+import threading
+import pytest
+from apps.agents.redactor import (
+    DEFAULT_PATTERNS, PIIRedactor, PIISpan, PayloadBudgetExceeded, PIIRedactingFormatter, PrefilterStats,
+    has_digit_run, prefilter_stats
+)
+
+
+def test_scan_returns_typed_spans_in_one_pass():
+    redactor = PIIRedactor()
+    text = "card 4111111111111111 id 123456789012 call 9876543210 mail 9876543210@x.in"
+
+    assert redactor.scan(text) == [
+        PIISpan("pan", 5, 21),
+        PIISpan("aadhar", 25, 37),
+        PIISpan("phone", 43, 53),
+        PIISpan("email", 59, 74),
+    ]
+    assert redactor.get_pii_types(text) == ["pan", "email", "phone", "aadhar"]
+
+
+def test_redaction_reuses_scanned_spans():
+    redactor = PIIRedactor()
+    text = "reach me at a.b@example.com or 9876543210, ref 12345"
+    spans = redactor.scan(text)
+
+    assert redactor.redact_spans(text, spans) == redactor.redact_text(text)
+    assert redactor.redact_text(text) == "reach me at ***@***.*** or ***-***-****, ref 12345"
+    assert not redactor.is_pii_detected("ref 12345")
+
+
+def test_structured_redaction_copies_only_changed_branches():
+    redactor = PIIRedactor()
+    clean = {"notes": ["ok", 1, None]}
+    payload = {"customer": {"contact": ["hi", "9876543210"], "my key": "a@b.com"}, "meta": clean}
+
+    result = redactor.redact_structure(payload)
+
+    assert result.value["customer"] == {"contact": ["hi", "***-***-****"], "my key": "***@***.***"}
+    assert result.value["meta"] is clean
+    assert payload["customer"]["contact"][1] == "9876543210"
+    assert [(f.path, f.type) for f in result.findings] == [
+        ("$.customer.contact[1]", "phone"),
+        ('$.customer["my key"]', "email"),
+    ]
+
+
+def test_structured_redaction_enforces_depth_budget_without_recursion():
+    payload = node = {}
+    for _ in range(5000):
+        node["n"] = {}
+        node = node["n"]
+    node["s"] = "a@b.com"
+
+    assert PIIRedactor(max_depth=10000).redact_structure(payload).findings[0].type == "email"
+    with pytest.raises(PayloadBudgetExceeded):
+        PIIRedactor(max_depth=10).redact_structure(payload)
+    with pytest.raises(PayloadBudgetExceeded):
+        PIIRedactor(max_size=5).redact_structure({"s": "a@b.com"})
+
+
+def test_stream_redaction_catches_matches_split_across_reads():
+    redactor = PIIRedactor()
+    text = "card 1234567890123456789 mail foo.bar+baz@mail.example.co.in id abc1234567890 " * 20
+
+    for size in (1, 3, 7, 64):
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        assert "".join(redactor.redact_stream(chunks)) == redactor.redact_text(text)
+
+
+def test_logging_formatter_redacts_message_and_traceback():
+    formatter = PIIRedactingFormatter("%(levelname)s %(message)s", types=["email", "pan"])
+    try:
+        raise ValueError("card 4111111111111111 declined")
+    except ValueError:
+        record = logging.LogRecord("test", logging.ERROR, __file__, 1, "user %s at %s", ("a@b.com", 1760000000), sys.exc_info())
+
+    line = formatter.format(record)
+
+    assert line.startswith("ERROR user ***@***.*** at 1760000000\n")
+    assert "4111111111111111" not in line and "card ****REDACTED**** declined" in line
+    # Other handlers still see the original record
+    assert record.getMessage() == "user a@b.com at 1760000000"
+
+
+def test_prefilter_skips_patterns_that_cannot_match():
+    redactor = PIIRedactor()
+    before = prefilter_stats.snapshot()
+
+    assert redactor.redact_text("order 12345 is delayed") == "order 12345 is delayed"
+    assert redactor.scan("call 9876543210") == [PIISpan("phone", 5, 15)]
+
+    after = prefilter_stats.snapshot()
+    delta = {key: after.get(key, 0) - before.get(key, 0) for key in after}
+    assert delta[("email", "skip")] == 2
+    assert delta[("phone", "skip")] == 1
+    assert delta[("phone", "hit")] == 1
+
+
+def test_scan_cache_reuses_spans_for_repeated_text():
+    redactor = PIIRedactor(cache_size=2)
+    text = "Your statement is ready. Questions? Write to support@bank.example.com today."
+
+    first = redactor.scan(text)
+    assert redactor.scan(text) == first
+    assert redactor.redact_text(text).endswith("***@***.*** today.")
+    assert redactor.scan_cache.stats() == {"hits": 2, "misses": 1, "size": 1}
+
+
+def test_custom_patterns_extend_and_override_defaults():
+    redactor = PIIRedactor(
+        patterns={**DEFAULT_PATTERNS, "employee_id": r"\bEMP-\d{6}\b", "phone": r"\+91\d{10}\b"},
+        replacements={"employee_id": "EMP-******"},
+    )
+
+    assert redactor.redact_text("EMP-123456 at +919876543210") == "EMP-****** at ****REDACTED****"
+    # The overridden phone pattern has no prefilter gate, so it always runs
+    assert "phone" not in redactor.prefilters
+    assert redactor.version != PIIRedactor().version
+
+
+def test_invalid_patterns_are_rejected():
+    for patterns in ({"bad type": r"\d"}, {"pan": r"(\d"}, {"pan": r"(?P<x>\d)"}):
+        with pytest.raises(ValueError):
+            PIIRedactor(patterns=patterns)
+
+
+def test_digit_run_check_matches_the_regex():
+    for text in ("", "order 12345", "call 9876543210", "id123456789x0", "x" * 5000 + "1234567890",
+                 "१२३४५६७८९०", "café 123456789"):
+        assert has_digit_run(text) == (re.search(r"\d{10}", text) is not None)
+
+
+def test_prefilter_stats_sum_counts_from_every_thread():
+    stats = PrefilterStats()
+    threads = [threading.Thread(target=lambda: [stats.record(["email"], ["phone"]) for _ in range(1000)])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stats.snapshot() == {("email", "hit"): 4000, ("phone", "skip"): 4000}
@@ -8,7 +8,8 @@ export const Redaction = z.object({
     original: z.string().optional(),   // optional: avoid storing raw PII in prod
     replacement: z.string(),           // e.g., "[REDACTED_EMAIL]"
     start: z.number().int().nonnegative(),
-    end: z.number().int().nonnegative()
+    end: z.number().int().nonnegative(),
+    path: z.string().optional()        // JSON path of the string in a structured payload, e.g. "$.customer.email"
 });
 export type Redaction = z.infer<typeof Redaction>;
 